@@ -2,10 +2,26 @@ import os
 import json
 from typing import TypedDict, List, Dict, Any, Annotated
 import operator
-from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import SystemMessage, HumanMessage
+import math
+import time
+import asyncio
+import tempfile
+import threading
+import weakref
+import functools
+import contextvars
+import concurrent.futures
+from collections import namedtuple
+from langchain_core.callbacks import BaseCallbackHandler
 from dotenv import load_dotenv
+import llm_cache
+import llm_scheduler
+import json_stream
+import structured_output
+import deck
+import metrics
+import ppt_utils
+from metrics import log
 
 # Force load Env
 load_dotenv(override=True)
@@ -21,21 +37,179 @@ class AgentState(TypedDict):
     audience: str
     additional_instructions: str
     outline: List[str]      # List of Slide Headers
-    slides: List[Dict[str, Any]] # List of slide objects
-    final_output: str       # The final JSON string for the app
+    slides: List[deck.Slide] # Slides in outline order
+    slide_drafts: Annotated[List[Dict[str, Any]], operator.add] # Per-slide writer results ({"index", "slide": deck.Slide})
+    final_output: deck.Deck # The finished deck for the app
     retry_count: int        # Track refinement attempts
+    bypass_cache: bool      # Skip cached LLM responses (fresh variation)
+    scope: List[int]        # Edit runs only: slide indices the run may change (see revisions.py)
+    revisions: List[Dict[str, Any]] # Edit runs only: slides to (re)write ({"index", "heading", "instructions", "current"})
+    deck_file: str          # Filename of the last rendered version of the deck
+    llm_calls: Annotated[int, operator.add] # Model requests made by the run (response cache hits excluded)
+    sections: List[Dict[str, Any]] # Large decks only: planned sections ({"title", "num_slides", "start"})
+    section_outlines: Annotated[List[Dict[str, Any]], operator.add] # Large decks only: per-section titles ({"index", "outline"})
+
+def build_initial_state(data):
+    """Maps a deck request body (as sent to /generate_ppt) onto the initial AgentState."""
+    return {
+        "topic": data.get("topic"),
+        "include_images": data.get("include_images", False),
+        "image_mode": data.get("image_mode", "manual"),
+        "num_slides": int(data.get("num_slides", 5)),
+        "tone": data.get("tone", "Professional"),
+        "audience": data.get("audience", "General Audience"),
+        "additional_instructions": data.get("additional_instructions", ""),
+        "bypass_cache": bool(data.get("bypass_cache") or data.get("fresh")),
+        "outline": [],
+        "slides": []
+    }
 
 # --- 2. LLM Setup ---
-if not os.getenv("GEMINI_API_KEY"):
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
+# The client, response cache and compiled graph are built on first use (see get_llm / get_graph),
+# so importing this module is cheap and needs no API key. `agent_graph.llm` and `agent_graph.graph`
+# still work through the module __getattr__ below; assigning `agent_graph.llm` substitutes the model.
+
+_init_lock = threading.RLock()
+
+def get_llm():
+    """The shared chat model, created on first use. Raises ValueError if GEMINI_API_KEY is missing."""
+    model = globals().get("llm")
+    if model is not None:
+        return model
+
+    with _init_lock:
+        model = globals().get("llm")
+        if model is None:
+            if not os.getenv("GEMINI_API_KEY"):
+                raise ValueError("GEMINI_API_KEY not found in environment variables")
 
-llm = ChatGoogleGenerativeAI(
-    #model="gemini-2.0-flash", 
-    model="gemini-2.5-flash", 
-    google_api_key=os.getenv("GEMINI_API_KEY"),
-    temperature=0.7,
-    max_retries=3
-)
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            client = ChatGoogleGenerativeAI(
+                #model="gemini-2.0-flash", 
+                model="gemini-2.5-flash", 
+                google_api_key=os.getenv("GEMINI_API_KEY"),
+                temperature=0.7,
+                # The scheduler retries 429s with backoff and lowers concurrency; client retries would pile on
+                max_retries=0
+            )
+            # Rate limits, priority lanes, adaptive concurrency and hedging (see llm_scheduler.py)
+            model = llm_scheduler.ScheduledModel(client)
+            globals()["llm"] = model
+    return model
+
+# --- Writer Settings ---
+# "parallel": one writer call per outline entry (map-reduce via Send)
+# "batch": a single writer call for the whole deck
+# "stream": a single streamed writer call; slides are parsed and emitted as they complete
+WRITER_MODE = os.getenv("WRITER_MODE", "parallel")
+WRITER_MAX_CONCURRENCY = int(os.getenv("WRITER_MAX_CONCURRENCY", "8"))
+SLIDE_WRITER_ATTEMPTS = int(os.getenv("SLIDE_WRITER_ATTEMPTS", "2"))
+
+# Bounds the number of in-flight per-slide writer calls across all decks
+writer_semaphore = threading.BoundedSemaphore(WRITER_MAX_CONCURRENCY)
+# The same bound for the async graph; an asyncio semaphore belongs to one event loop
+_async_writer_semaphores = weakref.WeakKeyDictionary()
+
+def async_writer_semaphore():
+    """writer_semaphore for async nodes, one per event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_writer_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_writer_semaphores[loop] = asyncio.BoundedSemaphore(WRITER_MAX_CONCURRENCY)
+    return semaphore
+
+def stream_modes():
+    """
+    graph.stream modes for consumers that want slides as they are written.
+    "custom" is only requested when the streaming writer emits on it: subscribing to it ties up
+    one of LangGraph's executor threads, which costs the parallel fan-out a round of writer calls.
+    """
+    return ["updates", "custom"] if WRITER_MODE == "stream" else ["updates"]
+
+# --- Large Deck Settings ---
+# Decks with more slides are planned as sections and written in windows of slides, so no single prompt
+# or reply has to hold the whole outline or the whole deck (see plan_sections and chunk_writer_node)
+LARGE_DECK_SLIDES = int(os.getenv("LARGE_DECK_SLIDES", "40"))
+# Target slides per planned section
+SECTION_SLIDES = int(os.getenv("SECTION_SLIDES", "12"))
+# Slides per chunk_writer call, and per refiner call
+WRITER_CHUNK_SLIDES = int(os.getenv("WRITER_CHUNK_SLIDES", "6"))
+# Longest summary of earlier slides a chunk_writer call carries forward
+RUNNING_SUMMARY_CHARS = 1500
+
+# --- Structured Output Settings ---
+# Ask for JSON matching the reply schemas in structured_output.py (the model's JSON mode) instead of free text
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT_DISABLED", "").lower() not in ("1", "true", "yes")
+# Repair calls per invalid reply element (one slide, the outline) before the node falls back
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", "1"))
+
+# --- Checkpoint Settings ---
+# State of every deck generated through the app, keyed by deck id (the thread id), so single slides can be edited
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(tempfile.gettempdir(), "content_creator_checkpoints.sqlite"))
+
+# Prompt-level response cache (see llm_cache.py), opened on first use; None when LLM_CACHE_DISABLED is set
+_response_cache = None
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None and llm_cache.LLM_CACHE_ENABLED:
+        with _init_lock:
+            if _response_cache is None:
+                _response_cache = llm_cache.ResponseCache()
+    return _response_cache
+
+# --- Instrumentation ---
+
+class MetricsCallback(BaseCallbackHandler):
+    """
+    Records per-node wall time and model token usage from callback events.
+    LangGraph tags every run inside a node with `langgraph_node` metadata; the node's own run is the one named after it.
+    """
+    # Cheap and lock-protected, so async runs call it on the event loop instead of an executor thread
+    run_inline = True
+
+    def __init__(self):
+        self._node_runs = {}   # run_id -> (node, start time)
+        self._llm_runs = {}    # run_id -> node
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            with self._lock:
+                self._node_runs[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            run = self._node_runs.pop(run_id, None)
+        if run:
+            metrics.NODE_SECONDS.observe(time.perf_counter() - run[1], node=run[0])
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        with self._lock:
+            self._llm_runs[run_id] = (metadata or {}).get("langgraph_node", "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            node = self._llm_runs.pop(run_id, "unknown")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), node=node, kind="prompt")
+                metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), node=node, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._llm_runs.pop(run_id, None)
+
+# Pass as config={"callbacks": GRAPH_CALLBACKS} when invoking or streaming the graph
+GRAPH_CALLBACKS = [MetricsCallback()]
 
 # --- Helper: Robust JSON Extraction ---
 def extract_json(text):
@@ -68,21 +242,279 @@ def extract_json(text):
     except (json.JSONDecodeError, AttributeError):
         return None
 
+def parse_reply(text):
+    """JSON-mode replies are bare JSON; extract_json's scanning is only the fallback (text mode, stray fences)."""
+    data = structured_output.parse(text)
+    return data if data is not None else extract_json(text)
+
+class CountedModel:
+    """Wraps the chat model for one node run and counts the requests that reach it (response cache hits never do)."""
+
+    def __init__(self, model):
+        self.wrapped = model
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def invoke(self, prompt, **options):
+        self.calls += 1
+        return self.wrapped.invoke(prompt, **options)
+
+    def stream(self, prompt, **options):
+        self.calls += 1
+        return self.wrapped.stream(prompt, **options)
+
+    async def ainvoke(self, prompt, **options):
+        self.calls += 1
+        return await self.wrapped.ainvoke(prompt, **options)
+
+    def astream(self, prompt, **options):
+        self.calls += 1
+        return self.wrapped.astream(prompt, **options)
+
+def call_options(schema, many=False):
+    """Model call options for a reply matching `schema`: JSON mode with its response schema, or none in text mode."""
+    if not STRUCTURED_OUTPUT:
+        return {}
+    return {"response_mime_type": "application/json",
+            "response_json_schema": structured_output.response_schema(schema, many)}
+
+def counted_reply(node, data):
+    """Counts a parsed reply (and a failed parse) for `node`; returns it."""
+    metrics.LLM_REPLIES.inc(node=node)
+    if data is None:
+        metrics.JSON_PARSE_FAILURES.inc(node=node)
+    return data
+
+def counted_stream(node, parser):
+    """Counts a streamed reply and the objects its parser had to skip for `node`."""
+    metrics.LLM_REPLIES.inc(node=node)
+    if parser.failures:
+        metrics.JSON_PARSE_FAILURES.inc(parser.failures, node=node)
+
+def invoke_json(prompt, node, bypass_cache=False, model=None, options=None):
+    """
+    Calls the model and returns the parsed JSON (or None).
+    Goes through the response cache unless it is disabled or `bypass_cache` is set.
+    """
+    model = model or get_llm()
+    options = options or {}
+    response_cache = get_response_cache()
+    if response_cache is None:
+        data = parse_reply(llm_cache.message_text(model.invoke(prompt, **options)))
+    else:
+        data = response_cache.invoke(model, prompt, node=node, parse=parse_reply, bypass=bypass_cache, **options)
+    return counted_reply(node, data)
+
+async def ainvoke_json(prompt, node, bypass_cache=False, model=None, options=None):
+    """invoke_json() for coroutines."""
+    model = model or get_llm()
+    options = options or {}
+    response_cache = get_response_cache()
+    if response_cache is None:
+        data = parse_reply(llm_cache.message_text(await model.ainvoke(prompt, **options)))
+    else:
+        data = await response_cache.ainvoke(model, prompt, node=node, parse=parse_reply, bypass=bypass_cache, **options)
+    return counted_reply(node, data)
+
+def stream_json_objects(prompt, node, bypass_cache=False, model=None, options=None):
+    """
+    Streams the model's reply and yields each object of the JSON array in it as soon as it is complete.
+    Parsing is incremental (json_stream.ArrayObjectParser), so the cost stays linear in the reply length.
+    """
+    model = model or get_llm()
+    options = options or {}
+    response_cache = get_response_cache()
+    if response_cache is None:
+        chunks = (llm_cache.message_text(chunk) for chunk in model.stream(prompt, **options))
+    else:
+        chunks = response_cache.stream(model, prompt, node=node, bypass=bypass_cache,
+                                       parse=json_stream.parse_complete_array, **options)
+
+    parser = json_stream.ArrayObjectParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    counted_stream(node, parser)
+
+async def astream_json_objects(prompt, node, bypass_cache=False, model=None, options=None):
+    """stream_json_objects() for coroutines: an async generator."""
+    model = model or get_llm()
+    options = options or {}
+    response_cache = get_response_cache()
+    if response_cache is None:
+        chunks = (llm_cache.message_text(chunk) async for chunk in model.astream(prompt, **options))
+    else:
+        chunks = response_cache.astream(model, prompt, node=node, bypass=bypass_cache,
+                                        parse=json_stream.parse_complete_array, **options)
+
+    parser = json_stream.ArrayObjectParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    counted_stream(node, parser)
+
+# --- Model Call Steps ---
+# The nodes that call the model are written once, as generators that yield each call they need and are sent
+# its result (`data = yield JsonCall(...)`). run_steps() performs the calls with blocking I/O for the sync graph,
+# arun_steps() awaits them for the async one (see graph_node), so both graphs share every prompt and fallback.
+JsonCall = namedtuple("JsonCall", "prompt node bypass_cache model options")     # -> invoke_json()'s result
+StreamCall = namedtuple("StreamCall", "prompt node bypass_cache model options") # -> a stream_json_objects() stream
+NextObject = namedtuple("NextObject", "stream")   # -> the stream's next object, or None once it is done
+Limited = namedtuple("Limited", "steps")          # -> the result of `steps`, run under the writer semaphore
+Concurrent = namedtuple("Concurrent", "steps")    # -> the results of several step generators, run concurrently
+
+def run_steps(steps):
+    """Runs a step generator, making its calls with blocking I/O; returns its result. A failed call raises inside it."""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = run_step(step), None
+        except Exception as e:
+            result, error = None, e
+
+def run_step(step):
+    if isinstance(step, JsonCall):
+        return invoke_json(*step)
+    if isinstance(step, StreamCall):
+        return stream_json_objects(*step)
+    if isinstance(step, NextObject):
+        return next(step.stream, None)
+    if isinstance(step, Limited):
+        with writer_semaphore:
+            return run_steps(step.steps)
+
+    if len(step.steps) == 1:
+        return [run_steps(step.steps[0])]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(step.steps), WRITER_MAX_CONCURRENCY)) as executor:
+        # Each call gets its own copy of the context so it keeps the node's config and trace id
+        futures = [executor.submit(contextvars.copy_context().run, run_steps, steps) for steps in step.steps]
+        return [future.result() for future in futures]
+
+async def arun_steps(steps):
+    """run_steps() for coroutines: the calls are awaited, and Concurrent steps run on the event loop."""
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = await arun_step(step), None
+        except Exception as e:
+            result, error = None, e
+
+async def arun_step(step):
+    if isinstance(step, JsonCall):
+        return await ainvoke_json(*step)
+    if isinstance(step, StreamCall):
+        return astream_json_objects(*step)
+    if isinstance(step, NextObject):
+        return await anext(step.stream, None)
+    if isinstance(step, Limited):
+        async with async_writer_semaphore():
+            return await arun_steps(step.steps)
+    return list(await asyncio.gather(*(arun_steps(steps) for steps in step.steps)))
+
+def graph_node(node, use_async=False):
+    """A node written as a step generator, as a graph node: a function, or a coroutine with `use_async`."""
+    if use_async:
+        @functools.wraps(node)
+        async def run(state):
+            return await arun_steps(node(state))
+    else:
+        @functools.wraps(node)
+        def run(state):
+            return run_steps(node(state))
+    return run
+
+def structured_steps(prompt, node, schema, many=False, bypass_cache=False, defaults=None):
+    """
+    Calls the model for a reply matching `schema` (a list of them with `many`) and returns (value, calls).
+    - Each element is validated on its own; an invalid one gets up to STRUCTURED_REPAIR_ATTEMPTS repair calls
+      showing the model just that element and its errors. Valid elements are never sent again.
+    - value is the validated dict, or a list with None for elements that could not be repaired.
+      It is None when the reply is not JSON of the right shape.
+    - calls counts the requests that reached the model, for the state's llm_calls.
+    `defaults` fills fields an element left out before it is validated (e.g. a heading the node already knows).
+    """
+    model = CountedModel(get_llm())
+    data = yield JsonCall(prompt, node, bypass_cache, model, call_options(schema, many))
+    items = reply_elements(data, many)
+    if items is None:
+        return None, model.calls
+
+    values = []
+    for item in items:
+        values.append((yield from element_steps(item, node, schema, model, bypass_cache, defaults)))
+    return (values if many else values[0]), model.calls
+
+def reply_elements(data, many):
+    """The elements of a structured reply, or None when it is not JSON of the right shape."""
+    if many and isinstance(data, dict):
+        # A single element may come back unwrapped
+        data = [data]
+    if data is None or isinstance(data, list) != many:
+        return None
+    return data if many else [data]
+
+def element_steps(item, node, schema, model, bypass_cache=False, defaults=None):
+    """One element of a structured reply, validated and repaired if needed; None if it is still invalid."""
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        if defaults and isinstance(item, dict):
+            item = {**defaults, **item}
+        value, errors = structured_output.validate(schema, item)
+        if value is not None:
+            metrics.LLM_REPLY_ELEMENTS.inc(node=node, result="repaired" if attempt else "valid")
+            return value
+        if attempt == STRUCTURED_REPAIR_ATTEMPTS:
+            break
+
+        log(f"--- [Repair] Invalid {schema.__name__.lower()} from {node} (attempt {attempt + 1}): {errors} ---")
+        # A repeated attempt must not get the cached answer to the same repair prompt
+        fixed = yield JsonCall(repair_prompt(schema, item, errors), node, bypass_cache or attempt > 0, model,
+                               call_options(schema))
+        if fixed is not None:
+            item = fixed
+
+    metrics.LLM_REPLY_ELEMENTS.inc(node=node, result="invalid")
+    return None
+
+def deck_image_mode(state):
+    """The image_mode to render the deck with, or None when images are off."""
+    return state['image_mode'] if state['include_images'] else None
+
+def uses_image_layout(state):
+    """Whether content slides get the half-width (Two Content) body in create_ppt."""
+    return bool(state.get('include_images')) and state.get('image_mode') in ['manual', 'auto']
+
 # --- 3. Node Functions ---
 
 def planner_node(state: AgentState):
     """
     Agent 1: Planner
     Breaks the topic into a structured outline (titles).
+    Large decks are broken into sections instead (see plan_sections).
     """
-    print(f"--- [Planner] Planning topic: {state['topic']} ---")
-    
+    log(f"--- [Planner] Planning topic: {state['topic']} ---")
+    if state.get('num_slides', 5) > LARGE_DECK_SLIDES:
+        return (yield from plan_sections(state))
+
+    data, calls = yield from structured_steps(planner_prompt(state), "planner", structured_output.Outline,
+                                              bypass_cache=state.get('bypass_cache', False))
+    return planner_update(state, data, calls)
+
+def planner_prompt(state: AgentState):
     num_slides = state.get('num_slides', 5)
     tone = state.get('tone', 'professional')
     audience = state.get('audience', 'general audience')
     instructions = state.get('additional_instructions', '')
     
-    prompt = f"""
+    return f"""
     You are an expert presentation planner.
     Topic: "{state['topic']}"
     Target Audience: "{audience}"
@@ -96,29 +528,145 @@ def planner_node(state: AgentState):
         "outline": ["Slide 1 Title", "Slide 2 Title", ... "Slide {num_slides} Title"]
     }}
     """
-    
-    response = llm.invoke(prompt)
-    data = extract_json(response.content)
-    
+
+def planner_update(state: AgentState, data, calls):
+    """The planner's state update from its validated reply (or None)."""
     if data:
         return {
-            "presentation_title": data.get("title", state['topic']),
-            "outline": data.get("outline", [])
+            "presentation_title": data["title"],
+            "outline": data["outline"],
+            "llm_calls": calls
         }
     else:
-        # Fallback if JSON fails
+        # Fallback if the outline is still invalid after repair
         return {
             "presentation_title": state['topic'],
-            "outline": [f"Slide {i+1} for {state['topic']}" for i in range(state.get('num_slides', 5))]
+            "outline": [f"Slide {i+1} for {state['topic']}" for i in range(state.get('num_slides', 5))],
+            "llm_calls": calls
         }
 
-def content_node(state: AgentState):
+def plan_sections(state: AgentState):
     """
-    Agent 2: Content Writer
-    Takes the outline and generates detailed content + image prompts for each slide.
+    Planner for large decks: splits the deck into sections of about SECTION_SLIDES slides.
+    The slide titles of each section are planned by their own section_planner call (see route_planner).
     """
-    print(f"--- [Writer] Writing content for {len(state['outline'])} slides ---")
-    
+    target = math.ceil(state['num_slides'] / SECTION_SLIDES)
+    log(f"--- [Planner] Large deck: planning {state['num_slides']} slides as ~{target} sections ---")
+    data, calls = yield from structured_steps(sections_prompt(state, target), "planner", structured_output.SectionPlan,
+                                              bypass_cache=state.get('bypass_cache', False))
+    return sections_update(state, target, data, calls)
+
+def sections_prompt(state: AgentState, target):
+    num_slides = state['num_slides']
+    return f"""
+    You are an expert presentation planner.
+    Topic: "{state['topic']}"
+    Target Audience: "{state.get('audience', 'general audience')}"
+    Tone: "{state.get('tone', 'professional')}"
+    Additional Instructions: "{state.get('additional_instructions', '')}"
+
+    Task: Split a {num_slides}-slide presentation on this topic into about {target} sections.
+    Return ONLY a JSON object with this structure:
+    {{
+        "title": "Main Presentation Title",
+        "sections": [{{"title": "Section 1 Title", "num_slides": {SECTION_SLIDES}}}, ...]
+    }}
+    The section slide counts must add up to {num_slides}.
+    """
+
+def sections_update(state: AgentState, target, data, calls):
+    """The large-deck planner's state update from its validated reply (or None)."""
+    if data:
+        title, sections = data["title"], data["sections"]
+    else:
+        # Fallback if the plan is still invalid after repair: equal parts, titled by the section planners
+        title = state['topic']
+        sections = [{"title": f"{state['topic']}: part {i + 1}", "num_slides": 1} for i in range(target)]
+
+    return {
+        "presentation_title": title,
+        "sections": fit_sections(sections, state['num_slides']),
+        "llm_calls": calls
+    }
+
+def fit_sections(sections, num_slides):
+    """
+    Scales the planned section sizes so they add up to num_slides (models are loose with the sum)
+    and records where each section starts in the outline. Sections left with no slides are dropped.
+    """
+    sections = sections[:num_slides]
+    planned = [max(1, section.get('num_slides', 1)) for section in sections]
+    total = sum(planned)
+    # Largest remainder rounding keeps the proportions the planner chose
+    sizes = [size * num_slides // total for size in planned]
+    by_remainder = sorted(range(len(planned)), key=lambda i: planned[i] * num_slides % total, reverse=True)
+    for i in by_remainder[:num_slides - sum(sizes)]:
+        sizes[i] += 1
+
+    fitted, start = [], 0
+    for section, size in zip(sections, sizes):
+        if size:
+            fitted.append({"title": section['title'], "num_slides": size, "start": start})
+            start += size
+    return fitted
+
+def sections_list(sections):
+    """The section list as prompt lines."""
+    return "\n    ".join(f"{i + 1}. {section['title']} ({section['num_slides']} slides)"
+                         for i, section in enumerate(sections))
+
+def section_planner_node(state: Dict[str, Any]):
+    """
+    Agent 1b: Section Planner (large decks, map step)
+    Plans the slide titles of one section. Receives a Send payload with the whole section list for context.
+    """
+    data, calls = yield from structured_steps(section_planner_prompt(state), "section_planner",
+                                              structured_output.SectionOutline,
+                                              bypass_cache=state.get('bypass_cache', False))
+    return {"section_outlines": [{"index": state['section_index'], "outline": data["outline"] if data else []}],
+            "llm_calls": calls}
+
+def section_planner_prompt(state: Dict[str, Any]):
+    index = state['section_index']
+    section = state['sections'][index]
+
+    return f"""
+    You are an expert presentation planner.
+    Presentation Title: "{state['presentation_title']}"
+    Topic: "{state['topic']}"
+    Target Audience: "{state.get('audience', 'general audience')}"
+    Tone: "{state.get('tone', 'professional')}"
+    Additional Instructions: "{state.get('additional_instructions', '')}"
+
+    Sections:
+    {sections_list(state['sections'])}
+
+    Task: Generate the {section['num_slides']} slide titles for section {index + 1}: "{section['title']}".
+    Return ONLY a JSON object with this structure:
+    {{
+        "outline": ["Slide 1 Title", "Slide 2 Title", ... "Slide {section['num_slides']} Title"]
+    }}
+    Do not plan slides that belong to other sections.
+    """
+
+def outline_collector_node(state: AgentState):
+    """
+    Agent 1c: Outline Collector (large decks, reduce step)
+    Joins the section outlines in section order, each cut or padded to its section's planned size.
+    """
+    planned = {item['index']: item['outline'] for item in state.get('section_outlines', [])}
+    outline = []
+    for i, section in enumerate(state['sections']):
+        size = section['num_slides']
+        titles = list(planned.get(i, []))[:size]
+        titles += [f"{section['title']} ({k + 1}/{size})" for k in range(len(titles), size)]
+        outline.extend(titles)
+
+    log(f"--- [Outline Collector] {len(outline)} slides in {len(state['sections'])} sections ---")
+    return {"outline": outline}
+
+def writer_prompt(state: AgentState):
+    """Prompt for writing every slide of the outline in one call (batch and streaming writers)."""
     outline_str = "\\n".join(f"- {title}" for title in state['outline'])
     
     image_instruction = ""
@@ -127,7 +675,7 @@ def content_node(state: AgentState):
         - For each slide, include an "image_search_query" (2-4 words) to find a relevant image.
         """
         
-    prompt = f"""
+    return f"""
     You are a professional presentation content writer.
     Presentation Title: "{state['presentation_title']}"
     Target Audience: "{state.get('audience', 'general audience')}"
@@ -159,79 +707,454 @@ def content_node(state: AgentState):
     - Use "level": 0 for main points, "level": 1 for sub-points.
     {image_instruction}
     """
-    
-    response = llm.invoke(prompt)
-    slides = extract_json(response.content)
-    
+
+def repair_prompt(schema, item, errors):
+    """Prompt for fixing one invalid element of a structured reply, showing the model only that element."""
+    name = schema.__name__.lower()
+    return f"""
+    You are fixing a JSON {name} that does not match the required schema.
+
+    Validation errors:
+    {errors}
+
+    Invalid {name}:
+    {json.dumps(item)}
+
+    Return ONLY the corrected JSON {name}. Keep every valid field unchanged.
+    """
+
+def content_node(state: AgentState):
+    """
+    Agent 2: Content Writer
+    Takes the outline and generates detailed content + image prompts for each slide.
+    """
+    log(f"--- [Writer] Writing content for {len(state['outline'])} slides ---")
+
+    slides, calls = yield from structured_steps(writer_prompt(state), "writer", structured_output.Slide, many=True,
+                                                bypass_cache=state.get('bypass_cache', False))
+    return writer_update(state, slides, calls)
+
+def writer_update(state: AgentState, slides, calls):
+    """The single-call writer's state update from its validated slides (or None)."""
     if slides:
-        return {"slides": slides}
+        # A slide that is still invalid after repair keeps its place in the outline
+        return {"slides": [deck.Slide.from_dict(slide) if slide else fallback_slide(state, i)
+                           for i, slide in enumerate(slides)], "llm_calls": calls}
     else:
-        print(f"Writer Error: Failed to parse JSON")
-        return {"slides": []}
+        log(f"Writer Error: Failed to parse JSON")
+        return {"slides": [], "llm_calls": calls}
+
+def fallback_slide(state, index):
+    """Heading-only slide for an outline entry the writers could not produce valid content for."""
+    outline = state.get('outline') or []
+    return deck.Slide(outline[index] if index < len(outline) else "")
+
+def stream_writer_node(state: AgentState):
+    """
+    Agent 2d: Streaming Writer
+    Same prompt as the batch writer, but the reply is streamed and parsed incrementally: each slide goes to
+    the graph's custom stream (stream_mode="custom") as soon as its JSON object closes.
+    If the reply is cut off, every slide completed before that point is kept.
+    """
+    from langgraph.config import get_stream_writer
+
+    log(f"--- [Stream Writer] Streaming content for {len(state['outline'])} slides ---")
+    emit = get_stream_writer()
+    bypass_cache = state.get('bypass_cache', False)
+    model = CountedModel(get_llm())
+    options = call_options(structured_output.Slide, many=True)
+    slides = []
+    try:
+        stream = yield StreamCall(writer_prompt(state), "stream_writer", bypass_cache, model, options)
+        while True:
+            item = yield NextObject(stream)
+            if item is None:
+                break
+            # An invalid slide is repaired on its own while the rest of the reply keeps streaming in
+            slide = yield from element_steps(item, "stream_writer", structured_output.Slide, model, bypass_cache)
+            slide = deck.Slide.from_dict(slide) if slide else fallback_slide(state, len(slides))
+            emit({"event": "slide", "index": len(slides), "slide": slide})
+            slides.append(slide)
+    except Exception as e:
+        log(f"Stream Writer Error after {len(slides)} slides: {e}")
+
+    if not slides:
+        log("Stream Writer Error: no complete slide in the reply")
+    return {"slides": slides, "llm_calls": model.calls}
+
+def slide_writer_node(state: Dict[str, Any]):
+    """
+    Agent 2b: Slide Writer (map step)
+    Writes a single slide from one outline entry. Receives a Send payload, not the full AgentState.
+    A failed slide is retried on its own; after the last attempt it falls back to a heading-only slide.
+    """
+    index = state['index']
+    heading = state['heading']
+    prompt = slide_prompt(state)
+
+    calls = 0
+    for attempt in range(1, SLIDE_WRITER_ATTEMPTS + 1):
+        try:
+            slide, attempt_calls = yield Limited(structured_steps(
+                prompt, "slide_writer", structured_output.Slide,
+                bypass_cache=state.get('bypass_cache', False) or attempt > 1, defaults={"heading": heading}))
+            calls += attempt_calls
+        except Exception as e:
+            log(f"Slide Writer Error (slide {index + 1}, attempt {attempt}): {e}")
+            slide = None
+            calls += 1
+
+        if slide:
+            return {"slide_drafts": [{"index": index, "slide": deck.Slide.from_dict(slide)}], "llm_calls": calls}
+
+        log(f"--- [Slide Writer] Slide {index + 1} unusable (attempt {attempt}/{SLIDE_WRITER_ATTEMPTS}) ---")
+
+    return {"slide_drafts": [{"index": index, "slide": deck.Slide(heading)}], "llm_calls": calls}
+
+def slide_prompt(state: Dict[str, Any]):
+    index = state['index']
+    heading = state['heading']
+    outline_str = "\\n".join(f"- {title}" for title in state['outline'])
+
+    image_instruction = ""
+    if state['include_images']:
+        image_instruction = """
+        - Include an "image_search_query" (2-4 words) to find a relevant image.
+        """
+
+    return f"""
+    You are a professional presentation content writer.
+    Presentation Title: "{state['presentation_title']}"
+    Target Audience: "{state.get('audience', 'general audience')}"
+    Tone: "{state.get('tone', 'professional')}"
+
+    Full Outline (for context only):
+    {outline_str}
+
+    Task: Write the detailed content for slide {index + 1}: "{heading}".{revision_request(state)}
+
+    Output Format:
+    Return ONLY a JSON object for this one slide.
+    Example:
+    {{
+        "heading": "{heading}",
+        "content": [
+            {{ "text": "Main point", "level": 0 }},
+            {{ "text": "Sub-point details", "level": 1 }}
+        ],
+        "image_search_query": "search query"
+    }}
+
+    Rules:
+    - Use the heading exactly as given.
+    - MAXIMUM 5 lines.
+    - Content must be concise (bullet points) and match the requested tone and audience.
+    - Use "level": 0 for main points, "level": 1 for sub-points.
+    - Do not repeat points that belong to other slides in the outline.
+    {image_instruction}
+    """
+
+def revision_request(state):
+    """Extra slide writer instructions for an edit run (the current slide and what to change), or ""."""
+    lines = [""]
+    if state.get('current'):
+        lines.append(f"Current version of this slide: {json.dumps(state['current'].to_dict())}")
+        lines.append("Write a new version of it, different from the current one.")
+    if state.get('instructions'):
+        lines.append(f'Instructions for this slide: "{state["instructions"]}"')
+    return "\n    ".join(lines)
+
+def running_summary(slides, max_chars=RUNNING_SUMMARY_CHARS):
+    """Heading and main points of the latest `slides`, oldest first: the most recent that fit in about max_chars."""
+    lines, size = [], 0
+    for slide in reversed(slides):
+        points = "; ".join(item.text for item in slide.content if item.level == 0)
+        line = f"- {slide.heading}: {points}" if points else f"- {slide.heading}"
+        size += len(line)
+        if size > max_chars:
+            break
+        lines.append(line)
+    return "\n    ".join(reversed(lines)) or "(none yet)"
+
+def chunk_prompt(state, headings, window, summary):
+    """Prompt for writing one window of a section (chunk_writer)."""
+    index = state['section_index']
+    section = state['sections'][index]
+    outline_str = "\n    ".join(f"- {title}" for title in headings)
+    window_str = "\n    ".join(f"- {title}" for title in window)
+
+    image_instruction = ""
+    if state['include_images']:
+        image_instruction = """
+        - For each slide, include an "image_search_query" (2-4 words) to find a relevant image.
+        """
+
+    return f"""
+    You are a professional presentation content writer.
+    Presentation Title: "{state['presentation_title']}"
+    Target Audience: "{state.get('audience', 'general audience')}"
+    Tone: "{state.get('tone', 'professional')}"
+
+    Sections:
+    {sections_list(state['sections'])}
+
+    Section {index + 1} Outline (for context only):
+    {outline_str}
+
+    Already Written in This Section:
+    {summary}
+
+    Slides to Write:
+    {window_str}
+
+    Task: Write the detailed content for these {len(window)} slides of section {index + 1}: "{section['title']}".
+
+    Output Format:
+    Return ONLY a JSON list with one slide object per slide to write, in the same order.
+    Example:
+    [
+        {{
+            "heading": "Slide 1 Title",
+            "content": [
+                {{ "text": "Main point", "level": 0 }},
+                {{ "text": "Sub-point details", "level": 1 }}
+            ],
+            "image_search_query": "search query"
+        }}
+    ]
+
+    Rules:
+    - Use the headings exactly as given.
+    - MAXIMUM 5 lines per slide.
+    - Content must be concise (bullet points) and match the requested tone and audience.
+    - Use "level": 0 for main points, "level": 1 for sub-points.
+    - Continue from the slides already written; do not repeat their points.
+    {image_instruction}
+    """
+
+def chunk_writer_node(state: Dict[str, Any]):
+    """
+    Agent 2e: Chunk Writer (large decks, map step)
+    Writes one section in windows of WRITER_CHUNK_SLIDES slides, one call per window. Each call sees the
+    section's outline and a running summary of the slides written before it, so the prompt and the reply
+    stay the same size however long the deck is. Receives a Send payload, not the full AgentState.
+    A failed window is retried; after the last attempt its slides fall back to heading-only slides.
+    """
+    start, headings = section_headings(state)
+    drafts, written, calls = [], [], 0
+    for offset in range(0, len(headings), WRITER_CHUNK_SLIDES):
+        window = headings[offset:offset + WRITER_CHUNK_SLIDES]
+        prompt = chunk_prompt(state, headings, window, running_summary(written))
+
+        slides = None
+        for attempt in range(1, SLIDE_WRITER_ATTEMPTS + 1):
+            try:
+                slides, attempt_calls = yield Limited(structured_steps(
+                    prompt, "chunk_writer", structured_output.Slide, many=True,
+                    bypass_cache=state.get('bypass_cache', False) or attempt > 1))
+                calls += attempt_calls
+            except Exception as e:
+                log(f"Chunk Writer Error (slides {start + offset + 1}-{start + offset + len(window)}, "
+                    f"attempt {attempt}): {e}")
+                calls += 1
+            if slides:
+                break
+
+        window_drafts(start + offset, window, slides, drafts, written)
+
+    return {"slide_drafts": drafts, "llm_calls": calls}
+
+def section_headings(state: Dict[str, Any]):
+    """(outline index of the section's first slide, the section's headings) for a chunk_writer payload."""
+    section = state['sections'][state['section_index']]
+    start = section['start']
+    headings = state['outline'][start:start + section['num_slides']]
+    log(f"--- [Chunk Writer] Section {state['section_index'] + 1}: {len(headings)} slides ---")
+    return start, headings
+
+def window_drafts(first_index, window, slides, drafts, written):
+    """Adds one window's slides to `drafts` and `written`, filling in any the reply did not produce."""
+    slides = slides or []
+    for j, heading in enumerate(window):
+        # A slide missing from the reply, or still invalid after repair, keeps its place in the outline
+        slide = deck.Slide.from_dict(slides[j]) if j < len(slides) and slides[j] else deck.Slide(heading)
+        drafts.append({"index": first_index + j, "slide": slide})
+        written.append(slide)
+
+def collector_node(state: AgentState):
+    """
+    Agent 2c: Collector (reduce step)
+    Puts the per-slide writer results into the deck in outline order, replacing slides an edit run rewrote.
+    """
+    drafts = {draft['index']: draft['slide'] for draft in state.get('slide_drafts', [])}
+    log(f"--- [Collector] Collected {len(drafts)} slides ---")
+
+    slides = list(state.get('slides') or [])
+    for index in sorted(drafts):
+        if index < len(slides):
+            slides[index] = drafts[index]
+        else:
+            slides.append(drafts[index])
+    return {"slides": slides}
+
+def route_writer(state: AgentState):
+    """
+    Conditional Edge Logic
+    Fans the outline out to one slide_writer per entry, or hands it to the single-call (or streaming) writer.
+    A large deck's sections always go to one chunk_writer each.
+    """
+    from langgraph.types import Send
+
+    if state.get('sections') and state['outline']:
+        log(f"--- [Edge] Writing {len(state['sections'])} sections in chunks of {WRITER_CHUNK_SLIDES} slides ---")
+        shared = {**writer_context(state), "sections": state['sections']}
+        return [Send("chunk_writer", {**shared, "section_index": i}) for i in range(len(state['sections']))]
+    if WRITER_MODE == "stream" and state['outline']:
+        return "stream_writer"
+    if WRITER_MODE != "parallel" or not state['outline']:
+        return "writer"
+
+    log(f"--- [Edge] Fanning out {len(state['outline'])} slide writers ---")
+    shared = writer_context(state)
+    return [
+        Send("slide_writer", {**shared, "index": i, "heading": heading})
+        for i, heading in enumerate(state['outline'])
+    ]
+
+def route_planner(state: AgentState):
+    """
+    Conditional Edge Logic
+    Fans a large deck's sections out to one section_planner each; any other outline goes to route_writer.
+    """
+    from langgraph.types import Send
+
+    if not state.get('sections') or state['outline']:
+        return route_writer(state)
+
+    log(f"--- [Edge] Fanning out {len(state['sections'])} section planners ---")
+    shared = {
+        "presentation_title": state['presentation_title'],
+        "sections": state['sections'],
+        "topic": state['topic'],
+        "audience": state.get('audience', 'general audience'),
+        "tone": state.get('tone', 'professional'),
+        "additional_instructions": state.get('additional_instructions', ''),
+        "bypass_cache": state.get('bypass_cache', False),
+    }
+    return [Send("section_planner", {**shared, "section_index": i}) for i in range(len(state['sections']))]
+
+def writer_context(state: AgentState):
+    """The deck-level fields every slide_writer Send payload carries."""
+    return {
+        "presentation_title": state['presentation_title'],
+        "outline": state['outline'],
+        "include_images": state['include_images'],
+        "audience": state.get('audience', 'general audience'),
+        "tone": state.get('tone', 'professional'),
+        "bypass_cache": state.get('bypass_cache', False),
+    }
+
+def route_start(state: AgentState):
+    """
+    Entry Edge Logic
+    A new deck starts at the planner. An edit run sends only the slides it rewrites to slide_writer,
+    or goes straight to the collector when every change was made by hand.
+    """
+    from langgraph.types import Send
+
+    if not state.get('scope'):
+        return "planner"
+    if not state.get('revisions'):
+        return "collector"
+
+    log(f"--- [Edge] Rewriting slides {[r['index'] + 1 for r in state['revisions']]} ---")
+    # Always bypass the response cache: a regenerated slide has to differ from the cached one
+    shared = {**writer_context(state), "bypass_cache": True}
+    return [
+        Send("slide_writer", {**shared, "index": r['index'], "heading": r['heading'],
+                              "instructions": r.get('instructions', ''), "current": r.get('current')})
+        for r in state['revisions']
+    ]
 
 def aggregator_node(state: AgentState):
     """
     Agent 3: Aggregator
-    Compiles everything into the final format expected by app.py/ppt_utils.
+    Compiles everything into the deck.Deck expected by app.py/ppt_utils.
     """
-    print("--- [Aggregator] Formatting final JSON ---")
-    
-    final_structure = {
-        "title": state['presentation_title'],
-        "slides": state['slides']
-    }
+    log("--- [Aggregator] Formatting final JSON ---")
+    metrics.REFINE_ITERATIONS.observe(state.get('retry_count', 0))
+    metrics.DECK_LLM_CALLS.observe(state.get('llm_calls', 0))
     
-    return {"final_output": json.dumps(final_structure)}
+    # The slides are shared with the state, not copied; JSON only happens at the API boundary
+    return {"final_output": deck.Deck(state['presentation_title'], tuple(state['slides']))}
 
 def refine_node(state: AgentState):
     """
     Agent 4: Refiner
     Shortens slides that are too long.
     """
-    print("--- [Refiner] Refining slide content ---")
-    
-    slides = state['slides']
-    retry_count = state.get('retry_count', 0)
-    
-    # Identify long slides (simple heuristic: > 600 chars)
-    # real fit depends on ppt_utils logic, but this is a good proxy for the AI.
+    log("--- [Refiner] Refining slide content ---")
+    slides, chunks = refine_plan(state)
+    if not chunks:
+        return {"retry_count": state.get('retry_count', 0) + 1} # Should not happen if check_length works, but safe fallback
+
+    results = yield Concurrent([refine_chunk(state, slides, *chunk) for chunk in chunks])
+    return refine_update(state, slides, chunks, results)
+
+def refine_plan(state: AgentState):
+    """(the slides, [(overflowing slide indices, % reductions)] chunks to refine with one call each)."""
+    slides = list(state['slides'])
+
+    # Identify slides whose measured body text overflows the placeholder
     long_slide_indices = []
-    for i, slide in enumerate(slides):
-        text_content = ""
-        for item in slide.get('content', []):
-            text_content += item.get('text', "")
-        
-        if len(text_content) > 500:
-            long_slide_indices.append(i)
-            
-    if not long_slide_indices:
-        return {"retry_count": retry_count + 1} # Should not happen if check_length works, but safe fallback
+    reductions = []
+    for i, fill in overflowing_slides(state):
+        long_slide_indices.append(i)
+        # Cut enough words to fit, with a little headroom
+        reductions.append(min(60, max(15, round((1 - 0.9 / fill) * 100))))
 
-    prompt = f"""
+    # A large deck can have dozens of overflowing slides: they are refined in chunks, so no reply has to hold them all
+    chunks = [(long_slide_indices[i:i + WRITER_CHUNK_SLIDES], reductions[i:i + WRITER_CHUNK_SLIDES])
+              for i in range(0, len(long_slide_indices), WRITER_CHUNK_SLIDES)]
+    return slides, chunks
+
+def refine_update(state: AgentState, slides, chunks, results):
+    """Merges the refiner replies ((fixed slides or None, calls) per chunk) into the state update."""
+    calls = 0
+    for (indices, _), (fixed_slides, chunk_calls) in zip(chunks, results):
+        calls += chunk_calls
+        if fixed_slides:
+            # Merge back; a slide that is still invalid after repair keeps its current text
+            for i, original_index in enumerate(indices):
+                if i < len(fixed_slides) and fixed_slides[i] is not None:
+                    slides[original_index] = deck.Slide.from_dict(fixed_slides[i])
+
+    return {"slides": slides, "retry_count": state.get('retry_count', 0) + 1, "llm_calls": calls}
+
+def refine_chunk(state, slides, long_slide_indices, reductions):
+    """One refiner call for some of the overflowing slides (steps). Returns (fixed slides or None, calls)."""
+    return structured_steps(refine_prompt(slides, long_slide_indices, reductions), "refiner", structured_output.Slide,
+                            many=True, bypass_cache=state.get('bypass_cache', False))
+
+def refine_prompt(slides, long_slide_indices, reductions):
+    targets = "\n".join(
+        f"    - Slide {i}: reduce word count by ~{pct}%" for i, pct in zip(long_slide_indices, reductions)
+    )
+
+    return f"""
     You are a professional editor.
     Some slides in this presentation are overly verbose and will overflow.
     
     Task: Rewrite the content for the specified slides to be more CONCISE.
-    - Reduce word count by ~30%.
+{targets}
     - Keep the same core information.
     - Maintain the JSON structure.
     
     Slides to Fix (Indices: {long_slide_indices}):
-    {json.dumps([slides[i] for i in long_slide_indices])}
+    {json.dumps([slides[i].to_dict() for i in long_slide_indices])}
     
     Return ONLY the corrected JSON list for THESE slides.
     """
-    
-    response = llm.invoke(prompt)
-    fixed_slides = extract_json(response.content)
-    
-    if fixed_slides:
-        # Merge back
-        for i, original_index in enumerate(long_slide_indices):
-            if i < len(fixed_slides):
-                slides[original_index] = fixed_slides[i]
-                
-    return {"slides": slides, "retry_count": retry_count + 1}
 
 def check_length(state: AgentState):
     """
@@ -241,34 +1164,133 @@ def check_length(state: AgentState):
     retry_count = state.get('retry_count', 0)
     
     if retry_count >= 2:
-        print("--- [Edge] Max retries reached, proceeding ---")
+        log("--- [Edge] Max retries reached, proceeding ---")
         return "aggregator"
         
-    for slide in slides:
-        text_content = ""
-        for item in slide.get('content', []):
-            text_content += item.get('text', "")
-            
-        if len(text_content) > 500:
-             print(f"--- [Edge] Slide too long ({len(text_content)} chars), refining... ---")
-             return "refine"
+    for i, fill in overflowing_slides(state):
+        log(f"--- [Edge] Slide {i + 1} overflows ({fill:.0%} of body height), refining... ---")
+        return "refine"
              
     return "aggregator"
 
+def overflowing_slides(state: AgentState):
+    """(index, fill ratio) of every slide whose body overflows, limited to the edit run's scope if there is one."""
+    slides = state['slides']
+    image_layout = uses_image_layout(state)
+    indices = [i for i in state.get('scope') or range(len(slides)) if i < len(slides)]
+    overflowing = []
+    for i in indices:
+        fill = ppt_utils.body_fill_ratio(slides[i], image_layout)
+        if fill > 1:
+            overflowing.append((i, fill))
+    return overflowing
+
 # --- 4. Graph Construction ---
 
-builder = StateGraph(AgentState)
+def build_graph(checkpointer=None, use_async=False):
+    """
+    Compiles the StateGraph. Use get_graph() or get_deck_graph() for the shared instances.
+    With `use_async`, the nodes that call the model run as coroutines (see graph_node), for ainvoke/astream
+    (see get_async_deck_graph); the nodes and the graph's shape are the same.
+    """
+    from langgraph.graph import StateGraph, START, END
+
+    builder = StateGraph(AgentState)
+
+    builder.add_node("planner", graph_node(planner_node, use_async))
+    builder.add_node("section_planner", graph_node(section_planner_node, use_async))
+    builder.add_node("outline_collector", outline_collector_node)
+    builder.add_node("writer", graph_node(content_node, use_async))
+    builder.add_node("stream_writer", graph_node(stream_writer_node, use_async))
+    builder.add_node("slide_writer", graph_node(slide_writer_node, use_async))
+    builder.add_node("chunk_writer", graph_node(chunk_writer_node, use_async))
+    builder.add_node("collector", collector_node)
+    builder.add_node("refiner", graph_node(refine_node, use_async))
+    builder.add_node("aggregator", aggregator_node)
+
+    builder.add_conditional_edges(START, route_start, ["planner", "slide_writer", "collector"])
+
+    builder.add_conditional_edges("planner", route_planner, ["section_planner", "writer", "stream_writer", "slide_writer"])
+    builder.add_edge("section_planner", "outline_collector")
+    builder.add_conditional_edges("outline_collector", route_writer,
+                                  ["chunk_writer", "writer", "stream_writer", "slide_writer"])
+    builder.add_edge("slide_writer", "collector")
+    builder.add_edge("chunk_writer", "collector")
+    builder.add_conditional_edges("writer", check_length, {"refine": "refiner", "aggregator": "aggregator"})
+    builder.add_conditional_edges("stream_writer", check_length, {"refine": "refiner", "aggregator": "aggregator"})
+    builder.add_conditional_edges("collector", check_length, {"refine": "refiner", "aggregator": "aggregator"})
+    builder.add_conditional_edges("refiner", check_length, {"refine": "refiner", "aggregator": "aggregator"})
+    builder.add_edge("aggregator", END)
+
+    return builder.compile(checkpointer=checkpointer)
+
+_graph = None
+_deck_graph = None
+
+def get_graph():
+    """The shared compiled graph, built on first use."""
+    global _graph
+    if _graph is None:
+        with _init_lock:
+            if _graph is None:
+                _graph = build_graph()
+    return _graph
 
-builder.add_node("planner", planner_node)
-builder.add_node("writer", content_node)
-builder.add_node("refiner", refine_node)
-builder.add_node("aggregator", aggregator_node)
+def get_deck_graph():
+    """
+    The graph with a SQLite checkpointer (CHECKPOINT_DB), built on first use. Every run needs
+    config["configurable"]["thread_id"], the deck id; revisions.py reruns parts of a deck from its checkpoint.
+    """
+    global _deck_graph
+    if _deck_graph is None:
+        with _init_lock:
+            if _deck_graph is None:
+                import sqlite3
+                from langgraph.checkpoint.sqlite import SqliteSaver
+
+                # SqliteSaver serializes access to the connection itself
+                conn = sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)
+                _deck_graph = build_graph(checkpointer=SqliteSaver(conn, serde=checkpoint_serde()))
+    return _deck_graph
+
+def checkpoint_serde():
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    return JsonPlusSerializer(allowed_msgpack_modules=deck.CHECKPOINT_TYPES)
+
+# event loop -> async deck graph; its aiosqlite connection belongs to that loop
+_async_deck_graphs = weakref.WeakKeyDictionary()
+
+async def get_async_deck_graph():
+    """
+    The deck graph for ainvoke/astream: async nodes and an AsyncSqliteSaver on the same CHECKPOINT_DB,
+    so neither model calls nor checkpoint writes block the event loop. Built once per event loop.
+    Decks it writes are read and edited through get_deck_graph() like any other.
+    """
+    loop = asyncio.get_running_loop()
+    graph = _async_deck_graphs.get(loop)
+    if graph is None:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-builder.set_entry_point("planner")
+        conn = await aiosqlite.connect(CHECKPOINT_DB)
+        graph = _async_deck_graphs.setdefault(
+            loop, build_graph(checkpointer=AsyncSqliteSaver(conn, serde=checkpoint_serde()), use_async=True))
+        if graph.checkpointer.conn is not conn:
+            # Another coroutine built it while this one was connecting
+            await conn.close()
+    return graph
 
-builder.add_edge("planner", "writer")
-builder.add_conditional_edges("writer", check_length, {"refine": "refiner", "aggregator": "aggregator"})
-builder.add_conditional_edges("refiner", check_length, {"refine": "refiner", "aggregator": "aggregator"})
-builder.add_edge("aggregator", END)
+async def close_async_deck_graph():
+    """Closes the running event loop's checkpoint connection, if it has one."""
+    graph = _async_deck_graphs.pop(asyncio.get_running_loop(), None)
+    if graph is not None:
+        await graph.checkpointer.conn.close()
 
-graph = builder.compile()
+def __getattr__(name):
+    # Lazy module attributes: `agent_graph.llm` and `agent_graph.graph`
+    if name == "llm":
+        return get_llm()
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
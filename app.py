@@ -1,112 +1,625 @@
-from flask import Flask, request, jsonify, render_template, send_file, url_for
-from agent_graph import graph
+from flask import Flask, request, jsonify, render_template, send_file, url_for, Response, stream_with_context
+import agent_graph
+from agent_graph import build_initial_state
 import ppt_utils
+import jobs
+import batch
+import metrics
+import render_pool
+import pipeline
+import revisions
+from deck_cache import DeckCache, request_key
+from deck_store import DeckStore, PPTX_MIMETYPE
+from artifact_store import ArtifactStore
 import json
 import os
 import time
-from apscheduler.schedulers.background import BackgroundScheduler
-import atexit
+import queue
+import threading
+import contextvars
+import zipfile
+import tempfile
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", os.urandom(24))
 
-# --- Background Cleanup Task ---
-def cleanup_old_files():
-    """Deletes .pptx files older than 1 hour."""
-    now = time.time()
-    cutoff = now - 3600  # 1 hour
-    directory = os.path.dirname(os.path.abspath(__file__))
-    
-    # print("Running cleanup task...") 
-    for filename in os.listdir(directory):
-        if filename.endswith(".pptx") and filename.startswith("presentation_"):
-            filepath = os.path.join(directory, filename)
-            try:
-                if os.path.getmtime(filepath) < cutoff:
-                    os.remove(filepath)
-                    print(f"Deleted old file: {filename}")
-            except Exception as e:
-                print(f"Error checking/deleting {filename}: {e}")
-
-# Initialize Scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=cleanup_old_files, trigger="interval", minutes=60)
-scheduler.start()
-
-# Shut down the scheduler when exiting the app
-atexit.register(lambda: scheduler.shutdown())
+# Seconds between SSE keep-alive comments while the graph is busy
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "5"))
+
+# --- Deck Storage ---
+# "disk": decks are written to the artifact store's directory and expire after ARTIFACT_TTL_SECONDS.
+# "memory": decks live in a bounded in-memory/spooled store and never touch disk.
+DECK_STORAGE = os.getenv("DECK_STORAGE", "disk")
+deck_store = DeckStore() if DECK_STORAGE == "memory" else None
+artifact_store = ArtifactStore() if deck_store is None else None
+
+# --- Rendering ---
+# create_ppt runs in a warm process pool (RENDER_MODE, RENDER_WORKERS, RENDER_TIMEOUT_SECONDS)
+# so large renders do not hold the GIL while other routes are being served.
+renderer = render_pool.RenderExecutor()
+
+# --- Tracing & Metrics ---
+@app.before_request
+def assign_trace_id():
+    # Reuse an upstream request id so proxy and app logs line up
+    metrics.set_trace_id(request.headers.get("X-Request-ID"))
+
+@app.after_request
+def add_trace_header(response):
+    response.headers["X-Request-ID"] = metrics.current_trace_id() or ""
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/generate_ppt", methods=["POST"])
-def generate_ppt():
-    data = request.get_json()
-    topic = data.get("topic")
-    include_images = data.get("include_images", False)
-    image_mode = data.get("image_mode", "manual")
-    num_slides = int(data.get("num_slides", 5))
-    tone = data.get("tone", "Professional")
-    audience = data.get("audience", "General Audience")
-    additional_instructions = data.get("additional_instructions", "")
-
-    if not topic:
-        return jsonify({"error": "Topic is required"}), 400
+def new_deck_id():
+    return os.urandom(4).hex()
+
+def new_deck_filename(deck_id=None, revision=False):
+    """presentation_<deck id>.pptx for a new deck (new id by default); edited versions get an extra suffix."""
+    deck_id = deck_id or new_deck_id()
+    if revision:
+        return f"presentation_{deck_id}_{os.urandom(2).hex()}.pptx"
+    return f"presentation_{deck_id}.pptx"
+
+def deck_id_for(filename):
+    """The deck id (checkpoint thread id) a presentation_*.pptx filename belongs to."""
+    return filename[len("presentation_"):-len(".pptx")].split("_")[0]
+
+def requester_deck_id(filename, shared):
+    """
+    The deck id to answer a request for `filename` with. A `shared` file (a deck cache hit, or another request's run)
+    gets a copy of its checkpoint under a new id, so one requester's edits never change another's deck.
+    """
+    deck_id = deck_id_for(filename)
+    if not shared:
+        return deck_id
+    copy_id = new_deck_id()
+    try:
+        revisions.copy_deck(deck_id, filename, copy_id)
+    except revisions.DeckNotFound:
+        # Checkpointed before deck_file was recorded: there is no state to copy
+        return deck_id
+    return copy_id
+
+def render_deck(ppt_data, state, filename, previous=None, changed=None):
+    """
+    Renders the deck as `filename` (on disk or in the deck store) and returns the filename.
+    If `previous` (the filename of an earlier rendering of this deck) is still stored, only the
+    `changed` slide indices are re-rendered on top of it.
+    """
+    image_mode = agent_graph.deck_image_mode(state)
+    if deck_store is not None:
+        base = b"".join(deck_store.stream(previous)) if previous else None
+        deck_bytes = renderer.render(ppt_data, image_mode, base=base or None, changed=changed)
+        return save_deck_bytes(deck_bytes, filename)
+
+    base = artifact_store.path_for(previous) if previous else None
+    # The worker writes straight into the artifact directory, so only the path crosses the process boundary
+    renderer.render(ppt_data, image_mode, path=artifact_store.new_path(filename), base=base, changed=changed)
+    artifact_store.add(filename)
+    return filename
+
+def save_deck_bytes(deck_bytes, filename=None):
+    """Stores an already rendered deck under `filename` (a new one by default) and returns it."""
+    filename = filename or new_deck_filename()
+    if deck_store is not None:
+        buffer = deck_store.new_buffer()
+        buffer.write(deck_bytes)
+        deck_store.put(filename, buffer)
+    else:
+        with open(artifact_store.new_path(filename), "wb") as f:
+            f.write(deck_bytes)
+        artifact_store.add(filename)
+    return filename
+
+def new_pipelined_deck(initial_state):
+    """A PipelinedDeck for this run, or None when PIPELINED_GENERATION is off."""
+    if not pipeline.PIPELINED_GENERATION:
+        return None
+    return pipeline.PipelinedDeck(agent_graph.deck_image_mode(initial_state))
+
+def finish_pipelined_deck(deck, ppt_data, deck_id):
+    """Saves a PipelinedDeck as presentation_<deck id>.pptx (on disk or in the deck store) and returns its filename."""
+    filename = new_deck_filename(deck_id)
+    if deck_store is not None:
+        buffer = deck_store.new_buffer()
+        deck.finish(ppt_data, output=buffer)
+        deck_store.put(filename, buffer)
+        return filename
+
+    deck.finish(ppt_data, filename=artifact_store.new_path(filename))
+    artifact_store.add(filename)
+    return filename
+
+def deck_available(filename):
+    """Whether a rendered deck can still be downloaded."""
+    if deck_store is not None:
+        return filename in deck_store
+    return filename in artifact_store
+
+def run_pipeline(initial_state, timings=None):
+    """
+    Runs the graph and renders the result. Returns the deck filename.
+    If a `timings` dict is given, it receives the graph and render durations in seconds.
+    """
+    timings = {} if timings is None else timings
+    deck = new_pipelined_deck(initial_state)
+    # The deck graph checkpoints the run under the deck id, so single slides can be edited later
+    deck_id = new_deck_id()
+    config = revisions.deck_config(deck_id)
 
     try:
         # 1. Invoke LangGraph Workflow
-        initial_state = {
-            "topic": topic,
-            "include_images": include_images,
-            "image_mode": image_mode,
-            "num_slides": num_slides,
-            "tone": tone,
-            "audience": audience,
-            "additional_instructions": additional_instructions,
-            "outline": [],
-            "slides": []
-        }
-        
-        result = graph.invoke(initial_state)
-        json_content = result.get("final_output")
-        
-        if not json_content:
+        start = time.time()
+        if deck is None:
+            result = agent_graph.get_deck_graph().invoke(initial_state, config=config)
+            ppt_data = result.get("final_output")
+        else:
+            # Stream instead, so slides are rendered and images fetched while the LLM writes
+            ppt_data = None
+            stream = agent_graph.get_deck_graph().stream(initial_state, config=config,
+                                                         stream_mode=agent_graph.stream_modes())
+            for mode, update in stream:
+                deck.observe(mode, update)
+                ppt_data = final_output(mode, update) or ppt_data
+        timings["graph"] = round(time.time() - start, 3)
+
+        if not ppt_data:
              raise ValueError("Graph failed to produce output")
 
-        ppt_data = json.loads(json_content)
-        
         # 2. Create Presentation Locally
-        filename = f"presentation_{os.urandom(4).hex()}.pptx"
-        output_path = ppt_utils.create_ppt(ppt_data, filename=filename, image_mode=image_mode if include_images else None)
+        start = time.time()
+        if deck is None:
+            filename = render_deck(ppt_data, initial_state, new_deck_filename(deck_id))
+        else:
+            filename = finish_pipelined_deck(deck, ppt_data, deck_id)
+        timings["render"] = round(time.time() - start, 3)
+        revisions.remember_file(deck_id, filename)
+        return filename
+    finally:
+        if deck is not None:
+            deck.close()
+
+def final_output(mode, update):
+    """The aggregator's final_output (a deck.Deck) from a graph.stream item, if this is that item."""
+    if mode != "updates":
+        return None
+    for values in update.values():
+        if values and "final_output" in values:
+            return values["final_output"]
+    return None
+
+# --- Deck Cache ---
+# Identical requests share one in-flight run and reuse the finished file until cleanup removes it
+deck_cache = DeckCache(is_valid=deck_available)
+
+def generate_deck(data, timings=None):
+    """
+    Returns (filename, source) for a request body, where source is "cache", "shared" or "created".
+    Send "fresh": true (or "bypass_cache": true) to skip the deck and LLM caches and get a new variation.
+    """
+    initial_state = build_initial_state(data)
+    return deck_cache.get_or_create(
+        request_key(initial_state),
+        lambda: run_pipeline(initial_state, timings),
+        fresh=initial_state["bypass_cache"]
+    )
+
+# --- Background Jobs ---
+def run_job(payload, timings):
+    filename, source = generate_deck(payload, timings)
+    return {"filename": filename, "deckId": requester_deck_id(filename, source != "created")}
+
+def run_batch_job(payload, timings):
+    start = time.time()
+    manifest = batch.generate_batch(payload["decks"], save=save_deck_bytes, renderer=renderer)
+    timings["batch"] = round(time.time() - start, 2)
+    return {"decks": manifest}
+
+job_manager = jobs.JobManager(handler=run_job)
+# Batches have their own queue and workers, so a few large batches cannot hold up single-deck jobs
+batch_job_manager = jobs.JobManager(handler=run_batch_job, workers=batch.BATCH_JOB_WORKERS)
+
+# --- Startup ---
+# Importing this module starts nothing. warmup() does the expensive one-off work and is safe before a
+# fork (gunicorn --preload); start_services() starts the threads and worker processes of one server
+# process and runs on its first request if nothing called it earlier (e.g. a gunicorn post_fork hook).
+# Render workers are spawned and re-import this file as __mp_main__; they never call either.
+
+def warmup():
+    """Imports LangGraph, compiles the graph and builds the deck skeleton. Starts no threads, processes or connections."""
+    start = time.time()
+    agent_graph.get_graph()
+    ppt_utils.skeleton_bytes()
+    metrics.log(f"Warm-up finished in {time.time() - start:.2f}s")
+
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_services():
+    """Starts the job workers, render pool and artifact expiry thread for this process. Idempotent."""
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+
+    if artifact_store is not None:
+        artifact_store.start()
+    renderer.start(wait=False)
+    job_manager.start()
+    batch_job_manager.start()
+
+@app.before_request
+def ensure_services():
+    if not _services_started:
+        start_services()
+
+@app.route("/generate_ppt", methods=["POST"])
+def generate_ppt():
+    data = request.get_json()
+    initial_state = build_initial_state(data)
+
+    if not initial_state["topic"]:
+        return jsonify({"error": "Topic is required"}), 400
+
+    try:
+        filename, source = generate_deck(data)
 
         # 3. Return the Download URL
         download_url = url_for('download_file', filename=filename)
         
         return jsonify({
             "message": "Presentation created successfully",
-            "downloadUrl": download_url
+            "downloadUrl": download_url,
+            "deckId": requester_deck_id(filename, source != "created"),
+            "cached": source != "created"
         })
 
-    except json.JSONDecodeError:
-        return jsonify({"error": "Failed to generate valid JSON content from AI"}), 500
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+# --- Streaming Generation (Server-Sent Events) ---
+def sse_event(event, payload):
+    """Formats one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def node_events(node, update):
+    """Translates one graph.stream update into (event, payload) pairs for the client."""
+    if node == "planner" and update.get("sections"):
+        # A large deck: its outline follows from outline_collector
+        yield "sections", {"title": update.get("presentation_title"),
+                           "sections": [{"title": s["title"], "num_slides": s["num_slides"]} for s in update["sections"]]}
+    elif node == "planner":
+        yield "outline", {"title": update.get("presentation_title"), "outline": update.get("outline", [])}
+    elif node == "outline_collector":
+        yield "outline", {"outline": update.get("outline", [])}
+    elif node in ("slide_writer", "chunk_writer"):
+        for draft in update.get("slide_drafts", []):
+            yield "slide", {"index": draft["index"], "slide": draft["slide"].to_dict()}
+    elif node == "writer":
+        for i, slide in enumerate(update.get("slides", [])):
+            yield "slide", {"index": i, "slide": slide.to_dict()}
+    elif node in ("collector", "stream_writer"):
+        # The streaming writer's slides were already sent one by one from the custom stream
+        yield "slides_ready", {"count": len(update.get("slides", []))}
+    elif node == "refiner":
+        yield "refine", {"pass": update.get("retry_count", 0),
+                         "slides": [slide.to_dict() for slide in update.get("slides", [])]}
+
+def run_streaming_pipeline(initial_state, publish):
+    """Runs the graph and renderer, passing (event, payload) progress pairs to `publish`. Returns the deck filename."""
+    deck = new_pipelined_deck(initial_state)
+    deck_id = new_deck_id()
+    try:
+        ppt_data = None
+        # "custom" carries slides from the streaming writer as soon as each one is parsed
+        stream = agent_graph.get_deck_graph().stream(initial_state, config=revisions.deck_config(deck_id),
+                                                     stream_mode=agent_graph.stream_modes())
+        for mode, update in stream:
+            if deck is not None:
+                deck.observe(mode, update)
+            if mode == "custom":
+                if update.get("event") == "slide":
+                    publish(("slide", {"index": update["index"], "slide": update["slide"].to_dict()}))
+                continue
+
+            for node, values in update.items():
+                if not values:
+                    continue
+                for event in node_events(node, values):
+                    publish(event)
+                if "final_output" in values:
+                    ppt_data = values["final_output"]
+
+        if not ppt_data:
+            raise ValueError("Graph failed to produce output")
+
+        publish(("render_started", {"slides": len(ppt_data.slides)}))
+        if deck is None:
+            filename = render_deck(ppt_data, initial_state, new_deck_filename(deck_id))
+        else:
+            filename = finish_pipelined_deck(deck, ppt_data, deck_id)
+        revisions.remember_file(deck_id, filename)
+        return filename
+    finally:
+        if deck is not None:
+            deck.close()
+
+def stream_deck(cache_key, call, initial_state):
+    """Worker thread of a streamed generation: leads the shared call that followers subscribe to."""
+    try:
+        deck_cache.lead(cache_key, call, lambda: run_streaming_pipeline(initial_state, call.publish))
+    except Exception:
+        # The subscribers get the error from the call's ("error", message) event
+        import traceback
+        traceback.print_exc()
+
+@app.route("/generate_ppt/stream", methods=["POST"])
+def generate_ppt_stream():
+    data = request.get_json()
+    initial_state = build_initial_state(data)
+
+    if not initial_state["topic"]:
+        return jsonify({"error": "Topic is required"}), 400
+
+    events = queue.Queue()
+    cache_key = request_key(initial_state)
+    # A cached deck arrives as its done event; a request identical to one in flight follows that run's events
+    call, leader = deck_cache.subscribe(cache_key, events.put, fresh=initial_state["bypass_cache"])
+    if leader:
+        # Run in a copy of the request context so the worker logs under the same trace id
+        worker = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(stream_deck, cache_key, call, initial_state), daemon=True)
+        worker.start()
+
+    def stream():
+        yield sse_event("started", {"topic": initial_state["topic"], "num_slides": initial_state["num_slides"]})
+        try:
+            while True:
+                try:
+                    event, payload = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment frame keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event == "done":
+                    yield sse_event("done", {
+                        "message": "Presentation created successfully",
+                        "downloadUrl": url_for('download_file', filename=payload),
+                        "deckId": requester_deck_id(payload, shared=not leader)
+                    })
+                    return
+                if event == "error":
+                    yield sse_event("error", {"error": payload})
+                    return
+                yield sse_event(event, payload)
+        finally:
+            # The client may have left; the run itself goes on
+            if call is not None:
+                call.unsubscribe(events.put)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    data = request.get_json()
+    initial_state = build_initial_state(data)
+
+    if not initial_state["topic"]:
+        return jsonify({"error": "Topic is required"}), 400
+
+    try:
+        job = job_manager.submit(data)
+    except jobs.QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "10"}
+
+    return jsonify({
+        "jobId": job["id"],
+        "status": job["status"],
+        "statusUrl": url_for('job_status', job_id=job["id"])
+    }), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    manager = job_manager
+    job = job_manager.get(job_id)
+    if not job:
+        manager = batch_job_manager
+        job = batch_job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = {
+        "jobId": job["id"],
+        "status": job["status"],
+        "timings": job["timings"],
+        "queueDepth": manager.queue_depth()
+    }
+    if job["status"] == "succeeded" and manager is batch_job_manager:
+        manifest = job["result"]["decks"]
+        response["decks"] = [
+            {**entry, "downloadUrl": url_for('download_file', filename=entry["filename"]) if entry["filename"] else None}
+            for entry in manifest
+        ]
+        response["succeeded"] = sum(1 for entry in manifest if entry["status"] == "succeeded")
+        response["failed"] = sum(1 for entry in manifest if entry["status"] == "failed")
+        response["zipUrl"] = url_for('batch_zip', job_id=job["id"])
+    elif job["status"] == "succeeded":
+        response["downloadUrl"] = url_for('download_file', filename=job["result"]["filename"])
+        response["deckId"] = job["result"]["deckId"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return jsonify(response)
+
+# --- Slide Editing ---
+# Edits rerun the checkpointed graph for the affected slides only (revisions.py) and re-render
+# just those slides on top of the deck's last rendering. One edit per deck at a time.
+# A fixed set of striped locks, so there is no per-deck entry to clean up; two decks rarely share one
+DECK_LOCK_STRIPES = 64
+_deck_locks = [threading.Lock() for _ in range(DECK_LOCK_STRIPES)]
+
+def deck_lock(deck_id):
+    return _deck_locks[hash(deck_id) % DECK_LOCK_STRIPES]
+
+def deck_response(deck_id, state, ppt_data, filename, changed=None):
+    response = {
+        "deckId": deck_id,
+        "title": ppt_data.title,
+        "slides": [slide.to_dict() for slide in ppt_data.slides],
+        "downloadUrl": url_for('download_file', filename=filename) if filename else None
+    }
+    if changed is not None:
+        response["changed"] = changed
+    return jsonify(response)
+
+def revise_and_render(deck_id, **changes):
+    """Applies one edit (see revisions.revise_deck) and returns the JSON response for it."""
+    try:
+        with deck_lock(deck_id):
+            state, ppt_data, changed = revisions.revise_deck(deck_id, **changes)
+            filename = state.get("deck_file")
+            if changed or not (filename and deck_available(filename)):
+                previous = filename if filename and deck_available(filename) else None
+                filename = render_deck(ppt_data, state, new_deck_filename(deck_id, revision=True),
+                                       previous=previous, changed=changed)
+                revisions.remember_file(deck_id, filename)
+    except revisions.DeckNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return deck_response(deck_id, state, ppt_data, filename, changed)
+
+@app.route("/decks/<deck_id>")
+def get_deck(deck_id):
+    try:
+        state = revisions.load_deck(deck_id)
+    except revisions.DeckNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    filename = state.get("deck_file")
+    available = filename if filename and deck_available(filename) else None
+    return deck_response(deck_id, state, state["final_output"], available)
+
+@app.route("/decks/<deck_id>/slides/<int:index>/regenerate", methods=["POST"])
+def regenerate_slide(deck_id, index):
+    """Body (optional): {"instructions": "..."} to steer the new version."""
+    data = request.get_json(silent=True) or {}
+    return revise_and_render(deck_id, rewrite=[{"index": index, "instructions": data.get("instructions", "")}])
+
+@app.route("/decks/<deck_id>/slides/<int:index>", methods=["PATCH"])
+def edit_slide(deck_id, index):
+    """Body: {"slide": {"heading", "content", ...}} to replace it by hand, or {"instructions": "..."} to have it rewritten."""
+    data = request.get_json(silent=True) or {}
+    if isinstance(data.get("slide"), dict):
+        return revise_and_render(deck_id, replace={index: data["slide"]})
+    if data.get("instructions"):
+        return revise_and_render(deck_id, rewrite=[{"index": index, "instructions": data["instructions"]}])
+    return jsonify({"error": "Send a slide object or instructions"}), 400
+
+@app.route("/decks/<deck_id>/slides", methods=["POST"])
+def append_slides(deck_id):
+    """Body: {"slides": [{"heading": "...", "instructions": "..."}, ...]} or a single {"heading", "instructions"}."""
+    data = request.get_json(silent=True) or {}
+    items = data.get("slides") or ([data] if data.get("heading") else [])
+    if not items or any(not isinstance(item, dict) or not item.get("heading") for item in items):
+        return jsonify({"error": "Every new slide needs a heading"}), 400
+    return revise_and_render(deck_id, append=items)
+
+# --- Batch Generation ---
+def write_batch_zip(manifest):
+    """
+    Packs the manifest's decks plus a manifest.json into a spooled zip and returns it rewound.
+    Decks that have expired since the batch finished are left out.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+    # .pptx files are already deflated, so they are stored as-is
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for entry in manifest:
+            if not entry["filename"] or not deck_available(entry["filename"]):
+                continue
+            arcname = f"{entry['index'] + 1:03d}_{entry['filename']}"
+            if deck_store is not None:
+                archive.writestr(arcname, b"".join(deck_store.stream(entry["filename"])))
+            else:
+                archive.write(artifact_store.path_for(entry["filename"]), arcname)
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    buffer.seek(0)
+    return buffer
+
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    """
+    Body: {"decks": [<generate_ppt body>, ...], "defaults": {...}}. `defaults` are merged under every deck spec.
+    Enqueues the batch and returns 202; `GET /jobs/<id>` reports the manifest once it has finished.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    defaults = data.get("defaults") or {}
+    decks = data.get("decks")
+
+    if not isinstance(decks, list) or not decks:
+        return jsonify({"error": "decks must be a non-empty list"}), 400
+    if not isinstance(defaults, dict) or any(not isinstance(spec, dict) for spec in decks):
+        return jsonify({"error": "defaults and every deck must be JSON objects"}), 400
+    specs = [{**defaults, **spec} for spec in decks]
+    if any(not spec.get("topic") for spec in specs):
+        return jsonify({"error": "Every deck needs a topic"}), 400
+    if len(specs) > batch.BATCH_MAX_DECKS:
+        return jsonify({"error": f"A batch can hold at most {batch.BATCH_MAX_DECKS} decks"}), 400
+
+    try:
+        job = batch_job_manager.submit({"decks": specs})
+    except jobs.QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "10"}
+
+    return jsonify({
+        "jobId": job["id"],
+        "status": job["status"],
+        "statusUrl": url_for('job_status', job_id=job["id"])
+    }), 202
+
+@app.route("/jobs/<job_id>/decks.zip")
+def batch_zip(job_id):
+    job = batch_job_manager.get(job_id)
+    if not job or job["status"] != "succeeded":
+        return jsonify({"error": "No finished batch with this id"}), 404
+    return send_file(write_batch_zip(job["result"]["decks"]), mimetype="application/zip", as_attachment=True,
+                     download_name="decks.zip")
+
 @app.route('/download/<filename>')
 def download_file(filename):
-    # Determine the path. 
-    # Current implementation of create_ppt saves to current working directory or absolute path.
-    # ppt_utils.create_ppt saves to os.path.abspath(filename) if we passed just filename.
-    # So valid check if file exists in current dir.
-    # SECURITY NOTE: In production, sanitize filename to prevent directory traversal.
-    file_path = os.path.abspath(filename)
-    if os.path.exists(file_path):
+    # Only names known to the store resolve, so no path from the URL ever reaches the filesystem.
+    if deck_store is not None:
+        size = deck_store.size(filename)
+        if size is None:
+            return "File not found", 404
+        return Response(deck_store.stream(filename), mimetype=PPTX_MIMETYPE, headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(size)
+        })
+
+    file_path = artifact_store.path_for(filename)
+    if file_path:
         return send_file(file_path, as_attachment=True)
     else:
         return "File not found", 404
 
 if __name__ == "__main__":
+    # The debug reloader also runs this file in a watcher process that never serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warmup()
+        start_services()
     app.run(debug=True)
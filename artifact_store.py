@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import time
+import heapq
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from metrics import log
+
+# --- Settings ---
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_decks"))
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "3600"))
+ARTIFACT_QUOTA_BYTES = int(os.getenv("ARTIFACT_QUOTA_BYTES", str(500 * 1024 * 1024)))
+
+INDEX_FILENAME = "index.json"
+SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+class ArtifactStore:
+    """
+    Disk store for rendered decks with exact TTL expiry and a total size quota.
+    - An in-memory heap orders entries by expiry; a background thread sleeps until the next
+      one is due, so expiry work grows with the number of expired files, never with directory size.
+    - Past `quota_bytes`, the least recently downloaded decks are evicted first.
+    - The index is persisted as a small JSON file so a restart picks up where it left off.
+    - Several processes (gunicorn workers) can share the directory: a name missing from this process's index
+      is looked up on disk and adopted, and saving the index keeps the other processes' entries.
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, ttl=ARTIFACT_TTL_SECONDS, quota_bytes=ARTIFACT_QUOTA_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self._entries = OrderedDict()   # name -> {"size", "expires_at"}, least recently used first
+        self._heap = []                 # (expires_at, name); stale items are skipped lazily
+        self._dropped = set()           # names removed since the index was last saved
+        self._total_bytes = 0
+        self._cond = threading.Condition()
+        self._expiry_thread = None
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def start(self):
+        """Starts the expiry thread. Kept out of __init__ so the store can be created before a fork."""
+        with self._cond:
+            if self._expiry_thread is None:
+                self._expiry_thread = threading.Thread(target=self._expiry_loop, name="artifact-expiry", daemon=True)
+                self._expiry_thread.start()
+
+    # --- Index ---
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _load_index(self):
+        for name, entry in self._read_index():
+            if SAFE_NAME.match(name) and os.path.exists(os.path.join(self.directory, name)):
+                self._index(name, entry)
+        # Files the saved index lost (e.g. to another process's concurrent save) still get expired
+        with os.scandir(self.directory) as files:
+            for file in files:
+                if file.name not in self._entries:
+                    self._adopt(file.name)
+
+    def _save_index(self):
+        """Writes the index, keeping the live entries other processes saved for files this one does not know."""
+        now = time.time()
+        others = [(name, entry) for name, entry in self._read_index()
+                  if name not in self._entries and name not in self._dropped and entry["expires_at"] > now]
+        self._dropped.clear()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(others + list(self._entries.items()), f)
+        os.replace(tmp_path, self._index_path())
+
+    def _index(self, name, entry):
+        self._entries[name] = entry
+        self._total_bytes += entry["size"]
+        heapq.heappush(self._heap, (entry["expires_at"], name))
+
+    def _adopt(self, name):
+        """
+        Indexes a file written by another process, expiring `ttl` after it was last modified.
+        Returns its entry, or None if there is no such file. Caller holds the lock (or is __init__).
+        """
+        if not SAFE_NAME.match(name) or name == INDEX_FILENAME:
+            return None
+        try:
+            info = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        entry = {"size": info.st_size, "expires_at": info.st_mtime + self.ttl}
+        self._index(name, entry)
+        return entry
+
+    # --- Public API ---
+
+    def new_path(self, name):
+        """Path to write a new artifact to; call add(name) once it is complete."""
+        if not SAFE_NAME.match(name) or name == INDEX_FILENAME:
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        return os.path.join(self.directory, name)
+
+    def add(self, name):
+        """Registers a file written to new_path(name) and enforces the quota."""
+        size = os.path.getsize(self.new_path(name))
+        expires_at = time.time() + self.ttl
+        with self._cond:
+            previous = self._entries.pop(name, None)
+            if previous:
+                self._total_bytes -= previous["size"]
+            self._index(name, {"size": size, "expires_at": expires_at})
+
+            while self._total_bytes > self.quota_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                log(f"Artifact quota exceeded, evicting {oldest}")
+                self._remove(oldest)
+
+            self._save_index()
+            self._cond.notify()
+
+    def path_for(self, name):
+        """
+        Returns the file path for a live artifact, or None. Only indexed names and files adopted from disk
+        (see _adopt) resolve, so lookups cannot escape the directory.
+        """
+        with self._cond:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._adopt(name)
+                if entry is not None:
+                    # An expired file is adopted too, so the expiry thread removes it
+                    self._cond.notify()
+            if entry is None or entry["expires_at"] <= time.time():
+                return None
+            self._entries.move_to_end(name)
+        return os.path.join(self.directory, name)
+
+    def __contains__(self, name):
+        return self.path_for(name) is not None
+
+    # --- Expiry & Eviction ---
+
+    def _remove(self, name):
+        entry = self._entries.pop(name)
+        self._total_bytes -= entry["size"]
+        self._dropped.add(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass    # Another process sharing the directory removed it first
+        except OSError as e:
+            log(f"Error deleting {name}: {e}")
+
+    def _expiry_loop(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                removed = False
+                while self._heap and self._heap[0][0] <= now:
+                    expires_at, name = heapq.heappop(self._heap)
+                    entry = self._entries.get(name)
+                    # Skip heap items left behind by re-adds or quota evictions
+                    if entry is not None and entry["expires_at"] == expires_at:
+                        self._remove(name)
+                        removed = True
+                if removed:
+                    self._save_index()
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
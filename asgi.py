@@ -0,0 +1,255 @@
+import asyncio
+import functools
+import traceback
+import contextlib
+from urllib.parse import quote
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from a2wsgi import WSGIMiddleware
+import app as flask_app
+import agent_graph
+import image_cache
+import metrics
+import pipeline
+import revisions
+from agent_graph import build_initial_state
+from deck_cache import request_key
+
+# --- Async Server ---
+# `uvicorn asgi:app` serves deck generation from one event loop. A deck that is waiting on the model holds
+# a coroutine, not a thread, so one process can keep hundreds of generations in flight (LLM_MAX_CONCURRENCY
+# still bounds the model calls). The graph runs its async nodes (agent_graph.get_async_deck_graph), images
+# come over the async HTTP client, and create_ppt runs in the render pool while the loop awaits it.
+# Every other route is app.py's Flask app, served from a2wsgi's thread pool.
+
+# Runs that outlive their request (a stream whose client left); kept referenced until they finish
+_background_tasks = set()
+
+def background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def traced(endpoint):
+    """app.py's trace hooks for a Starlette endpoint: reuse an upstream X-Request-ID and echo it back."""
+    async def handler(request):
+        trace_id = metrics.set_trace_id(request.headers.get("X-Request-ID"))
+        response = await endpoint(request)
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    return handler
+
+async def request_data(request):
+    """The request's JSON object, or None when the body is not one."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def download_url(request, filename):
+    # app.py's download route, under whatever prefix the server is mounted at
+    return f"{request.scope.get('root_path', '')}/download/{quote(filename)}"
+
+def new_image_prefetch(initial_state):
+    """A pipeline.ImagePrefetch for this run, or None when PIPELINED_GENERATION is off or images are not fetched."""
+    if not pipeline.PIPELINED_GENERATION or agent_graph.deck_image_mode(initial_state) != "auto":
+        return None
+    return pipeline.ImagePrefetch()
+
+async def render_deck(ppt_data, state, filename):
+    """app.render_deck for a new deck. The loop only awaits: the render runs in the render pool."""
+    image_mode = agent_graph.deck_image_mode(state)
+    if flask_app.deck_store is not None:
+        deck_bytes = await flask_app.renderer.arender(ppt_data, image_mode)
+        return await asyncio.to_thread(flask_app.save_deck_bytes, deck_bytes, filename)
+
+    await flask_app.renderer.arender(ppt_data, image_mode, path=flask_app.artifact_store.new_path(filename))
+    # add() stats the file and may evict older ones: disk work, kept off the loop
+    await asyncio.to_thread(flask_app.artifact_store.add, filename)
+    return filename
+
+async def finish_deck(ppt_data, initial_state, deck_id, prefetch=None):
+    """Renders the graph's output as presentation_<deck id>.pptx and records it in the deck's checkpoint."""
+    if not ppt_data:
+        raise ValueError("Graph failed to produce output")
+    if prefetch is not None:
+        await prefetch.wait()
+    filename = await render_deck(ppt_data, initial_state, flask_app.new_deck_filename(deck_id))
+    await revisions.aremember_file(deck_id, filename)
+    return filename
+
+async def requester_deck_id(filename, shared):
+    """app.requester_deck_id through the async deck graph."""
+    deck_id = flask_app.deck_id_for(filename)
+    if not shared:
+        return deck_id
+    copy_id = flask_app.new_deck_id()
+    try:
+        await revisions.acopy_deck(deck_id, filename, copy_id)
+    except revisions.DeckNotFound:
+        return deck_id
+    return copy_id
+
+async def run_pipeline(initial_state):
+    """app.run_pipeline on the event loop. Returns the deck filename."""
+    deck_id = flask_app.new_deck_id()
+    config = revisions.deck_config(deck_id)
+    graph = await agent_graph.get_async_deck_graph()
+    prefetch = new_image_prefetch(initial_state)
+    try:
+        if prefetch is None:
+            result = await graph.ainvoke(initial_state, config=config)
+            ppt_data = result.get("final_output")
+        else:
+            # Stream instead, so images are fetched while the LLM writes
+            ppt_data = None
+            async for mode, update in graph.astream(initial_state, config=config,
+                                                    stream_mode=agent_graph.stream_modes()):
+                prefetch.observe(mode, update)
+                ppt_data = flask_app.final_output(mode, update) or ppt_data
+        return await finish_deck(ppt_data, initial_state, deck_id, prefetch)
+    finally:
+        if prefetch is not None:
+            prefetch.close()
+
+async def generate_ppt(request):
+    data = await request_data(request)
+    if data is None:
+        return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+    initial_state = build_initial_state(data)
+
+    if not initial_state["topic"]:
+        return JSONResponse({"error": "Topic is required"}, status_code=400)
+
+    try:
+        filename, source = await flask_app.deck_cache.aget_or_create(
+            request_key(initial_state),
+            lambda: run_pipeline(initial_state),
+            fresh=initial_state["bypass_cache"]
+        )
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    return JSONResponse({
+        "message": "Presentation created successfully",
+        "downloadUrl": download_url(request, filename),
+        "deckId": await requester_deck_id(filename, source != "created"),
+        "cached": source != "created"
+    })
+
+# --- Streaming Generation (Server-Sent Events) ---
+async def run_streaming_pipeline(initial_state, publish):
+    """app.run_streaming_pipeline on the event loop. Returns the deck filename."""
+    deck_id = flask_app.new_deck_id()
+    prefetch = new_image_prefetch(initial_state)
+    try:
+        graph = await agent_graph.get_async_deck_graph()
+        ppt_data = None
+        stream = graph.astream(initial_state, config=revisions.deck_config(deck_id),
+                               stream_mode=agent_graph.stream_modes())
+        async for mode, update in stream:
+            if prefetch is not None:
+                prefetch.observe(mode, update)
+            if mode == "custom":
+                if update.get("event") == "slide":
+                    publish(("slide", {"index": update["index"], "slide": update["slide"].to_dict()}))
+                continue
+
+            for node, values in update.items():
+                if not values:
+                    continue
+                for event in flask_app.node_events(node, values):
+                    publish(event)
+                if "final_output" in values:
+                    ppt_data = values["final_output"]
+
+        if ppt_data:
+            publish(("render_started", {"slides": len(ppt_data.slides)}))
+        return await finish_deck(ppt_data, initial_state, deck_id, prefetch)
+    finally:
+        if prefetch is not None:
+            prefetch.close()
+
+async def stream_deck(cache_key, call, initial_state):
+    """app.stream_deck as a task on the event loop."""
+    try:
+        await flask_app.deck_cache.alead(cache_key, call, lambda: run_streaming_pipeline(initial_state, call.publish))
+    except Exception:
+        traceback.print_exc()
+
+async def generate_ppt_stream(request):
+    data = await request_data(request)
+    if data is None:
+        return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+    initial_state = build_initial_state(data)
+
+    if not initial_state["topic"]:
+        return JSONResponse({"error": "Topic is required"}, status_code=400)
+
+    events = asyncio.Queue()
+    cache_key = request_key(initial_state)
+    # The call may be led from a Flask worker thread, so events are handed to this loop thread-safely
+    listener = functools.partial(asyncio.get_running_loop().call_soon_threadsafe, events.put_nowait)
+    call, leader = flask_app.deck_cache.subscribe(cache_key, listener, fresh=initial_state["bypass_cache"])
+    if leader:
+        # Not tied to the connection: like app.py's worker thread, the deck is still finished and cached if the client leaves
+        background(stream_deck(cache_key, call, initial_state))
+
+    async def stream():
+        yield flask_app.sse_event("started", {"topic": initial_state["topic"], "num_slides": initial_state["num_slides"]})
+        getter = None
+        try:
+            while True:
+                # One pending get() across heartbeats, so an event that arrives during a timeout is not lost
+                getter = getter or asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait([getter], timeout=flask_app.SSE_HEARTBEAT_SECONDS)
+                if not done:
+                    # Comment frame keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                event, payload = getter.result()
+                getter = None
+
+                if event == "done":
+                    yield flask_app.sse_event("done", {
+                        "message": "Presentation created successfully",
+                        "downloadUrl": download_url(request, payload),
+                        "deckId": await requester_deck_id(payload, shared=not leader)
+                    })
+                    return
+                if event == "error":
+                    yield flask_app.sse_event("error", {"error": payload})
+                    return
+                yield flask_app.sse_event(event, payload)
+        finally:
+            if getter is not None:
+                getter.cancel()
+            if call is not None:
+                call.unsubscribe(listener)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# --- Startup ---
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    flask_app.warmup()
+    flask_app.start_services()
+    await agent_graph.get_async_deck_graph()
+    try:
+        yield
+    finally:
+        await image_cache.fetcher.aclose()
+        await agent_graph.close_async_deck_graph()
+
+app = Starlette(routes=[
+    Route("/generate_ppt", traced(generate_ppt), methods=["POST"]),
+    Route("/generate_ppt/stream", traced(generate_ppt_stream), methods=["POST"]),
+    Mount("/", app=WSGIMiddleware(flask_app.app)),
+], lifespan=lifespan)
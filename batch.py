@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+import llm_scheduler
+from render_pool import RenderExecutor
+import agent_graph
+from agent_graph import GRAPH_CALLBACKS, build_initial_state
+from deck_cache import request_key
+from artifact_store import ARTIFACT_DIR
+from metrics import log
+
+# --- Settings ---
+BATCH_MAX_DECKS = int(os.getenv("BATCH_MAX_DECKS", "200"))
+# Batch jobs run at once per server process; their decks still share BATCH_GRAPH_CONCURRENCY
+BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", "2"))
+# Decks whose LLM stages run at once, across all batches; per-slide writer calls are further bounded by WRITER_MAX_CONCURRENCY
+BATCH_GRAPH_CONCURRENCY = int(os.getenv("BATCH_GRAPH_CONCURRENCY", "8"))
+# Where generate_batch() writes decks without a `save`; must not be inside ARTIFACT_DIR (see save_to_directory)
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "batch_decks")
+
+# Bounds the batch graph runs in flight for the whole process, however many batches are running
+graph_semaphore = threading.BoundedSemaphore(BATCH_GRAPH_CONCURRENCY)
+
+def plan_deck(initial_state):
+    """
+    Runs the graph for one deck and returns its deck.Deck. Waits for one of the BATCH_GRAPH_CONCURRENCY slots;
+    its model calls queue behind interactive ones.
+    """
+    with graph_semaphore, llm_scheduler.lane("batch"):
+        result = agent_graph.get_graph().invoke(initial_state, config={"callbacks": GRAPH_CALLBACKS})
+    if not result.get("final_output"):
+        raise ValueError("Graph failed to produce output")
+    return result["final_output"]
+
+def save_to_directory(directory):
+    """
+    Returns a save(deck_bytes) function that writes decks into `directory` and returns their paths.
+    Raises ValueError for a directory inside ARTIFACT_DIR: the artifact store would expire decks saved there
+    (or, in a subdirectory, never expire them). Save through app.save_deck_bytes to put batch decks in the store.
+    """
+    artifacts = os.path.realpath(ARTIFACT_DIR)
+    if os.path.commonpath([os.path.realpath(directory), artifacts]) == artifacts:
+        raise ValueError(f"Batch decks cannot be written into the artifact directory ({ARTIFACT_DIR})")
+    os.makedirs(directory, exist_ok=True)
+
+    def save(deck_bytes):
+        path = os.path.join(directory, f"presentation_{os.urandom(4).hex()}.pptx")
+        with open(path, "wb") as f:
+            f.write(deck_bytes)
+        return path
+    return save
+
+def generate_batch(specs, save=None, graph_concurrency=BATCH_GRAPH_CONCURRENCY, renderer=None):
+    """
+    Generates one deck per spec (a /generate_ppt request body).
+    - Decks run on `graph_concurrency` threads. Each thread plans its deck (at most BATCH_GRAPH_CONCURRENCY
+      graphs run at once across all batches), then hands it to the render executor's worker processes,
+      so python-pptx rendering is not serialized by the GIL.
+    - Identical specs (same deck cache key) are planned and rendered once and share the result.
+    - `save(deck_bytes)` stores a rendered deck and returns its name; by default decks are written
+      to BATCH_OUTPUT_DIR and the name is the file path.
+    - `renderer` is a started RenderExecutor to share; without one a pool is created for this batch.
+    Returns a manifest with one {"index", "topic", "status", "filename", "error"} entry per spec, in order.
+    """
+    if len(specs) > BATCH_MAX_DECKS:
+        raise ValueError(f"A batch can hold at most {BATCH_MAX_DECKS} decks, got {len(specs)}")
+    save = save or save_to_directory(BATCH_OUTPUT_DIR)
+    own_renderer = renderer is None
+    renderer = renderer or RenderExecutor()
+
+    states = [build_initial_state(spec) for spec in specs]
+    groups = {}     # cache key -> indices of the specs that share it
+    for i, state in enumerate(states):
+        groups.setdefault(request_key(state), []).append(i)
+
+    start = time.time()
+    log(f"--- [Batch] {len(states)} decks ({len(groups)} unique), {graph_concurrency} graph threads, "
+        f"{renderer.workers} render workers ---")
+
+    def produce(state):
+        ppt_data = plan_deck(state)
+        return save(renderer.render(ppt_data, agent_graph.deck_image_mode(state)))
+
+    outcomes = {}   # cache key -> (filename, error)
+    try:
+        with ThreadPoolExecutor(max_workers=graph_concurrency) as graph_pool:
+            futures = {
+                graph_pool.submit(contextvars.copy_context().run, produce, states[indices[0]]): key
+                for key, indices in groups.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    outcomes[key] = (future.result(), None)
+                except Exception as e:
+                    log(f"Batch: '{states[groups[key][0]]['topic']}' failed: {e}")
+                    outcomes[key] = (None, str(e))
+    finally:
+        if own_renderer:
+            renderer.shutdown()
+
+    manifest = []
+    for i, state in enumerate(states):
+        filename, error = outcomes[request_key(state)]
+        manifest.append({
+            "index": i,
+            "topic": state["topic"],
+            "status": "failed" if error else "succeeded",
+            "filename": filename,
+            "error": error
+        })
+
+    failed = sum(1 for entry in manifest if entry["error"])
+    metrics.BATCH_DECKS.inc(len(manifest) - failed, status="succeeded")
+    metrics.BATCH_DECKS.inc(failed, status="failed")
+    log(f"--- [Batch] Finished {len(manifest)} decks in {time.time() - start:.1f}s ({failed} failed) ---")
+    return manifest
@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for the deck pipeline.
+
+Runs fully offline: a deterministic fake chat model stands in for Gemini and a local
+HTTP server stands in for the image host. See `python -m benchmarks --help`.
+"""
@@ -0,0 +1,83 @@
+"""
+Runs the benchmark scenarios and writes machine-readable results.
+
+    python -m benchmarks                                  # all scenarios, print JSON
+    python -m benchmarks -s graph_invoke_5 -s extract_json
+    python -m benchmarks -o results.json                  # save for later comparison
+    python -m benchmarks --compare baseline.json          # exit 1 on regressions
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from benchmarks.scenarios import SCENARIOS
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold):
+    """Prints per-metric changes; returns the list of time/memory metrics that regressed beyond `threshold`."""
+    regressions = []
+    for name, metrics in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for key, value in metrics.items():
+            old = before.get(key)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not old:
+                continue
+            change = (value - old) / old
+            lower_is_better = key.endswith(("_ms", "_us", "_kb", "_bytes"))
+            flag = ""
+            if lower_is_better and change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{key}")
+            print(f"{name:<24}{key:<22}{old:>12}{value:>12}{change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable); default: all")
+    parser.add_argument("-o", "--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown that counts as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        fn, options = SCENARIOS[name]
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = fn(**options)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+class FakeRateLimitError(Exception):
+    """What the fake raises instead of answering when it is over its quota, like an HTTP 429."""
+    status_code = 429
+
+class FakeChatModel:
+    """
+    Deterministic stand-in for ChatGoogleGenerativeAI.
+    Recognizes the planner, writer, slide writer and refiner prompts and answers with
+    plausible JSON after `latency` seconds (+/- `jitter`). The same prompt always gets the
+    same answer, except that `fail_rate` of the calls (picked at random) return unparseable text.
+    stream() spreads the same latency over `chunk_chars`-sized chunks, like token streaming.
+    ainvoke() and astream() behave the same but wait with asyncio.sleep, like an async client.
+    Structured output:
+    - With response_mime_type="application/json" (JSON mode) replies are bare JSON and never fail to parse.
+    - `invalid_rate` of the slides break the slide schema in either mode; the repair prompt for such
+      a slide gets a valid one back.
+    Server behaviour:
+    - More than `max_concurrency` calls in flight get FakeRateLimitError (429) after `reject_latency`.
+    - `slow_rate` of the calls (picked at random, not by prompt) take `slow_factor` times longer.
+    - Replies longer than `max_reply_chars` are cut off there, like a reply that hits the output token limit.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, fail_rate=0.0, bullets_per_slide=4, words_per_bullet=10, seed=0,
+                 chunk_chars=40, max_concurrency=None, reject_latency=0.01, slow_rate=0.0, slow_factor=5.0,
+                 invalid_rate=0.0, max_reply_chars=None):
+        self.model = "fake-chat-model"
+        self.temperature = 0.0
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.bullets_per_slide = bullets_per_slide
+        self.words_per_bullet = words_per_bullet
+        self.seed = seed
+        self.chunk_chars = chunk_chars
+        self.max_concurrency = max_concurrency
+        self.reject_latency = reject_latency
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.invalid_rate = invalid_rate
+        self.max_reply_chars = max_reply_chars
+        self.calls = 0
+        self.prompt_chars = 0
+        self.longest_reply = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._tail_rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt):
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _slide(self, rng, heading, valid=False):
+        words = ["growth", "strategy", "customers", "platform", "quality", "delivery", "insight",
+                 "efficiency", "teams", "market", "risk", "value", "design", "data", "impact"]
+        content = []
+        for i in range(self.bullets_per_slide):
+            text = " ".join(rng.choice(words) for _ in range(self.words_per_bullet)).capitalize()
+            content.append({"text": text, "level": 0 if i % 2 == 0 else 1})
+        slide = {"heading": heading, "content": content, "image_search_query": f"{heading} illustration"}
+        if self.invalid_rate and not valid and rng.random() < self.invalid_rate:
+            # Typical schema slips: a bullet without text, or a level that is not a number
+            if rng.random() < 0.5:
+                slide["content"][0] = {"level": 0}
+            else:
+                slide["content"][-1]["level"] = "sub-point"
+        return slide
+
+    def _repair(self, prompt, rng):
+        item = json.loads(re.search(r"Invalid \w+:\s*(\{.*\})\s*Return ONLY", prompt, re.S).group(1))
+        if "outline" in item:
+            return {"title": item.get("title") or "Untitled", "outline": item["outline"]}
+        return self._slide(rng, item.get("heading", "Slide"), valid=True)
+
+    def _respond(self, prompt, rng):
+        if "does not match the required schema" in prompt:
+            return "```json\n" + json.dumps(self._repair(prompt, rng)) + "\n```"
+
+        match = re.search(r"Split a (\d+)-slide", prompt)
+        if match:
+            num_slides = int(match.group(1))
+            topic = re.search(r'Topic: "(.*?)"', prompt).group(1)
+            count = -(-num_slides // int(re.search(r"into about (\d+) sections", prompt).group(1)))
+            sizes = [min(count, num_slides - start) for start in range(0, num_slides, count)]
+            sections = [{"title": f"{topic} section {i + 1}", "num_slides": size} for i, size in enumerate(sizes)]
+            return "```json\n" + json.dumps({"title": f"{topic} Overview", "sections": sections}) + "\n```"
+
+        match = re.search(r'Generate the (\d+) slide titles for section \d+: "(.*?)"', prompt)
+        if match:
+            outline = [f"{match.group(2)} part {i + 1}" for i in range(int(match.group(1)))]
+            return "```json\n" + json.dumps({"outline": outline}) + "\n```"
+
+        if "presentation planner" in prompt:
+            num_slides = int(re.search(r"Generate a (\d+)-slide", prompt).group(1))
+            topic = re.search(r'Topic: "(.*?)"', prompt).group(1)
+            outline = [f"{topic} part {i + 1}" for i in range(num_slides)]
+            return "```json\n" + json.dumps({"title": f"{topic} Overview", "outline": outline}) + "\n```"
+
+        match = re.search(r'Write the detailed content for slide \d+: "(.*?)"', prompt)
+        if match:
+            return "```json\n" + json.dumps(self._slide(rng, match.group(1))) + "\n```"
+
+        if "professional editor" in prompt:
+            slides = json.loads(re.search(r"Slides to Fix \(Indices: .*?\):\s*(\[.*\])\s*Return", prompt, re.S).group(1))
+            for slide in slides:
+                slide["content"] = slide.get("content", [])[:max(1, len(slide.get("content", [])) // 2)]
+            return "```json\n" + json.dumps(slides) + "\n```"
+
+        if "Slides to Write:" in prompt:
+            # Chunk writer: one window of a section
+            section = prompt.split("Slides to Write:")[1].split("Task:")[0]
+            headings = re.findall(r"^\s*- (.+?)\s*$", section, re.M)
+            return "```json\n" + json.dumps([self._slide(rng, h) for h in headings]) + "\n```"
+
+        if "Outline:" in prompt:
+            # Single-call writer; the outline is joined with a literal "\n"
+            section = prompt.split("Outline:")[1].split("Task:")[0].replace("\\n", "\n")
+            headings = re.findall(r"^\s*- (.+?)\s*$", section, re.M)
+            return "```json\n" + json.dumps([self._slide(rng, h) for h in headings]) + "\n```"
+
+        return "{}"
+
+    def _try_admit(self):
+        """Counts a call in flight; False when over max_concurrency."""
+        with self._lock:
+            if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _admit(self):
+        """Counts a call in flight, or raises FakeRateLimitError when over max_concurrency."""
+        if not self._try_admit():
+            time.sleep(self.reject_latency)
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: too many concurrent requests")
+
+    async def _aadmit(self):
+        if not self._try_admit():
+            await asyncio.sleep(self.reject_latency)
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: too many concurrent requests")
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reply(self, prompt, json_mode=False):
+        """Returns (content, latency) for a prompt."""
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            slow = self._tail_rng.random() < self.slow_rate
+            failed = bool(self.fail_rate) and self._tail_rng.random() < self.fail_rate
+        rng = self._rng(prompt)
+        latency = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        if slow:
+            latency *= self.slow_factor
+
+        content = self._respond(prompt, rng)
+        with self._lock:
+            self.longest_reply = max(self.longest_reply, len(content))
+        if self.max_reply_chars is not None:
+            content = content[:self.max_reply_chars]
+        if json_mode:
+            return content.removeprefix("```json\n").removesuffix("\n```"), latency
+        if failed:
+            return "Sorry, I could not produce JSON for that.", latency
+        return content, latency
+
+    def stream(self, prompt, config=None, **kwargs):
+        self._admit()
+        try:
+            content, latency = self._reply(prompt, kwargs.get("response_mime_type") == "application/json")
+            pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+            for piece in pieces:
+                time.sleep(latency / len(pieces))
+                yield AIMessageChunk(content=piece)
+        finally:
+            self._done()
+
+    def invoke(self, prompt, config=None, **kwargs):
+        self._admit()
+        try:
+            content, latency = self._reply(prompt, kwargs.get("response_mime_type") == "application/json")
+            time.sleep(latency)
+        finally:
+            self._done()
+        return self._message(prompt, content)
+
+    async def astream(self, prompt, config=None, **kwargs):
+        await self._aadmit()
+        try:
+            content, latency = self._reply(prompt, kwargs.get("response_mime_type") == "application/json")
+            pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+            for piece in pieces:
+                await asyncio.sleep(latency / len(pieces))
+                yield AIMessageChunk(content=piece)
+        finally:
+            self._done()
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        await self._aadmit()
+        try:
+            content, latency = self._reply(prompt, kwargs.get("response_mime_type") == "application/json")
+            await asyncio.sleep(latency)
+        finally:
+            self._done()
+        return self._message(prompt, content)
+
+    def _message(self, prompt, content):
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        })
@@ -0,0 +1,105 @@
+import io
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+class LocalImageServer:
+    """
+    Stand-in for the placehold.co image host, served from a background thread.
+    GET /<width>x<height>?text=... returns a PNG with an ETag and honors If-None-Match.
+    `latency` delays every response. `size` ("WxH") overrides the requested dimensions, and
+    `detail` serves noisy images that compress like photographs instead of flat colour.
+
+        with LocalImageServer(latency=0.05) as server:
+            fetcher = ImageFetcher(base_url=server.url, ...)
+    """
+
+    def __init__(self, latency=0.0, size=None, detail=False):
+        self.latency = latency
+        self.size = size
+        self.detail = detail
+        self.requests = 0
+        self.not_modified = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _image(self, size, text):
+        key = (size, text)
+        with self._lock:
+            if key not in self._images:
+                width, height = (int(v) for v in size.split("x"))
+                shade = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:6], 16)
+                color = ((shade >> 16) & 0xFF, (shade >> 8) & 0xFF, shade & 0xFF)
+                image = Image.new("RGB", (width, height), color)
+                if self.detail:
+                    noise = Image.effect_noise((width, height), 48)
+                    image = Image.blend(image, Image.merge("RGB", (noise, noise, noise)), 0.35)
+                buffer = io.BytesIO()
+                image.save(buffer, "PNG")
+                data = buffer.getvalue()
+                self._images[key] = (data, '"%s"' % hashlib.sha1(data).hexdigest())
+            return self._images[key]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                parsed = urlparse(self.path)
+                size = server.size or parsed.path.strip("/") or "800x600"
+                text = parse_qs(parsed.query).get("text", [""])[0]
+                try:
+                    data, etag = server._image(size, text)
+                except ValueError:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,103 @@
+"""
+Per-deck create_ppt render time for 5, 20 and 50 slides.
+
+    python benchmarks/render_bench.py                  # current tree
+    python benchmarks/render_bench.py --rev baseline   # compare with ppt_utils from another git revision
+
+Images are off so only python-pptx work is timed.
+"""
+import io
+import os
+import sys
+import json
+import time
+import tarfile
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLIDE_COUNTS = (5, 20, 50)
+
+def sample_deck(num_slides):
+    return {
+        "title": "Benchmark Deck",
+        "slides": [
+            {
+                "heading": f"Slide {i + 1}: Key Findings",
+                "content": [
+                    {"text": "Revenue grew steadily across all regions this quarter", "level": 0},
+                    {"text": "Strongest growth in the enterprise segment", "level": 1},
+                    {"text": "Operating costs held flat year over year", "level": 0},
+                    {"text": "Hiring focused on engineering and support", "level": 1},
+                    {"text": "Outlook remains positive for the next two quarters", "level": 0}
+                ]
+            }
+            for i in range(num_slides)
+        ]
+    }
+
+def run_worker(source_dir, repeats):
+    """Times create_ppt from `source_dir` and prints one JSON result line per slide count."""
+    sys.path.insert(0, source_dir)
+    import ppt_utils
+
+    out_dir = tempfile.mkdtemp()
+    ppt_utils.create_ppt(sample_deck(1), filename=os.path.join(out_dir, "warmup.pptx"))
+
+    for num_slides in SLIDE_COUNTS:
+        data = sample_deck(num_slides)
+        path = os.path.join(out_dir, f"deck_{num_slides}.pptx")
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ppt_utils.create_ppt(data, filename=path)
+            timings.append(time.perf_counter() - start)
+        print(json.dumps({
+            "slides": num_slides,
+            "median_ms": round(statistics.median(timings) * 1000, 2),
+            "min_ms": round(min(timings) * 1000, 2),
+            "file_bytes": os.path.getsize(path)
+        }))
+
+def measure(source_dir, repeats):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", source_dir, "--repeats", str(repeats)],
+        cwd=source_dir, capture_output=True, text=True, check=True
+    ).stdout
+    return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+def export_revision(rev):
+    """Extracts the tracked files of `rev` into a temporary directory."""
+    target = tempfile.mkdtemp(prefix="render_bench_")
+    archive = subprocess.run(["git", "archive", "--format=tar", rev], cwd=REPO_ROOT,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return target
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rev", help="git revision to compare against (e.g. HEAD~1)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeats)
+        return
+
+    variants = [("current", REPO_ROOT)]
+    if args.rev:
+        variants.insert(0, (args.rev, export_revision(args.rev)))
+
+    results = {name: measure(path, args.repeats) for name, path in variants}
+
+    print(f"{'variant':<12}{'slides':>8}{'median ms':>12}{'min ms':>10}{'bytes':>10}")
+    for name, rows in results.items():
+        for row in rows:
+            print(f"{name:<12}{row['slides']:>8}{row['median_ms']:>12}{row['min_ms']:>10}{row['file_bytes']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+import os
+import gc
+import sys
+import json
+import time
+import tempfile
+import statistics
+import tracemalloc
+
+# Offline defaults; must be set before agent_graph / image_cache are imported
+os.environ.setdefault("LLM_CACHE_DISABLED", "1")
+os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="bench_images_"))
+
+from benchmarks.fake_llm import FakeChatModel
+from benchmarks.image_server import LocalImageServer
+
+def _timed(fn, repeats):
+    """Runs fn() `repeats` times; returns a dict of median/min/max milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3)
+    }
+
+def _initial_state(num_slides, include_images=False, image_mode="auto"):
+    return {
+        "topic": "Benchmarking",
+        "include_images": include_images,
+        "image_mode": image_mode,
+        "num_slides": num_slides,
+        "tone": "Professional",
+        "audience": "Engineers",
+        "additional_instructions": "",
+        "outline": [],
+        "slides": []
+    }
+
+def _sample_deck(num_slides):
+    fake = FakeChatModel(latency=0)
+    slides = [fake._slide(fake._rng(str(i)), f"Slide {i + 1}") for i in range(num_slides)]
+    return {"title": "Benchmark Deck", "slides": slides}
+
+def _use_image_server(server):
+    """Points the shared image fetcher at `server` with an empty cache."""
+    import image_cache
+    image_cache.fetcher = image_cache.ImageFetcher(base_url=server.url, cache_dir=tempfile.mkdtemp(prefix="bench_images_"))
+
+# --- Scenarios ---
+# Each takes keyword options and returns a flat dict of metrics.
+
+def graph_invoke(num_slides=10, llm_latency=0.2, repeats=3):
+    """End-to-end graph.invoke latency with the fake chat model."""
+    import agent_graph
+
+    fake = FakeChatModel(latency=llm_latency)
+    agent_graph.llm = fake
+    result = _timed(lambda: agent_graph.graph.invoke(_initial_state(num_slides)), repeats)
+    result["llm_calls_per_deck"] = round(fake.calls / repeats, 2)
+    return result
+
+def create_ppt_throughput(num_slides=20, image_mode=None, repeats=3):
+    """create_ppt wall time per deck; with image_mode="auto" images come from the local server (cold cache each run)."""
+    import ppt_utils
+
+    data = _sample_deck(num_slides)
+    out_dir = tempfile.mkdtemp(prefix="bench_decks_")
+    path = os.path.join(out_dir, "deck.pptx")
+
+    with LocalImageServer() as server:
+        def render():
+            _use_image_server(server)
+            ppt_utils.create_ppt(data, filename=path, image_mode=image_mode)
+
+        render()  # warm-up (skeleton, imports)
+        result = _timed(render, repeats)
+
+    result["decks_per_second"] = round(1000 / result["median_ms"], 2)
+    result["file_bytes"] = os.path.getsize(path)
+    return result
+
+def extract_json_cost(num_slides=30, repeats=200):
+    """extract_json cost on fenced, bare and noisy model outputs for a deck of `num_slides`."""
+    import agent_graph
+
+    slides = json.dumps(_sample_deck(num_slides)["slides"])
+    inputs = {
+        "fenced": f"Here is the deck:\n```json\n{slides}\n```\nHope this helps!",
+        "bare": slides,
+        "noisy": "Sure! {draft} " + slides + " Let me know if you want changes."
+    }
+    result = {}
+    for name, text in inputs.items():
+        timing = _timed(lambda: agent_graph.extract_json(text), repeats)
+        result[f"{name}_median_us"] = round(timing["median_ms"] * 1000, 1)
+        result[f"{name}_parsed"] = agent_graph.extract_json(text) is not None
+    result["input_bytes"] = len(slides)
+    return result
+
+def stream_parse_cost(sizes=(30, 120), chunk_chars=40, repeats=20):
+    """json_stream.ArrayObjectParser cost over replies fed in `chunk_chars` pieces; us per KB should stay flat."""
+    import json_stream
+
+    result = {}
+    for num_slides in sizes:
+        text = "```json\n" + json.dumps(_sample_deck(num_slides)["slides"]) + "\n```"
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+        def parse():
+            parser = json_stream.ArrayObjectParser()
+            for chunk in chunks:
+                parser.feed(chunk)
+
+        timing = _timed(parse, repeats)
+        result[f"slides_{num_slides}_median_ms"] = timing["median_ms"]
+        result[f"slides_{num_slides}_us_per_kb"] = round(timing["median_ms"] * 1000 / (len(text) / 1024), 1)
+    return result
+
+def peak_memory(num_slides=30, image_mode="auto"):
+    """Peak traced Python memory for one graph run plus render."""
+    import agent_graph
+    import ppt_utils
+
+    agent_graph.llm = FakeChatModel(latency=0)
+    out_dir = tempfile.mkdtemp(prefix="bench_decks_")
+
+    with LocalImageServer() as server:
+        _use_image_server(server)
+        gc.collect()
+        tracemalloc.start()
+        state = agent_graph.graph.invoke(_initial_state(num_slides, include_images=True, image_mode=image_mode))
+        graph_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        ppt_utils.create_ppt(state["final_output"], filename=os.path.join(out_dir, "deck.pptx"),
+                             image_mode=image_mode)
+        render_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"graph_peak_kb": round(graph_peak / 1024, 1), "render_peak_kb": round(render_peak / 1024, 1)}
+
+def deck_state_memory(num_slides=200, repeats=3):
+    """
+    Memory the finished graph state holds for a large text deck (traced KB and allocated blocks),
+    the graph's peak, and the time to hand its final_output to create_ppt.
+    """
+    import agent_graph
+    import ppt_utils
+    from deck import as_deck
+
+    agent_graph.llm = FakeChatModel(latency=0, bullets_per_slide=5)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_decks_"), "deck.pptx")
+    agent_graph.graph.invoke(_initial_state(2))
+
+    gc.collect()
+    tracemalloc.start()
+    start_kb = tracemalloc.get_traced_memory()[0]
+    state = agent_graph.graph.invoke(_initial_state(num_slides))
+    graph_peak = tracemalloc.get_traced_memory()[1] - start_kb
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - start_kb
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.reset_peak()
+    ppt_utils.create_ppt(state["final_output"], filename=path)
+    render_peak = tracemalloc.get_traced_memory()[1] - start_kb
+    tracemalloc.stop()
+
+    # What create_ppt needs from the final state; formerly a json.loads of the whole deck
+    handoff = _timed(lambda: as_deck(state["final_output"]), repeats)
+    return {
+        "graph_peak_kb": round(graph_peak / 1024, 1),
+        "state_retained_kb": round(retained / 1024, 1),
+        "state_blocks": blocks,
+        "render_peak_kb": round(render_peak / 1024, 1),
+        "handoff_median_ms": handoff["median_ms"]
+    }
+
+def large_deck_generation(num_slides=200, max_reply_chars=16000, llm_latency=0.01):
+    """
+    Slides with content, model calls, prompt size and longest reply for one deck of `num_slides`, when replies
+    are cut off after `max_reply_chars` (the model's output limit). "single" is one planner and one writer
+    call, "parallel" one writer call per slide with the whole outline in each prompt, "chunked" the
+    large-deck mode: sections planned separately and written in windows.
+    """
+    import agent_graph
+
+    modes = {"single": ("batch", num_slides), "parallel": ("parallel", num_slides),
+             "chunked": ("parallel", agent_graph.LARGE_DECK_SLIDES)}
+    saved = agent_graph.WRITER_MODE, agent_graph.LARGE_DECK_SLIDES
+    result = {}
+    try:
+        for name, (writer_mode, large_deck_slides) in modes.items():
+            agent_graph.WRITER_MODE, agent_graph.LARGE_DECK_SLIDES = writer_mode, large_deck_slides
+            fake = FakeChatModel(latency=llm_latency, max_reply_chars=max_reply_chars)
+            agent_graph.llm = fake
+            start = time.perf_counter()
+            slides = agent_graph.graph.invoke(_initial_state(num_slides, include_images=True))["final_output"].slides
+            result[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            result[f"{name}_slides_with_content"] = sum(1 for slide in slides if slide.content)
+            result[f"{name}_llm_calls"] = fake.calls
+            result[f"{name}_prompt_kb"] = round(fake.prompt_chars / 1024, 1)
+            result[f"{name}_longest_reply_kb"] = round(fake.longest_reply / 1024, 1)
+    finally:
+        agent_graph.WRITER_MODE, agent_graph.LARGE_DECK_SLIDES = saved
+    return result
+
+def _clear_prepared_images():
+    import ppt_utils
+    with ppt_utils._prepared_lock:
+        ppt_utils._prepared_images.clear()
+        ppt_utils._prepared_bytes = 0
+
+def large_deck_render(sizes=(20, 80, 200), image_size="640x480"):
+    """
+    Peak traced memory of create_ppt with a photo-like image on every slide, for each deck size in `sizes`,
+    rendered in one pass ("unchunked") and in RENDER_CHUNK_SLIDES chunks. Every image is generated by the
+    local server before tracing starts, and each render starts with cold image caches.
+    """
+    import ppt_utils
+
+    out_dir = tempfile.mkdtemp(prefix="bench_decks_")
+    saved = ppt_utils.RENDER_CHUNK_SLIDES
+    result = {}
+    try:
+        with LocalImageServer(size=image_size, detail=True) as server:
+            _use_image_server(server)
+            ppt_utils.create_ppt(_sample_deck(max(sizes)), filename=os.path.join(out_dir, "warm.pptx"), image_mode="auto")
+            for num_slides in sizes:
+                for name, chunk_slides in (("unchunked", num_slides), ("chunked", saved)):
+                    ppt_utils.RENDER_CHUNK_SLIDES = chunk_slides
+                    _use_image_server(server)
+                    _clear_prepared_images()
+                    data = _sample_deck(num_slides)
+                    path = os.path.join(out_dir, "deck.pptx")
+                    gc.collect()
+                    tracemalloc.start()
+                    start_bytes = tracemalloc.get_traced_memory()[0]
+                    ppt_utils.create_ppt(data, filename=path, image_mode="auto")
+                    peak = tracemalloc.get_traced_memory()[1] - start_bytes
+                    tracemalloc.stop()
+                    result[f"{name}_{num_slides}_peak_kb"] = round(peak / 1024, 1)
+                result[f"deck_{num_slides}_kb"] = round(os.path.getsize(path) / 1024, 1)
+    finally:
+        ppt_utils.RENDER_CHUNK_SLIDES = saved
+    return result
+
+def pipelined_generation(num_slides=20, llm_latency=0.3, image_latency=0.2, repeats=3):
+    """
+    End-to-end deck latency with images: the graph alone, graph then create_ppt, and the same run
+    through pipeline.PipelinedDeck. The pipelined time should sit close to the graph alone.
+    """
+    import agent_graph
+    import pipeline
+    import ppt_utils
+
+    agent_graph.llm = FakeChatModel(latency=llm_latency)
+    config = {"callbacks": agent_graph.GRAPH_CALLBACKS}
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_decks_"), "deck.pptx")
+    state = lambda: _initial_state(num_slides, include_images=True)
+
+    def sequential():
+        result = agent_graph.graph.invoke(state(), config=config)
+        ppt_utils.create_ppt(result["final_output"], filename=path, image_mode="auto")
+
+    def pipelined():
+        deck = pipeline.PipelinedDeck("auto")
+        ppt_data = None
+        stream = agent_graph.graph.stream(state(), config=config, stream_mode=agent_graph.stream_modes())
+        for mode, update in stream:
+            deck.observe(mode, update)
+            if mode == "updates":
+                for values in update.values():
+                    ppt_data = (values or {}).get("final_output", ppt_data)
+        deck.finish(ppt_data, filename=path)
+
+    with LocalImageServer(latency=image_latency) as server:
+        def cold(fn):
+            # Every run starts with an empty image cache
+            return lambda: (_use_image_server(server), fn())
+
+        result = {"graph_median_ms": _timed(lambda: agent_graph.graph.invoke(state(), config=config), repeats)["median_ms"]}
+        result["sequential_median_ms"] = _timed(cold(sequential), repeats)["median_ms"]
+        result["pipelined_median_ms"] = _timed(cold(pipelined), repeats)["median_ms"]
+
+    result["pipelined_overhead_pct"] = round(100 * (result["pipelined_median_ms"] / result["graph_median_ms"] - 1), 1)
+    return result
+
+def image_embedding(num_slides=20, unique_images=5, size="2400x1800", repeats=3):
+    """
+    Deck size and save time with photo-sized images embedded as fetched versus prepared
+    (cropped, downscaled to IMAGE_EMBED_DPI and re-encoded). Slides reuse `unique_images` images.
+    """
+    import ppt_utils
+
+    data = _sample_deck(num_slides)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_decks_"), "deck.pptx")
+
+    with LocalImageServer(size=size, detail=True) as server:
+        _use_image_server(server)
+        raw = {}
+        for i in range(num_slides):
+            with open(ppt_utils.fetch_image(f"image {i % unique_images}"), "rb") as f:
+                raw[i] = f.read()
+
+    start = time.perf_counter()
+    prepared = {i: ppt_utils.prepare_image(image) for i, image in raw.items()}
+    result = {"prepare_per_image_ms": round((time.perf_counter() - start) * 1000 / unique_images, 3)}
+
+    for name, images in (("raw", raw), ("prepared", prepared)):
+        timings = []
+        for _ in range(repeats):
+            deck = ppt_utils.DeckBuilder(data["title"], "auto")
+            for i, slide in enumerate(data["slides"]):
+                deck.add_slide(i, slide)
+                deck.add_image(i, images[i])
+            start = time.perf_counter()
+            deck.save(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        result[f"{name}_save_median_ms"] = round(statistics.median(timings), 3)
+        result[f"{name}_file_kb"] = round(os.path.getsize(path) / 1024, 1)
+    return result
+
+def structured_output_cost(num_slides=20, decks=10, llm_latency=0.05, fail_rate=0.05, invalid_rate=0.1):
+    """
+    Model calls and unusable slides per deck when `fail_rate` of the replies are not JSON and `invalid_rate`
+    of the slides break the schema. "text" is free-text replies parsed by extract_json, with invalid
+    slides dropped instead of repaired; "structured" is JSON mode with per-slide repair.
+    """
+    import agent_graph
+    import structured_output
+
+    modes = {"text": (False, 0), "structured": (True, 1)}
+    saved = agent_graph.STRUCTURED_OUTPUT, agent_graph.STRUCTURED_REPAIR_ATTEMPTS
+    result = {}
+    try:
+        for name, (structured, repairs) in modes.items():
+            agent_graph.STRUCTURED_OUTPUT, agent_graph.STRUCTURED_REPAIR_ATTEMPTS = structured, repairs
+            fake = FakeChatModel(latency=llm_latency, fail_rate=fail_rate, invalid_rate=invalid_rate)
+            agent_graph.llm = fake
+            empty = invalid = 0
+            start = time.perf_counter()
+            for deck in range(decks):
+                state = {**_initial_state(num_slides), "topic": f"Benchmarking {deck}"}
+                slides = [slide.to_dict() for slide in agent_graph.graph.invoke(state)["final_output"].slides]
+                empty += sum(1 for slide in slides if not slide.get("content"))
+                invalid += sum(1 for slide in slides if slide.get("content")
+                               and structured_output.validate(structured_output.Slide, slide)[0] is None)
+            result[f"{name}_ms_per_deck"] = round((time.perf_counter() - start) * 1000 / decks, 1)
+            result[f"{name}_llm_calls_per_deck"] = round(fake.calls / decks, 2)
+            result[f"{name}_empty_slides"] = empty
+            result[f"{name}_invalid_slides"] = invalid
+    finally:
+        agent_graph.STRUCTURED_OUTPUT, agent_graph.STRUCTURED_REPAIR_ATTEMPTS = saved
+    return result
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def llm_burst(calls=48, server_concurrency=6, llm_latency=0.2):
+    """
+    A burst of `calls` concurrent model calls, half interactive and half batch, against a fake that
+    answers 429 above `server_concurrency` in-flight calls. The "naive" run retries like the client's
+    max_retries=3 with a fixed 0.1 s pause; the "scheduled" run goes through llm_scheduler.
+    """
+    import threading
+    import llm_scheduler
+    from benchmarks.fake_llm import FakeRateLimitError
+
+    def run(model, naive):
+        latencies = {"interactive": [], "batch": []}
+        failures = []
+
+        def one(i, lane_name):
+            start = time.perf_counter()
+            try:
+                with llm_scheduler.lane(lane_name):
+                    if not naive:
+                        model.invoke(f"Write the detailed content for slide {i}: \"Burst {i}\"")
+                        latencies[lane_name].append(time.perf_counter() - start)
+                        return
+                    for attempt in range(4):
+                        try:
+                            model.invoke(f"Write the detailed content for slide {i}: \"Burst {i}\"")
+                            latencies[lane_name].append(time.perf_counter() - start)
+                            return
+                        except FakeRateLimitError:
+                            if attempt == 3:
+                                raise
+                            time.sleep(0.1)
+            except FakeRateLimitError:
+                failures.append(i)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=one, args=(i, "batch" if i % 2 else "interactive")) for i in range(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, latencies, failures
+
+    result = {}
+    for name in ("naive", "scheduled"):
+        fake = FakeChatModel(latency=llm_latency, max_concurrency=server_concurrency)
+        model = fake if name == "naive" else llm_scheduler.ScheduledModel(
+            fake, llm_scheduler.LLMScheduler(requests_per_minute=0, tokens_per_minute=0), hedge=False)
+        wall, latencies, failures = run(model, naive=name == "naive")
+        result[f"{name}_wall_ms"] = round(wall * 1000, 1)
+        result[f"{name}_failed_calls"] = len(failures)
+        result[f"{name}_429s"] = fake.rejected
+        for lane_name, values in latencies.items():
+            if values:
+                result[f"{name}_{lane_name}_p50_ms"] = round(statistics.median(values) * 1000, 1)
+    return result
+
+def llm_hedging(calls=200, threads=8, llm_latency=0.05, slow_rate=0.05, slow_factor=10):
+    """Tail latency of model calls when `slow_rate` of them are `slow_factor` times slower, with and without hedging."""
+    from concurrent.futures import ThreadPoolExecutor
+    import llm_scheduler
+
+    result = {}
+    for name, hedge in (("unhedged", False), ("hedged", True)):
+        fake = FakeChatModel(latency=llm_latency, slow_rate=slow_rate, slow_factor=slow_factor)
+        model = llm_scheduler.ScheduledModel(
+            fake, llm_scheduler.LLMScheduler(requests_per_minute=0, tokens_per_minute=0), hedge=hedge)
+
+        def one(i):
+            start = time.perf_counter()
+            model.invoke(f"Write the detailed content for slide {i}: \"Hedge {i}\"")
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(one, range(calls)))
+        result[f"{name}_p50_ms"] = round(_percentile(latencies, 0.5) * 1000, 1)
+        result[f"{name}_p99_ms"] = round(_percentile(latencies, 0.99) * 1000, 1)
+        result[f"{name}_llm_calls"] = fake.calls
+    return result
+
+def concurrent_generation(decks=100, threads=16, num_slides=5, llm_latency=0.5):
+    """
+    Wall time and peak thread count for `decks` decks requested at once. "threaded" runs graph.invoke on a
+    pool of `threads` request threads, like the Flask server; "async" runs ainvoke on the async graph for
+    every deck at once, like asgi.py. The writer bound is lifted so only the server model differs.
+    """
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import agent_graph
+
+    peak = [0]
+    sampling = threading.Event()
+
+    def sample():
+        while not sampling.wait(0.01):
+            peak[0] = max(peak[0], threading.active_count())
+
+    def states():
+        return [{**_initial_state(num_slides), "topic": f"Concurrent {deck}"} for deck in range(decks)]
+
+    def threaded():
+        graph = agent_graph.build_graph()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(graph.invoke, states()))
+
+    async def run_async():
+        graph = agent_graph.build_graph(use_async=True)
+        await asyncio.gather(*(graph.ainvoke(state) for state in states()))
+
+    saved = agent_graph.WRITER_MAX_CONCURRENCY, agent_graph.writer_semaphore
+    agent_graph.WRITER_MAX_CONCURRENCY = decks * num_slides
+    agent_graph.writer_semaphore = threading.BoundedSemaphore(agent_graph.WRITER_MAX_CONCURRENCY)
+    result = {}
+    try:
+        for name, run in (("threaded", threaded), ("async", lambda: asyncio.run(run_async()))):
+            fake = FakeChatModel(latency=llm_latency)
+            agent_graph.llm = fake
+            peak[0] = threading.active_count()
+            sampling.clear()
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            start = time.perf_counter()
+            run()
+            result[f"{name}_wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            sampling.set()
+            sampler.join()
+            # Not counting the sampler itself
+            result[f"{name}_peak_threads"] = peak[0] - 1
+            result[f"{name}_llm_calls"] = fake.calls
+    finally:
+        agent_graph.WRITER_MAX_CONCURRENCY, agent_graph.writer_semaphore = saved
+    return result
+
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{warmup}
+print(json.dumps({{"import": imported - start, "warmup": time.perf_counter() - imported}}))
+"""
+
+def cold_start(module="app", warmup="app.warmup()", repeats=3):
+    """Import and warm-up time of `module` in a fresh interpreter (no API key, no network)."""
+    import subprocess
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    script = COLD_START_SCRIPT.format(module=module, warmup=warmup)
+
+    imports, warmups = [], []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", script], cwd=repo_root, env=env, capture_output=True,
+                             text=True, check=True).stdout
+        timing = json.loads(out.strip().splitlines()[-1])
+        imports.append(timing["import"] * 1000)
+        warmups.append(timing["warmup"] * 1000)
+
+    return {
+        "import_median_ms": round(statistics.median(imports), 1),
+        "warmup_median_ms": round(statistics.median(warmups), 1)
+    }
+
+# name -> (function, options)
+SCENARIOS = {
+    "graph_invoke_5": (graph_invoke, {"num_slides": 5}),
+    "graph_invoke_20": (graph_invoke, {"num_slides": 20}),
+    "create_ppt_5_text": (create_ppt_throughput, {"num_slides": 5}),
+    "create_ppt_20_text": (create_ppt_throughput, {"num_slides": 20}),
+    "create_ppt_50_text": (create_ppt_throughput, {"num_slides": 50}),
+    "create_ppt_20_images": (create_ppt_throughput, {"num_slides": 20, "image_mode": "auto"}),
+    "image_embedding_20": (image_embedding, {"num_slides": 20}),
+    "llm_burst_429": (llm_burst, {}),
+    "llm_hedging": (llm_hedging, {}),
+    "concurrent_generation_100": (concurrent_generation, {"decks": 100}),
+    "extract_json": (extract_json_cost, {}),
+    "structured_output_20": (structured_output_cost, {"num_slides": 20}),
+    "stream_parse": (stream_parse_cost, {}),
+    "peak_memory_30": (peak_memory, {"num_slides": 30}),
+    "deck_state_memory_200": (deck_state_memory, {"num_slides": 200}),
+    "large_deck_generation_200": (large_deck_generation, {"num_slides": 200}),
+    "large_deck_render": (large_deck_render, {}),
+    "pipelined_generation_20": (pipelined_generation, {"num_slides": 20}),
+    "cold_start_app": (cold_start, {}),
+    "cold_start_agent_graph": (cold_start, {"module": "agent_graph", "warmup": "agent_graph.get_graph()"}),
+}
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# --- Deck Model ---
+# What the graph state, the pipelined renderer and create_ppt pass around. The objects are immutable and
+# slotted, so a slide is shared, never copied, from the writer that made it to create_ppt, and each
+# bullet costs a small fixed-size object rather than a dict. Plain dicts only exist at the edges:
+# HTTP payloads, prompts and decks created by hand (see from_dict / to_dict).
+
+# Deepest bullet level; python-pptx allows 0-8, and the layouts only style 0-2
+MAX_BULLET_LEVEL = 4
+
+@dataclass(frozen=True, slots=True)
+class BulletItem:
+    text: str
+    level: int = 0
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            level = int(data.get("level", 0))
+        except (TypeError, ValueError):
+            level = 0
+        return cls(str(data.get("text", "")), min(max(level, 0), MAX_BULLET_LEVEL))
+
+    def to_dict(self):
+        return {"text": self.text, "level": self.level}
+
+@dataclass(frozen=True, slots=True)
+class Slide:
+    heading: str
+    content: Tuple[BulletItem, ...] = ()
+    image_search_query: Optional[str] = None
+
+    def __post_init__(self):
+        # Checkpoint deserialization hands sequences back as lists
+        if not isinstance(self.content, tuple):
+            object.__setattr__(self, "content", tuple(self.content))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a slide from its JSON form; the older {"bullet_points": [...]} form is accepted too."""
+        content = data.get("content") or [{"text": text} for text in data.get("bullet_points", [])]
+        return cls(
+            heading=str(data.get("heading") or ""),
+            content=tuple(item if isinstance(item, BulletItem) else BulletItem.from_dict(item) for item in content),
+            image_search_query=data.get("image_search_query")
+        )
+
+    def to_dict(self):
+        data = {"heading": self.heading, "content": [item.to_dict() for item in self.content]}
+        if self.image_search_query is not None:
+            data["image_search_query"] = self.image_search_query
+        return data
+
+    @property
+    def image_query(self):
+        """The image search for this slide; the heading when the writer gave no query."""
+        return self.image_search_query or self.heading
+
+@dataclass(frozen=True, slots=True)
+class Deck:
+    title: str
+    slides: Tuple[Slide, ...] = ()
+
+    def __post_init__(self):
+        if not isinstance(self.slides, tuple):
+            object.__setattr__(self, "slides", tuple(self.slides))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(str(data.get("title") or "Untitled Presentation"),
+                   tuple(as_slide(slide) for slide in data.get("slides", [])))
+
+    def to_dict(self):
+        return {"title": self.title, "slides": [slide.to_dict() for slide in self.slides]}
+
+def as_slide(value):
+    """A Slide from a Slide or its JSON form."""
+    return value if isinstance(value, Slide) else Slide.from_dict(value)
+
+def as_deck(value):
+    """A Deck from a Deck or its JSON form (a dict)."""
+    return value if isinstance(value, Deck) else Deck.from_dict(value)
+
+# Types the graph checkpointer may rebuild from its msgpack records (see agent_graph.get_deck_graph)
+CHECKPOINT_TYPES = [(__name__, cls.__name__) for cls in (BulletItem, Slide, Deck)]
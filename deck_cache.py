@@ -0,0 +1,240 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Settings ---
+DECK_CACHE_MAX_ENTRIES = int(os.getenv("DECK_CACHE_MAX_ENTRIES", "128"))
+
+def request_key(initial_state):
+    """
+    Normalizes the user-facing generation settings into a stable cache key.
+    Case and surrounding whitespace do not change the key; image_mode only counts when images are on.
+    """
+    def norm(value):
+        return " ".join(str(value or "").split()).casefold()
+
+    include_images = bool(initial_state.get("include_images"))
+    normalized = [
+        norm(initial_state.get("topic")),
+        int(initial_state.get("num_slides", 5)),
+        norm(initial_state.get("tone")),
+        norm(initial_state.get("audience")),
+        norm(initial_state.get("additional_instructions")),
+        include_images,
+        norm(initial_state.get("image_mode")) if include_images else None
+    ]
+    return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+class _Call:
+    """
+    One in-flight computation that followers (threads or coroutines) can wait on.
+    The leader can also publish progress events; subscribers get the ones so far and then each new one,
+    ending with ("done", result) or ("error", message) when the call finishes.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self._waiters = []      # (event loop, future) of waiting coroutines
+        self._events = []
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, item):
+        with self._lock:
+            self._publish(item)
+
+    def _publish(self, item):
+        # Delivered under the lock, so a new subscriber's replay cannot interleave with a live event
+        self._events.append(item)
+        for listener in self._listeners:
+            listener(item)
+
+    def subscribe(self, listener):
+        """Calls `listener(item)` with every event published so far and every later one. It must not block."""
+        with self._lock:
+            for item in self._events:
+                listener(item)
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def finish(self):
+        with self._lock:
+            self.done.set()
+            waiters, self._waiters = self._waiters, []
+            self._publish(("error", str(self.error)) if self.error is not None else ("done", self.result))
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait(self):
+        """done.wait() for coroutines."""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if self.done.is_set():
+                return
+            self._waiters.append((future.get_loop(), future))
+        await future
+
+    def outcome(self):
+        """The finished call's result; raises its error if it failed."""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+class DeckCache:
+    """
+    Bounded LRU cache of finished decks plus single-flight deduplication.
+    Concurrent requests for the same key share one computation; later requests
+    get the cached result as long as `is_valid(result)` still holds (e.g. the file exists).
+    """
+
+    def __init__(self, is_valid, max_entries=DECK_CACHE_MAX_ENTRIES):
+        self.is_valid = is_valid
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        result = self._entries.get(key)
+        if result is None:
+            return None
+        if not self.is_valid(result):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._put(key, result)
+
+    def _put(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _join(self, key):
+        """
+        (cached result, None, False) on a hit. Otherwise (None, the in-flight call for `key`, whether this caller
+        leads it): a leader computes the result and must _retire() the call, followers wait for it.
+        """
+        with self._lock:
+            result = self._lookup(key)
+            if result is not None:
+                return result, None, False
+
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            return None, call, leader
+
+    def _retire(self, key, call):
+        with self._lock:
+            # A fresh call was never registered
+            if self._inflight.get(key) is call:
+                del self._inflight[key]
+        call.finish()
+
+    def subscribe(self, key, listener, fresh=False):
+        """
+        Passes a deck's progress events to `listener` (see _Call), ending with ("done", result) or ("error", message).
+        - A cached result goes straight to it: returns (None, False).
+        - An in-flight call for `key` replays its events so far, then forwards the rest: returns (call, False).
+        - Otherwise returns (call, True): the caller leads a new call and must run it with lead() or alead(),
+          publishing its progress through call.publish. With `fresh`, that call is not shared.
+        Unsubscribe with call.unsubscribe(listener) if the events are no longer wanted.
+        """
+        if fresh:
+            call = _Call()
+            call.subscribe(listener)
+            return call, True
+
+        with self._lock:
+            result = self._lookup(key)
+            if result is None:
+                call = self._inflight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._inflight[key] = _Call()
+                call.subscribe(listener)
+                return call, leader
+        listener(("done", result))
+        return None, False
+
+    def lead(self, key, call, create):
+        """Computes the result of a call this caller leads with create(), caches it and returns it."""
+        try:
+            call.result = create()
+            self.put(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._retire(key, call)
+
+    async def alead(self, key, call, create):
+        """lead() for coroutines: `create` is a coroutine function."""
+        try:
+            call.result = await create()
+            self.put(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except asyncio.CancelledError:
+            call.error = RuntimeError("The shared deck generation was cancelled")
+            raise
+        finally:
+            self._retire(key, call)
+
+    def get_or_create(self, key, create, fresh=False):
+        """
+        Returns (result, source) where source is "cache", "shared" or "created".
+        With `fresh`, the cache and any in-flight call are skipped and the new result replaces the cached one.
+        """
+        if fresh:
+            result = create()
+            self.put(key, result)
+            return result, "created"
+
+        result, call, leader = self._join(key)
+        if result is not None:
+            return result, "cache"
+        if not leader:
+            call.done.wait()
+            return call.outcome(), "shared"
+        return self.lead(key, call, create), "created"
+
+    async def aget_or_create(self, key, create, fresh=False):
+        """
+        get_or_create() for coroutines: `create` is a coroutine function, and followers wait without
+        blocking the event loop. In-flight calls are shared with get_or_create() callers.
+        """
+        if fresh:
+            result = await create()
+            self.put(key, result)
+            return result, "created"
+
+        result, call, leader = self._join(key)
+        if result is not None:
+            return result, "cache"
+        if not leader:
+            await call.wait()
+            return call.outcome(), "shared"
+        return await self.alead(key, call, create), "created"
@@ -0,0 +1,81 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+# --- Settings ---
+DECK_STORE_MAX_ENTRIES = int(os.getenv("DECK_STORE_MAX_ENTRIES", "200"))
+DECK_STORE_TTL_SECONDS = int(os.getenv("DECK_STORE_TTL_SECONDS", "3600"))
+# Decks larger than this spill from memory into an anonymous temporary file
+DECK_SPOOL_MAX_MEMORY = int(os.getenv("DECK_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+
+PPTX_MIMETYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+class DeckStore:
+    """
+    Bounded in-memory store of rendered decks, keyed by filename.
+    Each deck lives in a SpooledTemporaryFile, so small decks never touch disk and large ones
+    spill to an unlinked temp file. Entries expire after `ttl` seconds and the oldest are
+    dropped past `max_entries`; both checks only look at the front of the queue.
+    """
+
+    def __init__(self, max_entries=DECK_STORE_MAX_ENTRIES, ttl=DECK_STORE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # name -> (buffer, size, expires_at, lock), oldest first
+        self._lock = threading.Lock()
+
+    def new_buffer(self):
+        """Returns a writable buffer for create_ppt(output=...)."""
+        return tempfile.SpooledTemporaryFile(max_size=DECK_SPOOL_MAX_MEMORY)
+
+    def put(self, name, buffer):
+        """Stores a rendered deck under `name`. The store takes ownership of `buffer`."""
+        buffer.seek(0, os.SEEK_END)
+        size = buffer.tell()
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous:
+                previous[0].close()
+            self._entries[name] = (buffer, size, time.time() + self.ttl, threading.Lock())
+            self._prune()
+
+    def _prune(self):
+        now = time.time()
+        while self._entries:
+            name, (buffer, _, expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[name]
+            buffer.close()
+
+    def __contains__(self, name):
+        with self._lock:
+            self._prune()
+            return name in self._entries
+
+    def size(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry[1] if entry else None
+
+    def stream(self, name, chunk_size=64 * 1024):
+        """Yields the deck's bytes in chunks. Concurrent readers of one deck each keep their own offset."""
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return
+
+        buffer, size, _, entry_lock = entry
+        offset = 0
+        while offset < size:
+            with entry_lock:
+                if buffer.closed:
+                    return
+                buffer.seek(offset)
+                chunk = buffer.read(min(chunk_size, size - offset))
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+import weakref
+import urllib.parse
+from collections import OrderedDict, namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+from metrics import log
+
+# --- Settings ---
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "https://placehold.co")
+IMAGE_SIZE = os.getenv("IMAGE_SIZE", "800x600")
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", "5"))
+IMAGE_POOL_SIZE = int(os.getenv("IMAGE_POOL_SIZE", "10"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "content_creator_images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+IMAGE_CACHE_FRESH_SECONDS = int(os.getenv("IMAGE_CACHE_FRESH_SECONDS", str(24 * 3600)))
+IMAGE_NEGATIVE_TTL = int(os.getenv("IMAGE_NEGATIVE_TTL", "600"))
+IMAGE_NEGATIVE_MAX_ENTRIES = int(os.getenv("IMAGE_NEGATIVE_MAX_ENTRIES", "10000"))
+IMAGE_BREAKER_FAILURES = int(os.getenv("IMAGE_BREAKER_FAILURES", "3"))
+IMAGE_BREAKER_COOLDOWN = int(os.getenv("IMAGE_BREAKER_COOLDOWN", "30"))
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `cooldown` seconds.
+    After the cooldown a single trial call is let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=IMAGE_BREAKER_FAILURES, cooldown=IMAGE_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    log(f"Image host unavailable, pausing image fetches for {self.cooldown}s")
+                self.opened_at = time.time()
+
+# One network fetch that the cache could not answer: cache key, query, URL, cached metadata (stale copy) and
+# conditional request headers
+_Request = namedtuple("_Request", "key query url meta headers")
+
+class ImageFetcher:
+    """
+    Fetches slide images over a pooled keep-alive session with a content-addressed disk cache.
+    afetch_path() is the event-loop counterpart, over a pooled httpx.AsyncClient (one per loop).
+    - Cache entries are keyed by (query, URL), evicted LRU-first past `max_bytes`,
+      and revalidated with ETag / Last-Modified once older than `fresh_seconds`.
+    - Failed lookups are remembered for `negative_ttl` seconds (at most IMAGE_NEGATIVE_MAX_ENTRIES of them).
+    - A circuit breaker stops a slow or failing host from costing a timeout per slide.
+    """
+
+    def __init__(self, base_url=IMAGE_BASE_URL, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES,
+                 fresh_seconds=IMAGE_CACHE_FRESH_SECONDS, negative_ttl=IMAGE_NEGATIVE_TTL, timeout=IMAGE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=IMAGE_POOL_SIZE, pool_maxsize=IMAGE_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_clients = weakref.WeakKeyDictionary()   # event loop -> httpx.AsyncClient
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> metadata, least recently used first
+        self._total_bytes = 0
+        self._negative = OrderedDict()  # key -> expiry timestamp, soonest expiry first
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuilds the LRU index from the metadata sidecars left by a previous process."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name)) as f:
+                    meta = json.load(f)
+                if os.path.exists(self._data_path(meta["key"])):
+                    entries.append(meta)
+            except (OSError, ValueError, KeyError):
+                continue
+
+        for meta in sorted(entries, key=lambda m: m["last_access"]):
+            self._entries[meta["key"]] = meta
+            self._total_bytes += meta["size"]
+
+    def image_url(self, query):
+        return f"{self.base_url}/{IMAGE_SIZE}?text={urllib.parse.quote(query)}"
+
+    def _data_path(self, key):
+        return os.path.join(self.cache_dir, key + ".img")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def fetch_path(self, query):
+        """Returns the path of a cached image file for `query`, or None if no image is available."""
+        request, path = self._lookup(query)
+        if request is None:
+            return path
+        try:
+            response = self.session.get(request.url, headers=request.headers, timeout=self.timeout)
+        except Exception as e:
+            return self._error(request, e)
+        return self._finish(request, response)
+
+    async def afetch_path(self, query):
+        """fetch_path() for coroutines: the request runs on the event loop and the file writes on a worker thread."""
+        request, path = self._lookup(query)
+        if request is None:
+            return path
+        try:
+            response = await self._async_client().get(request.url, headers=request.headers)
+        except Exception as e:
+            return self._error(request, e)
+        return await asyncio.to_thread(self._finish, request, response)
+
+    def _async_client(self):
+        """The pooled httpx.AsyncClient of the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Deferred: only the async server needs httpx
+            import httpx
+            limits = httpx.Limits(max_connections=IMAGE_POOL_SIZE, max_keepalive_connections=IMAGE_POOL_SIZE)
+            # Waiting for a pooled connection is not the host's fault, so it has no timeout (and never trips the breaker)
+            timeout = httpx.Timeout(self.timeout, pool=None)
+            client = self._async_clients[loop] = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return client
+
+    async def aclose(self):
+        """Closes the running event loop's client, if it has one."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _lookup(self, query):
+        """
+        Answers `query` from the cache where possible.
+        Returns (None, path or None) when no request is needed, else (_Request, None).
+        """
+        if not query:
+            return None, None
+
+        url = self.image_url(query)
+        key = hashlib.sha256(f"{query}\n{url}".encode("utf-8")).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            expires = self._negative.get(key)
+            if expires is not None:
+                if expires > now:
+                    metrics.IMAGE_FETCHES.inc(result="negative")
+                    return None, None
+                del self._negative[key]
+            meta = self._entries.get(key)
+            if meta:
+                self._entries.move_to_end(key)
+                meta["last_access"] = now
+
+        if meta and now - meta["fetched_at"] < self.fresh_seconds:
+            metrics.IMAGE_FETCHES.inc(result="fresh")
+            return None, self._data_path(key)
+
+        if not self.breaker.allow():
+            # Serve a stale copy rather than waiting on a host we know is struggling
+            return None, self._fail(key, meta, remember=False)
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return _Request(key, query, url, meta, headers), None
+
+    def _error(self, request, error):
+        log(f"Error fetching image for '{request.query}': {error}")
+        self.breaker.record_failure()
+        return self._fail(request.key, request.meta)
+
+    def _finish(self, request, response):
+        """Handles the response (requests or httpx) to a _Request and returns the image path or None."""
+        key, meta = request.key, request.meta
+        if response.status_code == 304 and meta:
+            self.breaker.record_success()
+            meta["fetched_at"] = time.time()
+            self._write_meta(meta)
+            metrics.IMAGE_FETCHES.inc(result="revalidated")
+            return self._data_path(key)
+
+        if response.status_code != 200:
+            # The host answered, so it is not a connectivity problem
+            self.breaker.record_success()
+            return self._fail(key, meta)
+
+        self.breaker.record_success()
+        self._store(key, request.query, request.url, response)
+        metrics.IMAGE_FETCHES.inc(result="downloaded")
+        return self._data_path(key)
+
+    def _fail(self, key, meta, remember=True):
+        """Remembers the failure for `negative_ttl` (unless `remember` is off) and falls back to a stale copy if there is one."""
+        if remember:
+            now = time.time()
+            with self._lock:
+                # Every entry has the same TTL, so insertion order is expiry order
+                self._negative.pop(key, None)
+                self._negative[key] = now + self.negative_ttl
+                while self._negative and (len(self._negative) > IMAGE_NEGATIVE_MAX_ENTRIES
+                                          or next(iter(self._negative.values())) <= now):
+                    self._negative.popitem(last=False)
+        metrics.IMAGE_FETCHES.inc(result="stale" if meta else "failed")
+        return self._data_path(key) if meta else None
+
+    def _store(self, key, query, url, response):
+        content = response.content
+        data_path = self._data_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, data_path)
+
+        now = time.time()
+        meta = {
+            "key": key,
+            "query": query,
+            "url": url,
+            "size": len(content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": now,
+            "last_access": now
+        }
+        self._write_meta(meta)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._total_bytes -= previous["size"]
+            self._entries[key] = meta
+            self._total_bytes += meta["size"]
+            self._negative.pop(key, None)
+            self._evict()
+
+    def _write_meta(self, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(meta["key"]))
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, meta = self._entries.popitem(last=False)
+            self._total_bytes -= meta["size"]
+            for path in (self._data_path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+# Shared fetcher used by ppt_utils
+fetcher = ImageFetcher()
@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import threading
+import metrics
+
+# --- Settings ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+class QueueFull(Exception):
+    """Raised when a job cannot be enqueued because the queue is at its depth limit."""
+
+# --- Queue Backends ---
+# A backend only needs put(message), get(timeout) and qsize().
+# Messages are plain dicts ({"id": ..., "payload": ..., "trace_id": ...}) so a local broker can carry them as JSON.
+
+class InProcessQueue:
+    """Bounded in-process queue. Jobs are lost if the process exits."""
+
+    def __init__(self, maxsize=JOB_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            raise QueueFull(f"Job queue is full ({self._queue.maxsize} pending)")
+
+    def get(self, timeout=None):
+        """Returns the next message, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+# --- Job Manager ---
+
+class JobManager:
+    """
+    Runs `handler(payload, timings)` for queued jobs on a fixed pool of worker threads.
+    The handler returns the job result; any exception marks the job as failed.
+    Job records are kept in memory for JOB_RETENTION_SECONDS after they finish.
+    """
+
+    def __init__(self, handler, backend=None, workers=JOB_WORKERS):
+        self.handler = handler
+        self.backend = backend or InProcessQueue()
+        self.workers = workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload):
+        """Enqueues a job and returns its record. Raises QueueFull when the backend is at capacity."""
+        job_id = os.urandom(8).hex()
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "timings": {},
+            "result": None,
+            "error": None
+        }
+
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+
+        try:
+            self.backend.put({"id": job_id, "payload": payload, "trace_id": metrics.current_trace_id()})
+        except QueueFull:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+
+        return dict(job)
+
+    def get(self, job_id):
+        """Returns a snapshot of the job record, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, timings=dict(job["timings"])) if job else None
+
+    def queue_depth(self):
+        return self.backend.qsize()
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _worker_loop(self):
+        while True:
+            message = self.backend.get(timeout=1)
+            if message is None:
+                continue
+
+            with self._lock:
+                job = self._jobs.get(message["id"])
+                if job is None:
+                    continue
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                job["timings"]["queued"] = round(job["started_at"] - job["created_at"], 3)
+
+            # Log under the submitting request's trace id
+            metrics.set_trace_id(message.get("trace_id") or message["id"])
+            timings = {}
+            try:
+                result = self.handler(message["payload"], timings)
+                status, error = "succeeded", None
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                result, status, error = None, "failed", str(e)
+
+            with self._lock:
+                job["finished_at"] = time.time()
+                job["status"] = status
+                job["result"] = result
+                job["error"] = error
+                job["timings"].update(timings)
+                job["timings"]["run"] = round(job["finished_at"] - job["started_at"], 3)
@@ -0,0 +1,81 @@
+import json
+
+class ArrayObjectParser:
+    """
+    Incremental parser for a JSON array of objects arriving in chunks (e.g. a streamed model reply).
+    feed() returns each top-level object of the first array as soon as its closing brace arrives.
+    - Text before the array (prose, a ```json fence) and after it is ignored.
+    - Every character is scanned once; only the object being read is buffered.
+    - An object that fails to parse is skipped and counted in `failures`; a truncated reply simply
+      leaves its last, incomplete object unreturned.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.done = False
+        self._in_array = False
+        self._depth = 0             # nesting depth inside the array (1 = directly inside it)
+        self._in_string = False
+        self._escape = False
+        self._current = []          # chunks of the object being read
+
+    def feed(self, chunk):
+        """Consumes the next piece of text and returns the list of objects it completed."""
+        completed = []
+        if self.done or not chunk:
+            return completed
+
+        start = None    # where the current object begins within this chunk
+        if self._current:
+            start = 0
+
+        for i, char in enumerate(chunk):
+            if not self._in_array:
+                if char == "[":
+                    self._in_array = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 1 and char == "{":
+                    start = i
+                    self._current = []
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and char == "}" and start is not None:
+                    self._current.append(chunk[start:i + 1])
+                    self._emit(completed)
+                    start = None
+                elif self._depth == 0:
+                    self.done = True
+                    break
+
+        if start is not None:
+            self._current.append(chunk[start:])
+        return completed
+
+    def _emit(self, completed):
+        text = "".join(self._current)
+        self._current = []
+        try:
+            completed.append(json.loads(text))
+        except json.JSONDecodeError:
+            self.failures += 1
+
+def parse_complete_array(text):
+    """Returns the array's objects only if the array is closed and every object parsed, else None."""
+    parser = ArrayObjectParser()
+    objects = parser.feed(text)
+    return objects if parser.done and not parser.failures else None
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import defaultdict
+import metrics
+
+# --- Settings ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "content_creator_llm_cache.sqlite"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def make_key(model, temperature, prompt, options=None):
+    """Cache key: hash of everything that determines the model's output distribution (call options included)."""
+    raw = json.dumps([model, temperature, prompt] + ([options] if options else []), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def message_text(message):
+    """Text of a chat message or chunk, whose content may be a string or a list of content parts."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+class ResponseCache:
+    """
+    On-disk (sqlite) cache of raw model responses.
+    Entries expire after `ttl` seconds; when the entry or byte cap is exceeded,
+    the least recently used entries are evicted first.
+    """
+
+    # Writes between recounts of the table, which pick up entries written by other processes
+    RECOUNT_INTERVAL = 256
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL_SECONDS,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.bypasses = defaultdict(int)
+        self._stats_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        # Running totals, so a write does not have to scan the table to check the caps
+        self._recount()
+
+    def get(self, key):
+        """Returns the cached response text, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                self._bytes -= row[2]
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, content):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now)
+            )
+            if old is None:
+                self._count += 1
+            self._bytes += size - (old[0] if old else 0)
+            self._writes += 1
+            if self._writes % self.RECOUNT_INTERVAL == 0:
+                self._recount()
+            if self._count > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(now)
+            self._conn.commit()
+
+    def _recount(self):
+        self._count, self._bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._writes = 0
+
+    def _evict(self, now):
+        # Only runs once the running totals exceed a cap: expired entries go first, then the least recently used
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._recount()
+        if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count -= 1
+            self._bytes -= size
+
+    def _record(self, node, result):
+        with self._stats_lock:
+            {"hit": self.hits, "miss": self.misses, "bypass": self.bypasses}[result][node] += 1
+        metrics.LLM_CACHE_REQUESTS.inc(node=node, result=result)
+
+    def _key(self, llm, prompt, options):
+        return make_key(getattr(llm, "model", type(llm).__name__), getattr(llm, "temperature", None), prompt, options)
+
+    def _lookup(self, key, node, parse, bypass):
+        """(cached text, parsed) for a cached reply that still parses, else (None, None). Records the hit, miss or bypass."""
+        if not bypass:
+            cached = self.get(key)
+            if cached is not None:
+                parsed = parse(cached)
+                if parsed is not None:
+                    self._record(node, "hit")
+                    return cached, parsed
+
+        self._record(node, "bypass" if bypass else "miss")
+        return None, None
+
+    def _store(self, key, parse, content):
+        """Stores a fresh response if `parse` accepts it; returns the parsed value."""
+        parsed = parse(content)
+        if parsed is not None:
+            self.set(key, content)
+        return parsed
+
+    def invoke(self, llm, prompt, node, parse, bypass=False, **options):
+        """
+        Calls `llm.invoke(prompt, **options)` through the cache and returns `parse(response_text)`.
+        Only responses that parse (non-None) are stored, so a malformed reply is never replayed.
+        With `bypass`, the cached entry is ignored but the fresh response still replaces it.
+        """
+        key = self._key(llm, prompt, options)
+        cached, parsed = self._lookup(key, node, parse, bypass)
+        if cached is not None:
+            return parsed
+        return self._store(key, parse, message_text(llm.invoke(prompt, **options)))
+
+    def stream(self, llm, prompt, node, parse, bypass=False, **options):
+        """
+        Streaming counterpart of invoke(): yields the response text in chunks as `llm.stream(prompt, **options)` produces them.
+        A cached response is replayed as a single chunk. The full text is stored afterwards if `parse` accepts it.
+        """
+        key = self._key(llm, prompt, options)
+        cached, _ = self._lookup(key, node, parse, bypass)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        for chunk in llm.stream(prompt, **options):
+            parts.append(message_text(chunk))
+            yield parts[-1]
+        self._store(key, parse, "".join(parts))
+
+    async def ainvoke(self, llm, prompt, node, parse, bypass=False, **options):
+        """invoke() for coroutines: awaits `llm.ainvoke`; the sqlite reads and writes run on worker threads."""
+        key = self._key(llm, prompt, options)
+        cached, parsed = await asyncio.to_thread(self._lookup, key, node, parse, bypass)
+        if cached is not None:
+            return parsed
+        content = message_text(await llm.ainvoke(prompt, **options))
+        return await asyncio.to_thread(self._store, key, parse, content)
+
+    async def astream(self, llm, prompt, node, parse, bypass=False, **options):
+        """stream() for coroutines: an async generator over `llm.astream`."""
+        key = self._key(llm, prompt, options)
+        cached, _ = await asyncio.to_thread(self._lookup, key, node, parse, bypass)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for chunk in llm.astream(prompt, **options):
+            parts.append(message_text(chunk))
+            yield parts[-1]
+        await asyncio.to_thread(self._store, key, parse, "".join(parts))
+
+    def stats(self):
+        """Per-node hit/miss/bypass counters."""
+        with self._stats_lock:
+            nodes = set(self.hits) | set(self.misses) | set(self.bypasses)
+            return {node: {"hits": self.hits[node], "misses": self.misses[node], "bypasses": self.bypasses[node]}
+                    for node in sorted(nodes)}
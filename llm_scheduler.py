@@ -0,0 +1,465 @@
+import os
+import time
+import asyncio
+import heapq
+import random
+import itertools
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+import metrics
+from metrics import log
+
+# --- Settings ---
+# 0 turns a limit off
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "600"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+# Upper bound for the adaptive concurrency limit; 429s halve it, successes grow it back
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+# Completion tokens assumed for a call until its usage is known
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "800"))
+# Hedging: after the node's p95 latency, send a duplicate call and take whichever answers first
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+# Lower value goes first
+LANES = {"interactive": 0, "batch": 1}
+# Latency samples needed before a node's calls are hedged
+HEDGE_MIN_SAMPLES = 20
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+
+# --- Lanes ---
+
+_lane = contextvars.ContextVar("llm_lane", default="interactive")
+
+@contextmanager
+def lane(name):
+    """Runs the block's LLM calls (including LangGraph nodes it starts) in the given priority lane."""
+    if name not in LANES:
+        raise ValueError(f"Unknown lane {name!r}, expected one of {sorted(LANES)}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def current_lane():
+    return _lane.get()
+
+def current_node():
+    """The LangGraph node the current call runs in, or "default" outside a graph run."""
+    try:
+        from langgraph.config import get_config
+        return get_config().get("metadata", {}).get("langgraph_node", "default")
+    except (ImportError, RuntimeError):
+        return "default"
+
+def is_rate_limited(error):
+    """Whether an exception from the model client is a 429 / quota error."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
+
+def retry_after(error):
+    """Seconds from a Retry-After header on the error's response, if there is one."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def estimate_tokens(prompt):
+    """Rough token count of a call before it is made: ~4 characters per prompt token plus the expected output."""
+    return len(str(prompt)) // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+class TokenBucket:
+    """Refills at `per_minute / 60` per second up to `capacity`; the level may go negative to repay usage."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, per_minute / 6)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` (capped at the capacity) is available."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+class LLMScheduler:
+    """
+    Admission control for every model call in the process.
+    - Calls queue by lane (interactive before batch) and then arrival; only the head of the queue is admitted.
+    - Token buckets hold requests per minute and tokens per minute; token estimates are corrected from
+      the response's usage_metadata.
+    - Concurrency is adaptive (AIMD): a 429 halves the calls in flight and pauses admission for the backoff;
+      each success adds 1/limit, up to `max_concurrency`. Calls admitted before the last decrease
+      do not halve it again, so one burst of 429s costs a single halving.
+    - 429s are retried here with exponential backoff and jitter, so the client itself should not retry.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_attempts=LLM_MAX_ATTEMPTS):
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.limit = float(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._cond = threading.Condition()
+        self._waiting = []          # heap of (lane priority, arrival number)
+        self._async_waiters = set() # (event loop, asyncio.Event) of coroutines in aacquire()
+        self._arrivals = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latencies = defaultdict(lambda: deque(maxlen=200))   # node -> recent call seconds
+        self._calls = 0
+        self._hedges = 0
+
+    # --- Admission ---
+
+    def _wait_time(self, tokens, now):
+        if self._in_flight >= int(self.limit):
+            return None     # until a call finishes
+        waits = [self._paused_until - now]
+        if self._requests is not None:
+            waits.append(self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            waits.append(self._tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def _admit(self, tokens, now):
+        """Moves the head of the queue in flight. Caller holds the lock and has checked _wait_time()."""
+        heapq.heappop(self._waiting)
+        self._in_flight += 1
+        self._calls += 1
+        if self._requests is not None:
+            self._requests.take(1, now)
+        if self._tokens is not None:
+            self._tokens.take(tokens, now)
+
+    def _notify(self):
+        """Wakes every waiting thread and coroutine. Caller holds the lock."""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _withdraw(self, entry):
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+
+    def _try_admit(self, entry, tokens):
+        """
+        Admits `entry` if it is at the head of the queue and may start now. Caller holds the lock.
+        Returns (its admission time or None, seconds until it should check again or None to wait for a notify).
+        """
+        if self._waiting[0] != entry:
+            return None, None
+        now = time.monotonic()
+        timeout = self._wait_time(tokens, now)
+        if timeout is None or timeout > 0:
+            return None, timeout
+        self._admit(tokens, now)
+        # The next call in line may be admissible now
+        self._notify()
+        return now, None
+
+    def acquire(self, lane_name, tokens):
+        """
+        Blocks until this call may start and returns its admission time.
+        Every acquire() must be paired with release().
+        """
+        entry = (LANES[lane_name], next(self._arrivals))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    admitted_at, timeout = self._try_admit(entry, tokens)
+                    if admitted_at is not None:
+                        break
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._withdraw(entry)
+                self._notify()
+                raise
+        metrics.LLM_QUEUE_SECONDS.observe(time.monotonic() - start, lane=lane_name)
+        return admitted_at
+
+    async def aacquire(self, lane_name, tokens):
+        """
+        acquire() for coroutines: waits on the event loop instead of blocking a thread.
+        Threads and coroutines share one queue, so lanes and arrival order hold across both.
+        """
+        entry = (LANES[lane_name], next(self._arrivals))
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    admitted_at, timeout = self._try_admit(entry, tokens)
+                    if admitted_at is not None:
+                        self._async_waiters.discard(waiter)
+                        break
+                    # Cleared under the lock, so a wake-up sent after this check is not lost
+                    waiter[1].clear()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._withdraw(entry)
+                self._notify()
+            raise
+        metrics.LLM_QUEUE_SECONDS.observe(time.monotonic() - start, lane=lane_name)
+        return admitted_at
+
+    def release(self, admitted_at, rate_limited=False, succeeded=False, token_correction=0, backoff=0.0):
+        with self._cond:
+            now = time.monotonic()
+            self._in_flight -= 1
+            if rate_limited:
+                if admitted_at > self._last_decrease:
+                    # Halve what was actually in flight (this call included), not a limit that was never reached
+                    self.limit = max(1.0, min(self.limit, self._in_flight + 1) / 2)
+                    self._last_decrease = now
+                    log(f"LLM rate limited, concurrency limit now {int(self.limit)}")
+                self._paused_until = max(self._paused_until, now + backoff)
+            elif succeeded:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            if token_correction and self._tokens is not None:
+                self._tokens.take(token_correction, now)
+            metrics.LLM_CONCURRENCY_LIMIT.set(int(self.limit))
+            self._notify()
+
+    def backoff(self, attempt, error):
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    # --- Calls ---
+
+    def _failed(self, admitted_at, attempt, error, node):
+        """Releases the slot of a call that raised `error`. Returns whether to retry it (a 429 with attempts left)."""
+        if not is_rate_limited(error):
+            self.release(admitted_at)
+            return False
+        metrics.LLM_RATE_LIMITED.inc(node=node)
+        self.release(admitted_at, rate_limited=True, backoff=self.backoff(attempt, error))
+        return attempt < self.max_attempts
+
+    def _succeeded(self, admitted_at, start, result, tokens, node):
+        """Releases the slot of a call that returned `result`, correcting the token estimate by its usage."""
+        self.record_latency(node, time.monotonic() - start)
+        usage = getattr(result, "usage_metadata", None) or {}
+        correction = usage["total_tokens"] - tokens if usage.get("total_tokens") else 0
+        self.release(admitted_at, succeeded=True, token_correction=correction)
+        return result
+
+    def call(self, fn, lane_name, tokens, node="default"):
+        """Runs fn() (one model call) under admission control, retrying 429s. Returns its result."""
+        for attempt in range(1, self.max_attempts + 1):
+            admitted_at = self.acquire(lane_name, tokens)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                if self._failed(admitted_at, attempt, e, node):
+                    continue
+                raise
+            return self._succeeded(admitted_at, start, result, tokens, node)
+
+    def stream(self, open_stream, lane_name, tokens, node="default"):
+        """
+        Yields from open_stream() under admission control. A 429 before the first chunk is retried;
+        once chunks have been yielded, errors propagate.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            admitted_at = self.acquire(lane_name, tokens)
+            released = False
+            started = False
+            try:
+                for chunk in open_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started or not is_rate_limited(e):
+                    raise
+                released = True
+                if self._failed(admitted_at, attempt, e, node):
+                    continue
+                raise
+            finally:
+                if not released:
+                    self.release(admitted_at, succeeded=started)
+            return
+
+    async def acall(self, afn, lane_name, tokens, node="default"):
+        """call() for coroutines: awaits afn() (one model call) under admission control."""
+        for attempt in range(1, self.max_attempts + 1):
+            admitted_at = await self.aacquire(lane_name, tokens)
+            start = time.monotonic()
+            try:
+                result = await afn()
+            except Exception as e:
+                if self._failed(admitted_at, attempt, e, node):
+                    continue
+                raise
+            except BaseException:
+                # Cancelled (e.g. the losing side of a hedge): the slot is free again
+                self.release(admitted_at)
+                raise
+            return self._succeeded(admitted_at, start, result, tokens, node)
+
+    async def astream(self, open_stream, lane_name, tokens, node="default"):
+        """stream() for coroutines: yields from the async iterator open_stream() under admission control."""
+        for attempt in range(1, self.max_attempts + 1):
+            admitted_at = await self.aacquire(lane_name, tokens)
+            released = False
+            started = False
+            try:
+                async for chunk in open_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started or not is_rate_limited(e):
+                    raise
+                released = True
+                if self._failed(admitted_at, attempt, e, node):
+                    continue
+                raise
+            finally:
+                if not released:
+                    self.release(admitted_at, succeeded=started)
+            return
+
+    # --- Hedging ---
+
+    def record_latency(self, node, seconds):
+        with self._cond:
+            self._latencies[node].append(seconds)
+
+    def hedge_delay(self, node, percentile=LLM_HEDGE_PERCENTILE):
+        """Seconds after which a call from `node` is hedged, or None until enough calls have been seen."""
+        with self._cond:
+            samples = sorted(self._latencies[node])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+    def allow_hedge(self, max_ratio=LLM_HEDGE_MAX_RATIO):
+        """Whether a hedge may be sent now: within the hedge budget and with spare capacity."""
+        with self._cond:
+            if self._waiting or self._in_flight >= int(self.limit) or self._hedges >= max_ratio * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def stats(self):
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self._in_flight, "waiting": len(self._waiting),
+                    "calls": self._calls, "hedges": self._hedges}
+
+# Threads that run hedged calls; the losing call is left to finish in the background
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+class ScheduledModel:
+    """
+    Wraps a chat model so invoke() and stream(), and their async forms, go through an LLMScheduler.
+    Other attributes (model, temperature, ...) pass through, so LLM cache keys are unchanged.
+    With `hedge`, an invoke() still running after its node's p95 latency gets a duplicate call,
+    and the first successful answer wins.
+    """
+
+    def __init__(self, model, scheduler=None, hedge=LLM_HEDGE_ENABLED):
+        self.wrapped = model
+        self.scheduler = scheduler or LLMScheduler()
+        self.hedge = hedge
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def _call_args(self, open_call, prompt):
+        """The scheduler arguments for one model call from the current node: (open_call, lane, tokens, node)."""
+        return open_call, current_lane(), estimate_tokens(prompt), current_node()
+
+    def invoke(self, prompt, config=None, **kwargs):
+        args = self._call_args(lambda: self.wrapped.invoke(prompt, config, **kwargs), prompt)
+        delay = self.scheduler.hedge_delay(args[-1]) if self.hedge else None
+        if delay is None:
+            return self.scheduler.call(*args)
+
+        # Each thread runs in its own copy of the context, so callbacks and trace ids follow the call
+        primary = _hedge_pool.submit(contextvars.copy_context().run, self.scheduler.call, *args)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self.scheduler.allow_hedge():
+            return primary.result()
+
+        metrics.LLM_HEDGES.inc(result="sent")
+        hedge = _hedge_pool.submit(contextvars.copy_context().run, self.scheduler.call, *args)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is None:
+            if first is hedge:
+                metrics.LLM_HEDGES.inc(result="won")
+            return first.result()
+        return (hedge if first is primary else primary).result()
+
+    def stream(self, prompt, config=None, **kwargs):
+        return self.scheduler.stream(*self._call_args(lambda: self.wrapped.stream(prompt, config, **kwargs), prompt))
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        args = self._call_args(lambda: self.wrapped.ainvoke(prompt, config, **kwargs), prompt)
+        delay = self.scheduler.hedge_delay(args[-1]) if self.hedge else None
+        if delay is None:
+            return await self.scheduler.acall(*args)
+
+        # Tasks copy the context, so callbacks and trace ids follow the call
+        primary = asyncio.create_task(self.scheduler.acall(*args))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.scheduler.allow_hedge():
+                return await primary
+
+            metrics.LLM_HEDGES.inc(result="sent")
+            hedge = asyncio.create_task(self.scheduler.acall(*args))
+            tasks.append(hedge)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            first = done.pop()
+            if first.exception() is None:
+                if first is hedge:
+                    metrics.LLM_HEDGES.inc(result="won")
+                return first.result()
+            return await (hedge if first is primary else primary)
+        finally:
+            # Unlike a thread, the losing call can be cancelled, which frees its slot right away
+            for task in tasks:
+                task.cancel()
+
+    def astream(self, prompt, config=None, **kwargs):
+        return self.scheduler.astream(*self._call_args(lambda: self.wrapped.astream(prompt, config, **kwargs), prompt))
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- Settings ---
+METRICS_ENABLED = os.getenv("METRICS_DISABLED", "").lower() not in ("1", "true", "yes")
+
+# Seconds; covers a cache hit through a slow multi-slide Gemini call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# --- Registry ---
+# A minimal Prometheus text-format registry: counters and histograms with labels, no dependencies.
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # label values tuple -> metric state
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonic counter; the name should end in _total."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_label_str(self.labelnames, key)} {value}"
+
+class Gauge(_Metric):
+    """Current value that can go up and down."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_label_str(self.labelnames, key)} {value}"
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with _bucket, _sum and _count series."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state["count"] if state else 0
+
+    def _render_samples(self, items):
+        for key, state in items:
+            for bound, count in zip(self.buckets, state["counts"]):
+                yield f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', bound)])} {count}"
+            yield f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', '+Inf')])} {state['count']}"
+            yield f"{self.name}_sum{_label_str(self.labelnames, key)} {round(state['sum'], 6)}"
+            yield f"{self.name}_count{_label_str(self.labelnames, key)} {state['count']}"
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observes the wall time of the `with` block on `histogram`, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+# --- Application Metrics ---
+
+NODE_SECONDS = Histogram("graph_node_seconds", "Wall time per LangGraph node run.", ["node"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the model, by node and kind (prompt/completion).",
+                     ["node", "kind"])
+LLM_CACHE_REQUESTS = Counter("llm_cache_requests_total", "LLM response cache lookups by node and result.",
+                             ["node", "result"])
+LLM_REPLIES = Counter("llm_replies_total", "Model replies parsed by node (cache hits and repairs included).", ["node"])
+JSON_PARSE_FAILURES = Counter("llm_json_parse_failures_total", "Model replies (or streamed objects) that were not JSON.",
+                              ["node"])
+LLM_REPLY_ELEMENTS = Counter("llm_reply_elements_total",
+                             "Outlines and slides checked against their reply schema, by result (valid, repaired, invalid).",
+                             ["node", "result"])
+DECK_LLM_CALLS = Histogram("deck_llm_calls", "Model requests per finished graph run (response cache hits excluded).",
+                           buckets=(1, 2, 5, 10, 20, 30, 50, 100))
+REFINE_ITERATIONS = Histogram("graph_refine_iterations", "Refine passes (retry_count) per finished deck.",
+                              buckets=(0, 1, 2, 3, 5))
+LLM_QUEUE_SECONDS = Histogram("llm_queue_seconds", "Time a model call waited for admission, by lane.", ["lane"])
+LLM_RATE_LIMITED = Counter("llm_rate_limited_total", "Model calls rejected with 429 / quota errors, by node.", ["node"])
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Hedged model calls (sent) and hedges that answered first (won).",
+                     ["result"])
+LLM_CONCURRENCY_LIMIT = Gauge("llm_concurrency_limit", "Current adaptive limit on concurrent model calls.")
+IMAGE_FETCH_SECONDS = Histogram("image_fetch_seconds", "Time to resolve one slide image.")
+IMAGE_PREPARE_SECONDS = Histogram("image_prepare_seconds", "Time to downscale and re-encode one slide image.")
+IMAGE_FETCHES = Counter("image_fetches_total",
+                        "Image lookups by result (fresh, revalidated, downloaded, stale, negative, failed).",
+                        ["result"])
+RENDER_SECONDS = Histogram("render_seconds",
+                           "create_ppt time by phase (images, slides, save; pool = round trip to a render worker, queue = wait for one).",
+                           ["phase"])
+RENDER_POOL_FAILURES = Counter("render_pool_failures_total", "Render worker timeouts and crashes.", ["reason"])
+BATCH_DECKS = Counter("batch_decks_total", "Decks produced by generate_batch, by status.", ["status"])
+
+# --- Trace IDs ---
+# One id per request, carried through threads that copy the context (LangGraph's executor does;
+# plain threads must be started with contextvars.copy_context().run).
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+def new_trace_id():
+    return os.urandom(6).hex()
+
+def set_trace_id(trace_id=None):
+    """Sets (or generates) the trace id for the current context and returns it."""
+    trace_id = trace_id or new_trace_id()
+    _trace_id.set(trace_id)
+    return trace_id
+
+def current_trace_id():
+    return _trace_id.get()
+
+def log(message):
+    """print() with the current trace id prepended."""
+    trace_id = _trace_id.get()
+    print(f"[trace={trace_id}] {message}" if trace_id else message)
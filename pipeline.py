@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import contextvars
+import concurrent.futures
+import metrics
+import ppt_utils
+from deck import Slide, as_deck
+from metrics import log
+
+# --- Settings ---
+# Render slides and fetch images while the LLM is still writing (see PipelinedDeck)
+PIPELINED_GENERATION = os.getenv("PIPELINED_GENERATION", "").lower() in ("1", "true", "yes")
+# Matches the image fetcher's connection pool (IMAGE_POOL_SIZE)
+PIPELINE_IMAGE_WORKERS = int(os.getenv("PIPELINE_IMAGE_WORKERS", "10"))
+
+class PipelinedDeck:
+    """
+    Builds a deck from graph.stream(stream_mode=agent_graph.stream_modes()) items while the graph runs.
+    - An image fetch starts as soon as a slide's image_search_query is known.
+    - A slide is rendered as soon as its body fits; overflowing slides wait for the refiner.
+    - finish() renders whatever changed in the final output, waits for the images and saves;
+      it is the only step that waits for everything.
+    Not thread-safe: observe() and finish() must be called from the thread consuming the stream.
+    Slides are rendered in this process, since a Presentation cannot be shared with a render worker.
+    """
+
+    def __init__(self, image_mode=None):
+        self.image_mode = image_mode
+        self.use_image_layout = image_mode in ['manual', 'auto']
+        self.deck = None
+        self._rendered = {}     # index -> slide data the rendered slide was built from
+        self._pending = {}      # index -> latest slide data not rendered yet (title unknown or overflowing)
+        self._images = {}       # index -> (query, future)
+        self._executor = None
+
+    def observe(self, mode, update):
+        """Feeds one (mode, update) item from graph.stream."""
+        if mode == "custom":
+            if update.get("event") == "slide":
+                self._on_slide(update["index"], update["slide"])
+            return
+
+        for node, values in update.items():
+            if not values:
+                continue
+            if "presentation_title" in values:
+                self._start(values["presentation_title"])
+            for draft in values.get("slide_drafts", []):
+                self._on_slide(draft["index"], draft["slide"])
+            for i, slide in enumerate(values.get("slides", [])):
+                self._on_slide(i, slide)
+
+    def _start(self, title):
+        if self.deck is None:
+            self.deck = ppt_utils.DeckBuilder(title, self.image_mode)
+            for index, slide in sorted(self._pending.items()):
+                self._render_if_final(index, slide)
+
+    def _on_slide(self, index, slide):
+        if not isinstance(slide, Slide):
+            return
+        self._fetch_image(index, slide)
+        self._render_if_final(index, slide)
+
+    def _fetch_image(self, index, slide):
+        if self.image_mode != 'auto':
+            return
+        query = slide.image_query
+        if not query or (index in self._images and self._images[index][0] == query):
+            return
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=PIPELINE_IMAGE_WORKERS)
+        # Each task gets its own copy of the context so logs keep the request's trace id
+        future = self._executor.submit(contextvars.copy_context().run, ppt_utils.fetch_slide_image, query)
+        self._images[index] = (query, future)
+
+    def _render_if_final(self, index, slide):
+        if self.deck is None or ppt_utils.slide_overflows(slide, self.use_image_layout):
+            self._pending[index] = slide
+            return
+        self._render(index, slide)
+
+    def _render(self, index, slide):
+        self._pending.pop(index, None)
+        if self._rendered.get(index) != slide:
+            self.deck.add_slide(index, slide)
+            self._rendered[index] = slide
+
+    def finish(self, ppt_data, filename="generated_presentation.pptx", output=None):
+        """Renders the final slides (a deck.Deck) that differ from what was built, attaches the images and saves."""
+        start = time.perf_counter()
+        ppt_data = as_deck(ppt_data)
+        self._start(ppt_data.title)
+        slides = ppt_data.slides
+        early = sum(1 for i, slide in enumerate(slides) if self._rendered.get(i) == slide)
+
+        for i, slide in enumerate(slides):
+            self._fetch_image(i, slide)
+            self._render(i, slide)
+        for index in [index for index in self._rendered if index >= len(slides)]:
+            self.deck.remove_slide(index)
+            del self._rendered[index]
+
+        images_start = time.perf_counter()
+        for index, (query, future) in sorted(self._images.items()):
+            if index >= len(slides):
+                continue
+            try:
+                image = future.result()
+            except Exception as exc:
+                log(f"Image fetch generated an exception for slide {index}: {exc}")
+                continue
+            if image:
+                self.deck.add_image(index, image)
+        images_seconds = time.perf_counter() - images_start
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+        metrics.RENDER_SECONDS.observe(images_seconds, phase="images")
+        metrics.RENDER_SECONDS.observe(time.perf_counter() - start - images_seconds, phase="slides")
+        log(f"Pipelined render: {early}/{len(slides)} slides were ready before the graph finished")
+        return self.deck.save(filename, output)
+
+    def close(self):
+        """Drops queued image fetches when the run fails before finish()."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ImagePrefetch:
+    """
+    The async server's counterpart of PipelinedDeck: feed it graph.astream items and each slide's image is
+    fetched (over the async client) as soon as its query is known, so the render finds it in the image cache.
+    Slides are not rendered here, since that would run on the event loop; the render pool renders the deck
+    at the end. Must be used from the event loop's thread.
+    """
+
+    def __init__(self):
+        self._tasks = {}        # query -> asyncio.Task
+
+    def observe(self, mode, update):
+        """Feeds one (mode, update) item from graph.astream."""
+        if mode == "custom":
+            if update.get("event") == "slide":
+                self._fetch(update["slide"])
+            return
+
+        for node, values in update.items():
+            if not values:
+                continue
+            for draft in values.get("slide_drafts", []):
+                self._fetch(draft["slide"])
+            for slide in values.get("slides", []):
+                self._fetch(slide)
+
+    def _fetch(self, slide):
+        if not isinstance(slide, Slide):
+            return
+        query = slide.image_query
+        if query and query not in self._tasks:
+            self._tasks[query] = asyncio.create_task(ppt_utils.afetch_image(query))
+
+    async def wait(self):
+        """Waits for the fetches started so far; failures are left to the render's own fetch."""
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def close(self):
+        """Cancels fetches that are still running."""
+        for task in self._tasks.values():
+            task.cancel()
@@ -1,13 +1,29 @@
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
+from pptx.enum.text import PP_ALIGN
+from pptx.enum.shapes import PP_PLACEHOLDER
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.oxml.shapes.autoshape import CT_Shape
+from pptx.parts.image import ImagePart
+from PIL import Image, ImageOps
 import os
-import requests
-from io import BytesIO
+import math
+import hashlib
+import time
+import asyncio
+import threading
+import tempfile
+import contextvars
 import concurrent.futures
-import urllib.parse
+from io import BytesIO
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
+import metrics
+from metrics import log
+from deck import as_deck
 
 # --- Constants & Theme ---
 THEME_FONT = "Calibri" 
@@ -29,188 +45,535 @@ MARGIN_LEFT = Inches(1)
 MARGIN_RIGHT = Inches(1)
 MARGIN_TOP = Inches(0.5) # For Title
 MARGIN_BOTTOM = Inches(0.5)
+TITLE_HEIGHT = Inches(1.3)
+FOOTER_SPACE = Inches(0.5)
+
+# Body paragraph styles per bullet level: (font size, space before, space after)
+# Levels deeper than 2 use the level 2 style.
+BODY_LEVEL_STYLES = {
+    0: (BODY_SIZE_L0, Pt(12), Pt(6)),
+    1: (BODY_SIZE_L1, Pt(6), Pt(6)),
+    2: (BODY_SIZE_L2, Pt(4), Pt(4)),
+}
+
+# --- Image Embedding ---
+# Pictures are downscaled to this resolution at their on-slide size (0 embeds images as fetched)
+IMAGE_EMBED_DPI = int(os.getenv("IMAGE_EMBED_DPI", "150"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "82"))
+IMAGE_GAP = Inches(0.3)             # Between the body text and the picture
+# Prepared images kept for reuse, by total size, so the cache costs the same however many slides a deck has
+PREPARED_IMAGE_CACHE_BYTES = int(os.getenv("PREPARED_IMAGE_CACHE_MB", "8")) * 1024 * 1024
+
+# --- Large Decks ---
+# Decks with more slides are rendered a chunk at a time (see add_slides)
+RENDER_CHUNK_SLIDES = int(os.getenv("RENDER_CHUNK_SLIDES", "20"))
+
+# --- Text Fit Measurement ---
+# Predicts how tall the body text will render, so only slides that really overflow get refined.
+
+# Advance widths in 1/1000 em, from the fonts' hmtx tables (ASCII only; anything else uses the default).
+GLYPH_WIDTHS = {
+    "Calibri": {
+        "default": 500,
+        " ": 226, "!": 326, '"': 401, "#": 498, "$": 507, "%": 715, "&": 682, "'": 221,
+        "(": 303, ")": 303, "*": 498, "+": 498, ",": 250, "-": 306, ".": 252, "/": 386,
+        "0": 507, "1": 507, "2": 507, "3": 507, "4": 507, "5": 507, "6": 507, "7": 507, "8": 507, "9": 507,
+        ":": 268, ";": 268, "<": 498, "=": 498, ">": 498, "?": 463, "@": 894,
+        "A": 579, "B": 544, "C": 533, "D": 615, "E": 488, "F": 459, "G": 631, "H": 623, "I": 252,
+        "J": 319, "K": 520, "L": 420, "M": 855, "N": 646, "O": 662, "P": 517, "Q": 673, "R": 543,
+        "S": 459, "T": 487, "U": 642, "V": 567, "W": 890, "X": 519, "Y": 487, "Z": 468,
+        "[": 305, "\\": 386, "]": 305, "^": 498, "_": 498, "`": 291,
+        "a": 479, "b": 525, "c": 423, "d": 525, "e": 498, "f": 305, "g": 471, "h": 525, "i": 229,
+        "j": 239, "k": 455, "l": 229, "m": 799, "n": 525, "o": 527, "p": 525, "q": 525, "r": 349,
+        "s": 391, "t": 335, "u": 525, "v": 452, "w": 715, "x": 433, "y": 453, "z": 395,
+        "{": 314, "|": 460, "}": 314, "~": 498,
+    },
+}
+LINE_HEIGHT_EM = 1.22                 # Calibri ascent + descent at single spacing
+BODY_INSET_X = Inches(0.1)            # Default left/right text frame insets
+BODY_INSET_Y = Inches(0.05)           # Default top/bottom text frame insets
+# Bullet left margins (marL) per level in the default master's body style
+BODY_LEVEL_INDENTS = [342900, 742950, 1143000, 1600200, 2057400]
+# tf.clear() leaves an empty first paragraph, styled like a level 0 bullet by the compiled theme
+LEADING_PARAGRAPH_HEIGHT = sum(BODY_LEVEL_STYLES[0][1:]) + BODY_LEVEL_STYLES[0][0] * LINE_HEIGHT_EM
+
+def body_box(use_image_layout):
+    """Returns (left, top, width, height) in EMU of the body placeholder on a content slide."""
+    left = MARGIN_LEFT
+    top = MARGIN_TOP + TITLE_HEIGHT + Inches(0.2) # Below title
+    if use_image_layout:
+        # Half width (adjust slightly to leave gap)
+        width = int((SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT) / 2)
+    else:
+        width = SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+    height = SLIDE_HEIGHT - top - MARGIN_BOTTOM - FOOTER_SPACE # Space for footer
+    return left, top, width, height
+
+def image_box():
+    """Returns (left, top, width, height) in EMU of the picture area on an image-layout slide."""
+    left, top, width, height = body_box(True)
+    return left + width + IMAGE_GAP, top, width - IMAGE_GAP, height
+
+@lru_cache(maxsize=65536)
+def text_width(text, font=THEME_FONT):
+    """Width of `text` in 1/1000 em."""
+    widths = GLYPH_WIDTHS.get(font, GLYPH_WIDTHS["Calibri"])
+    default = widths["default"]
+    return sum(widths.get(ch, default) for ch in text)
+
+def wrapped_line_count(text, font_size, available_width, font=THEME_FONT):
+    """Number of lines `text` wraps to in a box `available_width` EMU wide (greedy word wrap)."""
+    # EMU per 1/1000 em at this size
+    scale = font_size / 1000
+    space = text_width(" ", font) * scale
+    lines = 1
+    line_width = 0
+    for word in text.split():
+        word_width = text_width(word, font) * scale
+        if word_width > available_width:
+            # A word longer than the line is broken across lines
+            if line_width:
+                lines += 1
+            extra = math.ceil(word_width / available_width) - 1
+            lines += extra
+            line_width = word_width - extra * available_width
+        elif line_width and line_width + space + word_width > available_width:
+            lines += 1
+            line_width = word_width
+        else:
+            line_width += (space if line_width else 0) + word_width
+    return lines
+
+def measure_body_height(content, use_image_layout):
+    """Predicted rendered height in EMU of the body text for a sequence of deck.BulletItem."""
+    _, _, width, _ = body_box(use_image_layout)
+    height = 2 * BODY_INSET_Y + LEADING_PARAGRAPH_HEIGHT
+    for item in content:
+        level = item.level
+        size, space_before, space_after = BODY_LEVEL_STYLES[min(level, 2)]
+        indent = BODY_LEVEL_INDENTS[min(level, len(BODY_LEVEL_INDENTS) - 1)]
+        available = width - 2 * BODY_INSET_X - indent
+        lines = wrapped_line_count(item.text, size, available)
+        height += space_before + lines * size * LINE_HEIGHT_EM + space_after
+    return int(height)
+
+def body_fill_ratio(slide, use_image_layout):
+    """Predicted body text height of a deck.Slide as a fraction of the body placeholder height (> 1 overflows)."""
+    _, _, _, box_height = body_box(use_image_layout)
+    return measure_body_height(slide.content, use_image_layout) / box_height
+
+def slide_overflows(slide, use_image_layout):
+    return body_fill_ratio(slide, use_image_layout) > 1
 
 def fetch_image(query):
     """
-    Fetches an image stream for a given query.
-    Returns BytesIO object or None.
+    Fetches an image for a given query through the shared image cache.
+    Returns the path of the cached image file or None.
+    """
+    # Deferred: image_cache pulls in requests and scans the cache directory on import
+    import image_cache
+
+    with metrics.timed(metrics.IMAGE_FETCH_SECONDS):
+        return image_cache.fetcher.fetch_path(query)
+
+def fetch_slide_image(query):
+    """
+    Fetches the image for `query` and prepares it for embedding (see prepare_image).
+    Meant for the fetch worker threads, so decoding and re-encoding never block rendering.
+    Returns image bytes or None.
     """
-    if not query:
+    return load_slide_image(query, fetch_image(query))
+
+def load_slide_image(query, path):
+    """Reads a fetched image file and prepares it for embedding. Returns image bytes or None."""
+    if not path:
         return None
-        
     try:
-        safe_query = urllib.parse.quote(query)
-        # Higher resolution placeholder
-        image_url = f"https://placehold.co/800x600?text={safe_query}"
-        
-        response = requests.get(image_url, timeout=5)
-        if response.status_code == 200:
-            return BytesIO(response.content)
-    except Exception as e:
-        print(f"Error fetching image for '{query}': {e}")
-    
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        log(f"Could not read cached image for '{query}': {e}")
+        return None
+    with metrics.timed(metrics.IMAGE_PREPARE_SECONDS):
+        return prepare_image(data)
+
+async def afetch_image(query):
+    """fetch_image() for coroutines, over the fetcher's async client."""
+    import image_cache
+
+    with metrics.timed(metrics.IMAGE_FETCH_SECONDS):
+        return await image_cache.fetcher.afetch_path(query)
+
+async def afetch_slide_image(query):
+    """fetch_slide_image() for coroutines: the download is awaited; reading and preparing run on a worker thread."""
+    path = await afetch_image(query)
+    if not path:
+        return None
+    return await asyncio.to_thread(load_slide_image, query, path)
+
+# --- Image Preprocessing ---
+# Prepared bytes by (source SHA-1, pixel size, quality); repeated images are encoded once per process
+_prepared_images = OrderedDict()
+_prepared_bytes = 0
+_prepared_lock = threading.Lock()
+
+def prepare_image(data, box=None, dpi=IMAGE_EMBED_DPI, quality=IMAGE_JPEG_QUALITY):
+    """
+    Returns image bytes ready to embed in a box of `box` = (width, height) EMU, image_box() by default:
+    center-cropped to the box's aspect ratio, downscaled to `dpi` (never upscaled) and re-encoded as
+    JPEG, or optimized PNG if the image has transparency.
+    Identical inputs give identical bytes, which python-pptx stores as a single media part.
+    Returns None if `data` is not a readable image.
+    """
+    if dpi <= 0:
+        return data
+    if box is None:
+        _, _, width, height = image_box()
+    else:
+        width, height = box
+    size = (round(width / Inches(1) * dpi), round(height / Inches(1) * dpi))
+
+    key = (hashlib.sha1(data).digest(), size, quality)
+    with _prepared_lock:
+        if key in _prepared_images:
+            _prepared_images.move_to_end(key)
+            return _prepared_images[key]
+
+    prepared = _encode_image(data, size, quality)
+    if prepared is not None:
+        global _prepared_bytes
+        with _prepared_lock:
+            if key not in _prepared_images:
+                _prepared_images[key] = prepared
+                _prepared_bytes += len(prepared)
+            while _prepared_bytes > PREPARED_IMAGE_CACHE_BYTES:
+                _prepared_bytes -= len(_prepared_images.popitem(last=False)[1])
+    return prepared
+
+def _encode_image(data, size, quality):
+    try:
+        with Image.open(BytesIO(data)) as source:
+            img = ImageOps.exif_transpose(source)
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+
+            # Largest crop with the box's aspect ratio, scaled down to the target size if it is bigger
+            ratio = size[0] / size[1]
+            crop_width, crop_height = min(img.width, round(img.height * ratio)), min(img.height, round(img.width / ratio))
+            scale = min(1, size[0] / crop_width)
+            target = (max(1, round(crop_width * scale)), max(1, round(crop_height * scale)))
+            unchanged = target == img.size and source.format in ("JPEG", "PNG")
+            img = ImageOps.fit(img, target, Image.LANCZOS)
+
+            buffer = BytesIO()
+            if has_alpha:
+                img.convert("RGBA").save(buffer, "PNG", optimize=True)
+            else:
+                img.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        log(f"Could not prepare image: {e}")
+        return None
+
+    prepared = buffer.getvalue()
+    # Already small enough and the right shape: re-encoding would only add size or artifacts
+    if unchanged and len(data) <= len(prepared):
+        return data
+    return prepared
+
+def fetch_slide_images(slides, indices=None):
+    """
+    Fetches and prepares an image for every slide with a query (or only the slides in `indices`), in parallel.
+    Returns {slide index: image bytes}.
+    """
+    indices = range(len(slides)) if indices is None else sorted(indices)
+    log(f"Fetching images for {len(indices)} slides in parallel...")
+    image_map = {}
+    with metrics.timed(metrics.RENDER_SECONDS, phase="images"), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        future_to_index = {}
+        for i in indices:
+            query = slides[i].image_query
+            # Only fetch if we have a query
+            if query:
+                # Each task gets its own copy of the context so logs keep the request's trace id
+                future = executor.submit(contextvars.copy_context().run, fetch_slide_image, query)
+                future_to_index[future] = i
+
+        for future in concurrent.futures.as_completed(future_to_index):
+            idx = future_to_index[future]
+            try:
+                image = future.result()
+                if image:
+                    image_map[idx] = image
+            except Exception as exc:
+                log(f"Image fetch generated an exception for slide {idx}: {exc}")
+    return image_map
+
+async def afetch_slide_images(slides, indices=None):
+    """fetch_slide_images() for coroutines: every fetch runs concurrently on the event loop."""
+    indices = range(len(slides)) if indices is None else sorted(indices)
+    indices = [i for i in indices if slides[i].image_query]
+    log(f"Fetching images for {len(indices)} slides concurrently...")
+    with metrics.timed(metrics.RENDER_SECONDS, phase="images"):
+        results = await asyncio.gather(*(afetch_slide_image(slides[i].image_query) for i in indices),
+                                       return_exceptions=True)
+
+    image_map = {}
+    for idx, image in zip(indices, results):
+        if isinstance(image, Exception):
+            log(f"Image fetch generated an exception for slide {idx}: {image}")
+        elif image:
+            image_map[idx] = image
+    return image_map
+
+# --- Theme Compiler ---
+# Fonts, sizes, colors and spacing are written once into the master and layout text styles,
+# so slides only carry text and bullet level.
+
+def _level_style(lst_style, level):
+    """Returns the <a:lvlNpPr> for a 0-based level in a list style, creating it if needed."""
+    tag = qn(f"a:lvl{level + 1}pPr")
+    pPr = lst_style.find(tag)
+    if pPr is None:
+        pPr = lst_style.makeelement(tag, {})
+        lst_style.insert(level, pPr)
+    return pPr
+
+def _style_paragraph(pPr, size=None, color=None, bold=None, align=None, space_before=None, space_after=None):
+    """Writes paragraph and run defaults into an <a:lvlNpPr>, keeping the schema's child order."""
+    if align:
+        pPr.set("algn", align)
+
+    # <a:spcBef> then <a:spcAft> lead the element (no <a:lnSpc> is used)
+    for tag, value in (("a:spcBef", space_before), ("a:spcAft", space_after)):
+        if value is None:
+            continue
+        existing = pPr.find(qn(tag))
+        if existing is not None:
+            pPr.remove(existing)
+        spacing = parse_xml(
+            f'<{tag} xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+            f'<a:spcPts val="{int(value.pt * 100)}"/></{tag}>'
+        )
+        before = pPr.find(qn("a:spcBef"))
+        if tag == "a:spcAft" and before is not None:
+            before.addnext(spacing)
+        else:
+            pPr.insert(0, spacing)
+
+    defRPr = pPr.find(qn("a:defRPr"))
+    if defRPr is None:
+        defRPr = pPr.makeelement(qn("a:defRPr"), {})
+        ext = pPr.find(qn("a:extLst"))
+        if ext is not None:
+            ext.addprevious(defRPr)
+        else:
+            pPr.append(defRPr)
+    if size is not None:
+        defRPr.set("sz", str(int(size.pt * 100)))
+    if bold is not None:
+        defRPr.set("b", "1" if bold else "0")
+    if color is not None:
+        existing = defRPr.find(qn("a:solidFill"))
+        if existing is not None:
+            defRPr.remove(existing)
+        defRPr.insert(0, parse_xml(
+            '<a:solidFill xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+            f'<a:srgbClr val="{color}"/></a:solidFill>'
+        ))
+    latin = defRPr.find(qn("a:latin"))
+    if latin is None:
+        latin = defRPr.makeelement(qn("a:latin"), {})
+        fill = defRPr.find(qn("a:solidFill"))
+        if fill is not None:
+            fill.addnext(latin)
+        else:
+            defRPr.insert(0, latin)
+    latin.set("typeface", THEME_FONT)
+
+def _placeholder_text_body(layout, ph_type):
+    for sp in layout.placeholders:
+        if sp.element.ph_type == ph_type:
+            return sp.element.txBody
     return None
 
-def apply_slide_footer(slide, slide_number, presentation_title):
-    """Adds a footer with date, title, and slide number."""
-    # Date
-    date_str = datetime.now().strftime("%B %d, %Y")
-    
-    # We can use the slide master placeholders if available, but for robustness
-    # we'll add text boxes to the bottom.
-    
-    # 1. Slide Number (Bottom Right)
-    width = Inches(1)
+def compile_theme(prs):
+    """Compiles THEME_FONT, the COLOR_* constants and the heading/body sizes into the master and layouts."""
+    tx_styles = prs.slide_master.element.find(qn("p:txStyles"))
+
+    # Slide headings: bold, left aligned, primary color
+    title_style = tx_styles.find(qn("p:titleStyle"))
+    _style_paragraph(_level_style(title_style, 0), size=SLIDE_HEADING_SIZE, color=COLOR_PRIMARY, bold=True, align="l")
+
+    # Body bullets per level; levels deeper than 2 share the level 2 style
+    body_style = tx_styles.find(qn("p:bodyStyle"))
+    for level in range(9):
+        size, space_before, space_after = BODY_LEVEL_STYLES[min(level, 2)]
+        _style_paragraph(
+            _level_style(body_style, level), size=size, bold=False, align="l",
+            color=COLOR_TEXT_MAIN if level == 0 else COLOR_TEXT_LIGHT,
+            space_before=space_before, space_after=space_after
+        )
+
+    # Content layouts: headings sit on the bottom of the title box
+    for layout_index in (1, 3):
+        txBody = _placeholder_text_body(prs.slide_layouts[layout_index], PP_PLACEHOLDER.TITLE)
+        txBody.find(qn("a:bodyPr")).set("anchor", "b")
+
+    # Title slide: large centered title, accent-colored subtitle
+    title_layout = prs.slide_layouts[0]
+    txBody = _placeholder_text_body(title_layout, PP_PLACEHOLDER.CENTER_TITLE)
+    _style_paragraph(_level_style(txBody.find(qn("a:lstStyle")), 0), size=TITLE_SIZE, align="ctr")
+    txBody = _placeholder_text_body(title_layout, PP_PLACEHOLDER.SUBTITLE)
+    _style_paragraph(_level_style(txBody.find(qn("a:lstStyle")), 0), size=SUBTITLE_SIZE, color=COLOR_ACCENT, align="ctr")
+
+# --- Deck Skeleton (Template Cache) ---
+# Slide size, backgrounds, placeholder geometry and footer scaffolding are identical for every deck,
+# so they are built once and each render loads a copy from the cached bytes.
+
+FOOTER_SHAPE_NAME = "Deck Footer"
+_skeleton_bytes = None
+_skeleton_lock = threading.Lock()
+
+def _add_master_textbox(master, name, left, top, width, height):
+    """MasterShapes has no add_textbox, so the <p:sp> is built directly."""
+    shapes = master.shapes
+    shapes._spTree.append(CT_Shape.new_textbox_sp(shapes._next_shape_id, name, left, top, width, height))
+    return shapes[-1]
+
+def _add_footer_scaffolding(master):
+    """Adds the footer (title | date) and slide number text boxes to the slide master."""
     height = Inches(0.5)
-    left = Inches(13.333) - width - Inches(0.2) # Assuming 16:9 aspect ratio standard (13.333 inches wide)
-    top = Inches(7.5) - height # Assuming 7.5 inches height
-    
-    txBox = slide.shapes.add_textbox(left, top, width, height)
-    tf = txBox.text_frame
-    p = tf.paragraphs[0]
-    p.text = str(slide_number)
+    top = SLIDE_HEIGHT - height
+
+    # 1. Slide Number (Bottom Right) - a slidenum field, so every slide shows its own number
+    width = Inches(1)
+    left = SLIDE_WIDTH - width - Inches(0.2)
+    number_box = _add_master_textbox(master, "Slide Number", left, top, width, height)
+    p = number_box.text_frame.paragraphs[0]
+    p.alignment = PP_ALIGN.RIGHT
+    p._p.append(parse_xml(
+        '<a:fld xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+        'id="{B6F15528-21DE-4FAA-801E-634DDDAF4B2B}" type="slidenum">'
+        '<a:rPr lang="en-US" sz="1200"><a:solidFill><a:srgbClr val="%s"/></a:solidFill></a:rPr>'
+        '<a:t>&#8249;#&#8250;</a:t></a:fld>' % str(COLOR_TEXT_LIGHT)
+    ))
+
+    # 2. Footer Text (Bottom Left) - Title & Date, filled in once per deck
+    footer_box = _add_master_textbox(master, FOOTER_SHAPE_NAME, MARGIN_LEFT, top, Inches(8), height)
+    p = footer_box.text_frame.paragraphs[0]
+    p.text = " "
     p.font.size = Pt(12)
     p.font.color.rgb = COLOR_TEXT_LIGHT
-    p.alignment = PP_ALIGN.RIGHT
+    p.alignment = PP_ALIGN.LEFT
 
-    # 2. Footer Text (Bottom Left) - Title & Date
-    width = Inches(8)
-    left = MARGIN_LEFT
-    
-    txBox2 = slide.shapes.add_textbox(left, top, width, height)
-    tf2 = txBox2.text_frame
-    p2 = tf2.paragraphs[0]
-    p2.text = f"{presentation_title} | {date_str}"
-    p2.font.size = Pt(12)
-    p2.font.color.rgb = COLOR_TEXT_LIGHT
-    p2.alignment = PP_ALIGN.LEFT
-
-def create_ppt(data, filename="generated_presentation.pptx", image_mode=None):
-    """
-    Creates a professional PowerPoint presentation.
-    """
+def _build_skeleton():
+    """Builds the themed base deck (no slides) and returns it as .pptx bytes."""
     prs = Presentation()
-    # Set to widescreen 16:9 if not default (pptx default is usually 4:3 or 16:9 depending on template, we assume standard)
-    prs.slide_width = Inches(13.333)
-    prs.slide_height = Inches(7.5)
-
-    presentation_title = data.get("title", "Untitled Presentation")
-
-    # --- helper: apply title formatting ---
-    def format_slide_title(shape, text):
-        shape.text = text
-        tf = shape.text_frame
-        tf.vertical_anchor = MSO_ANCHOR.BOTTOM
-        p = tf.paragraphs[0]
-        p.font.bold = True
-        p.font.size = SLIDE_HEADING_SIZE
-        p.font.name = THEME_FONT
-        p.font.color.rgb = COLOR_PRIMARY
-        p.alignment = PP_ALIGN.LEFT
-        
-        # Add a colored accent line under title (simulated with underscores or a shape if we wanted to get fancy)
-        # For now, clean text is better.
-
-    # 1. Title Slide
-    title_slide_layout = prs.slide_layouts[0]
-    slide = prs.slides.add_slide(title_slide_layout)
-    
-    # Set background color
-    background = slide.background
-    fill = background.fill
+    prs.slide_width = SLIDE_WIDTH
+    prs.slide_height = SLIDE_HEIGHT
+    # Title slide is number 0, so content slides are numbered from 1
+    prs.part._element.set("firstSlideNum", "0")
+
+    master = prs.slide_master
+    fill = master.background.fill
     fill.solid()
     fill.fore_color.rgb = COLOR_BACKGROUND
-    
-    title = slide.shapes.title
-    subtitle = slide.placeholders[1]
-
-    # Main Title Formatting
-    title.text = presentation_title
-    tf = title.text_frame
-    p = tf.paragraphs[0]
-    p.font.bold = True
-    p.font.size = TITLE_SIZE
-    p.font.name = THEME_FONT
-    p.font.color.rgb = COLOR_PRIMARY
-    p.alignment = PP_ALIGN.CENTER
-
-    subtitle.text = "Generated by Gemini AI"
-    sf = subtitle.text_frame
-    sp = sf.paragraphs[0]
-    sp.font.size = SUBTITLE_SIZE
-    sp.font.name = THEME_FONT
-    sp.font.color.rgb = COLOR_ACCENT
-    sp.alignment = PP_ALIGN.CENTER
-
-    # 2. Pre-fetch Images (Parallel)
-    # ... logic relies on having the final list of slides, so we paginate FIRST.
+    _add_footer_scaffolding(master)
+    compile_theme(prs)
 
-    # Smart pagination removed by user request.
-    # We now strictly map 1 slide from the outline to 1 slide in the PPT.
+    # The title slide does not show the footer
+    prs.slide_layouts[0]._element.set("showMasterSp", "0")
+
+    # Content layouts: title and body geometry (Layout 1 full width, Layout 3 half width + image)
+    for layout_index, use_image_layout in ((1, False), (3, True)):
+        placeholders = prs.slide_layouts[layout_index].placeholders
+        title = placeholders[0]
+        title.left, title.top = MARGIN_LEFT, MARGIN_TOP
+        title.width, title.height = SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT, TITLE_HEIGHT
+        body = placeholders[1]
+        body.left, body.top, body.width, body.height = body_box(use_image_layout)
+    # Layout 3's right-hand placeholder marks where the picture goes
+    picture = prs.slide_layouts[3].placeholders[2]
+    picture.left, picture.top, picture.width, picture.height = image_box()
+
+    buffer = BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+def skeleton_bytes():
+    """Returns the cached deck skeleton, building it on first use."""
+    global _skeleton_bytes
+    if _skeleton_bytes is None:
+        with _skeleton_lock:
+            if _skeleton_bytes is None:
+                _skeleton_bytes = _build_skeleton()
+    return _skeleton_bytes
+
+def new_presentation(presentation_title):
+    """Loads a fresh copy of the skeleton and fills in this deck's footer text."""
+    prs = Presentation(BytesIO(skeleton_bytes()))
+    date_str = datetime.now().strftime("%B %d, %Y")
+    for shape in prs.slide_master.shapes:
+        if shape.name == FOOTER_SHAPE_NAME:
+            shape.text_frame.paragraphs[0].runs[0].text = f"{presentation_title} | {date_str}"
+    return prs
+
+class DeckBuilder:
+    """
+    Builds one deck slide by slide, in any order.
+    Content slides are keyed by their index in the outline and put back in that order by save();
+    adding an index twice replaces the earlier slide, and images can be attached whenever they arrive.
+    """
+
+    def __init__(self, presentation_title, image_mode=None, source=None):
+        """`source` (a path or file object) continues a deck made by create_ppt instead of starting a new one."""
+        self.image_mode = image_mode
+        self.use_image_layout = image_mode in ['manual', 'auto']
+        self._slides = {}   # index -> (slide, sldId element)
+        self._new_images = []   # image parts added since the last spill_images()
+        self._spill_dir = None
+
+        if source is not None:
+            # Title slide first, then content slides in index order, as save() leaves them
+            self.prs = Presentation(source)
+            slides = list(zip(self.prs.slides, self.prs.slides._sldIdLst))[1:]
+            self._slides = dict(enumerate(slides))
+            return
+
+        # Widescreen 16:9 skeleton with background and footer already in place
+        self.prs = new_presentation(presentation_title)
+
+        # 1. Title Slide
+        title_slide_layout = self.prs.slide_layouts[0]
+        slide = self.prs.slides.add_slide(title_slide_layout)
+
+        # Typography comes from the compiled theme (see compile_theme)
+        slide.shapes.title.text = presentation_title
+        slide.placeholders[1].text = "Generated by Gemini AI"
+
+    def __contains__(self, index):
+        return index in self._slides
+
+    def add_slide(self, index, slide_data):
+        """Adds (or replaces) the content slide at position `index` from a deck.Slide."""
+        if index in self._slides:
+            self.remove_slide(index)
 
-    # 3. Process Slides (Fetch Only)
-    
-    # Use slides directly without pagination
-    final_slides_data = data.get("slides", [])
-    
-    image_map = {}
-    
-    if image_mode == 'auto':
-        print(f"Fetching images for {len(final_slides_data)} slides in parallel...")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # Prepare queries
-            future_to_index = {}
-            for i, slide_data in enumerate(final_slides_data):
-                query = slide_data.get("image_search_query", slide_data.get("heading", ""))
-                # Only fetch if we have a query
-                if query:
-                     future = executor.submit(fetch_image, query)
-                     future_to_index[future] = i
-            
-            for future in concurrent.futures.as_completed(future_to_index):
-                idx = future_to_index[future]
-                try:
-                    image_stream = future.result()
-                    if image_stream:
-                        image_map[idx] = image_stream
-                except Exception as exc:
-                    print(f"Image fetch generated an exception for slide {idx}: {exc}")
-
-    # 4. Content Slides Generation
-    for i, slide_data in enumerate(final_slides_data):
-        
-        use_image_layout = image_mode in ['manual', 'auto']
-        
         # Use appropriate layouts. 
         # Layout 1 is "Title and Content"
         # Layout 3 is "Two Content" (Side by side)
-        if use_image_layout:
-             slide_layout = prs.slide_layouts[3] 
+        if self.use_image_layout:
+             slide_layout = self.prs.slide_layouts[3] 
         else:
-             slide_layout = prs.slide_layouts[1] 
-
-        slide = prs.slides.add_slide(slide_layout)
-        
-        # Apply standard background
-        background = slide.background
-        fill = background.fill
-        fill.solid()
-        fill.fore_color.rgb = COLOR_BACKGROUND
+             slide_layout = self.prs.slide_layouts[1] 
 
+        # Background, footer and placeholder geometry come from the skeleton's master and layouts
+        slide = self.prs.slides.add_slide(slide_layout)
         shapes = slide.shapes
+        self._slides[index] = (slide, self.prs.slides._sldIdLst[-1])
 
         # Title
-        title_shape = shapes.title
-        format_slide_title(title_shape, slide_data.get("heading", "No Title"))
-        
-        # Enforce Title Alignment & Size
-        title_shape.left = MARGIN_LEFT
-        title_shape.top = MARGIN_TOP
-        title_shape.width = SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
-        title_shape.height = Inches(1.3)
-
-        # Footer
-        apply_slide_footer(slide, i + 1, presentation_title)
+        shapes.title.text = slide_data.heading or "No Title"
 
         # Body (Bullet points)
         # In Layout 3 (Two Content), placeholder[1] is Left, [2] is Right.
@@ -218,76 +581,165 @@ def create_ppt(data, filename="generated_presentation.pptx", image_mode=None):
         
         body_shape = shapes.placeholders[1]
         
-        # Enforce Body Alignment & Size
-        body_shape.left = MARGIN_LEFT
-        body_shape.top = MARGIN_TOP + Inches(1.3) + Inches(0.2) # Below title
-        
-        if use_image_layout:
-             # Half width (adjust slightly to leave gap)
-             body_shape.width = int((SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT) / 2)
-        else:
-             # Full width
-             body_shape.width = SLIDE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
-             
-        body_shape.height = SLIDE_HEIGHT - body_shape.top - MARGIN_BOTTOM - Inches(0.5) # Space for footer
-        
         tf = body_shape.text_frame
         tf.clear() 
-        tf.word_wrap = True
-
-        # Content 
-        content = slide_data.get("content", [])
-        if not content and "bullet_points" in slide_data:
-            content = [{"text": bp, "level": 0} for bp in slide_data["bullet_points"]]
-
-        if content:
-            for item in content:
-                text = item.get("text", "")
-                level = item.get("level", 0)
-                
-                p = tf.add_paragraph()
-                p.text = text
-                p.level = level
-                p.font.name = THEME_FONT
-                p.alignment = PP_ALIGN.LEFT
-                
-                # Pro Typography & Hierarchy
-                if level == 0:
-                    p.font.size = BODY_SIZE_L0 
-                    p.font.bold = False 
-                    p.font.color.rgb = COLOR_TEXT_MAIN
-                    p.space_before = Pt(12) 
-                    p.space_after = Pt(6)
-                elif level == 1:
-                    p.font.size = BODY_SIZE_L1
-                    p.font.color.rgb = COLOR_TEXT_LIGHT
-                    p.space_before = Pt(6)
-                    p.space_after = Pt(6)
-                else:
-                    p.font.size = BODY_SIZE_L2
-                    p.font.color.rgb = COLOR_TEXT_LIGHT
-                    p.space_before = Pt(4)
-                    p.space_after = Pt(4)
-
-        # Image Handling
-        # If Two Content layout, image goes to placeholder[2]
-        if use_image_layout and image_mode == 'auto':
+
+        # Content: text and level only, typography comes from the master's body style
+        for item in slide_data.content:
+            p = tf.add_paragraph()
+            p.text = item.text
+            p.level = item.level
+
+    def remove_slide(self, index):
+        slide, sld_id = self._slides.pop(index)
+        self.prs.part.drop_rel(sld_id.rId)
+        self.prs.slides._sldIdLst.remove(sld_id)
+
+    def add_image(self, index, image):
+        """Puts an image (path or bytes, ideally from prepare_image) into the picture area of slide `index`."""
+        if not (self.use_image_layout and self.image_mode == 'auto') or index not in self._slides:
+            return
+        slide = self._slides[index][0]
+        left, top, width, height = image_box()
+        try:
+            picture = slide.shapes.add_picture(BytesIO(image) if isinstance(image, bytes) else image,
+                                               left, top, width, height)
+            _crop_to_fill(picture, width, height)
+        except Exception as e:
+            log(f"Error inserting image for slide {index}: {e}")
+            return
+        self._new_images.append(slide.part.related_part(picture._element.blip_rId))
+
+        # The picture takes the place of the layout's empty right-hand content placeholder
+        for placeholder in slide.placeholders:
+            if placeholder.placeholder_format.idx == 2:
+                placeholder._element.getparent().remove(placeholder._element)
+
+    def spill_images(self):
+        """
+        Moves the bytes of the pictures added since the last call to temporary files, which save() reads
+        back one at a time. python-pptx otherwise keeps every embedded image in memory until the deck is saved.
+        The files go when the builder does.
+        """
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.TemporaryDirectory(prefix="deck_media_")
+        for part in self._new_images:
+            if isinstance(part, _SpilledImagePart):
+                continue  # A repeated image shares the part spilled with its first use
+            part.sha1  # Cached now: python-pptx matches repeated images by it without reading the file
+            path = os.path.join(self._spill_dir.name, part.partname.filename)
+            with open(path, "wb") as f:
+                f.write(part.blob)
+            del part.__dict__["_blob"]
+            part._path = path
+            part.__class__ = _SpilledImagePart
+        self._new_images = []
+
+    def save(self, filename="generated_presentation.pptx", output=None):
+        """Orders the content slides by index and saves. Returns the absolute path, or `output` itself."""
+        sld_id_lst = self.prs.slides._sldIdLst
+        for index in sorted(self._slides):
+            # Re-appending moves the element, so the title slide stays first
+            sld_id_lst.append(self._slides[index][1])
+        # add_slide() names parts by slide count, which collides once a slide has been replaced
+        self.prs.part.rename_slide_parts([sld_id.rId for sld_id in sld_id_lst])
+
+        with metrics.timed(metrics.RENDER_SECONDS, phase="save"):
+            if output is not None:
+                self.prs.save(output)
+                return output
+
+            # Ensure output directory exists
+            output_path = os.path.abspath(filename)
+            self.prs.save(output_path)
+            return output_path
+
+class _SpilledImagePart(ImagePart):
+    """An image part whose bytes are in a file (see DeckBuilder.spill_images), read whenever python-pptx asks for them."""
+
+    @property
+    def _blob(self):
+        with open(self._path, "rb") as f:
+            return f.read()
+
+def _crop_to_fill(picture, width, height):
+    """Center-crops `picture` so it fills width x height without stretching."""
+    image_width, image_height = picture.image.size
+    excess = 1 - (width / height) / (image_width / image_height)
+    if excess > 0:
+        picture.crop_left = picture.crop_right = excess / 2
+    elif excess < 0:
+        excess = 1 - (image_width / image_height) / (width / height)
+        picture.crop_top = picture.crop_bottom = excess / 2
+
+def create_ppt(data, filename="generated_presentation.pptx", image_mode=None, output=None, images=None):
+    """
+    Creates a professional PowerPoint presentation from a deck.Deck (or its JSON form).
+    Saves to `filename`, or into the writable binary buffer `output` if one is given.
+    `images` optionally maps slide index -> image path or bytes fetched by the caller (see
+    fetch_slide_image); in auto mode they are fetched here when it is None.
+    Returns the absolute output path, or `output` itself.
+    """
+    render_start = time.perf_counter()
+    data = as_deck(data)
+    deck = DeckBuilder(data.title, image_mode)
+
+    # Smart pagination removed by user request.
+    # We now strictly map 1 slide from the outline to 1 slide in the PPT.
+    final_slides_data = data.slides
+
+    # 2. Content Slides Generation, with their images fetched in parallel
+    images_seconds = add_slides(deck, final_slides_data, range(len(final_slides_data)), image_mode, images)
+
+    metrics.RENDER_SECONDS.observe(time.perf_counter() - render_start - images_seconds, phase="slides")
+    return deck.save(filename, output)
+
+def add_slides(deck, slides, indices, image_mode=None, images=None):
+    """
+    Adds the slides at `indices` to a DeckBuilder with their images, from `images` or fetched here in auto mode.
+    More than RENDER_CHUNK_SLIDES slides are added a chunk at a time: a chunk's images are fetched, embedded
+    and spilled to disk (see DeckBuilder.spill_images) before the next chunk's are fetched, so memory holds
+    one chunk of images however long the deck is. Returns the seconds spent fetching images.
+    """
+    indices = list(indices)
+    chunked = len(indices) > RENDER_CHUNK_SLIDES
+    images_seconds = 0
+    for start in range(0, len(indices), RENDER_CHUNK_SLIDES):
+        chunk = indices[start:start + RENDER_CHUNK_SLIDES]
+        image_map = images if images is not None else {}
+        if image_mode == 'auto' and images is None:
+            images_start = time.perf_counter()
+            image_map = fetch_slide_images(slides, indices=chunk)
+            images_seconds += time.perf_counter() - images_start
+
+        for i in chunk:
+            deck.add_slide(i, slides[i])
             if i in image_map:
-                try:
-                    if len(shapes.placeholders) > 2:
-                        image_placeholder = shapes.placeholders[2]
-                        image_stream = image_map[i]
-                        image_stream.seek(0)
-                        
-                        image_placeholder.insert_picture(image_stream)
-                        # Crop logic could be added here if needed, but insert_picture usually fits well.
-                        
-                except Exception as e:
-                    print(f"Error inserting image for slide {i}: {e}")
-            elif len(shapes.placeholders) > 2:
-                 pass # Empty placeholder remains
-
-    # Ensure output directory exists
-    output_path = os.path.abspath(filename)
-    prs.save(output_path)
-    return output_path
+                deck.add_image(i, image_map[i])
+        if chunked:
+            deck.spill_images()
+        # The chunk's images are in the deck now; let go of the fetched bytes before the next chunk
+        del image_map
+    return images_seconds
+
+def update_ppt(source, data, changed, filename="generated_presentation.pptx", image_mode=None, output=None, images=None):
+    """
+    Re-renders only the `changed` slide indices of a deck that create_ppt made from earlier `data`.
+    `source` is the previous .pptx (path or file object); every other slide, picture included, is kept.
+    Changed indices past the end of the previous deck are added. Saves like create_ppt.
+    """
+    render_start = time.perf_counter()
+    data = as_deck(data)
+    deck = DeckBuilder(data.title, image_mode, source=source)
+    slides_data = data.slides
+
+    images_seconds = add_slides(deck, slides_data, changed, image_mode, images)
+
+    metrics.RENDER_SECONDS.observe(time.perf_counter() - render_start - images_seconds, phase="slides")
+    return deck.save(filename, output)
+
+def render_to_bytes(data, image_mode=None, images=None):
+    """Renders a deck in memory and returns the .pptx bytes. Picklable entry point for process pools."""
+    buffer = BytesIO()
+    create_ppt(data, image_mode=image_mode, output=buffer, images=images)
+    return buffer.getvalue()
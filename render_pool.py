@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from io import BytesIO
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+import ppt_utils
+from deck import as_deck
+from metrics import log
+
+# --- Settings ---
+# "process": render in a warm pool of worker processes; "inline": render on the calling thread
+RENDER_MODE = os.getenv("RENDER_MODE", "process")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 2)))
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "120"))
+
+class RenderTimeout(Exception):
+    """Raised when a deck takes longer than the render timeout; the stuck worker is killed."""
+
+# --- Worker Entry Points ---
+# Module-level so they pickle by reference; workers only import ppt_utils and its dependencies.
+
+def _warm_worker():
+    ppt_utils.skeleton_bytes()
+    return os.getpid()
+
+def _render_worker(ppt_data, image_mode, images, path, base=None, changed=None):
+    if base is not None:
+        # Partial re-render of an earlier version (path or bytes) of the deck
+        source = BytesIO(base) if isinstance(base, bytes) else base
+        output = BytesIO() if path is None else None
+        result = ppt_utils.update_ppt(source, ppt_data, changed, filename=path, image_mode=image_mode,
+                                      output=output, images=images)
+        return output.getvalue() if path is None else result
+    if path is None:
+        return ppt_utils.render_to_bytes(ppt_data, image_mode=image_mode, images=images)
+    return ppt_utils.create_ppt(ppt_data, filename=path, image_mode=image_mode, images=images)
+
+def prefetches_images(ppt_data, image_mode, indices=None):
+    """
+    Whether load_images() fetches the slide images in this process. Not for more than RENDER_CHUNK_SLIDES slides:
+    the worker fetches those a chunk at a time (see ppt_utils.add_slides), so neither process holds every image
+    of a large deck at once.
+    """
+    return image_mode == "auto" and len(ppt_data.slides if indices is None else indices) <= ppt_utils.RENDER_CHUNK_SLIDES
+
+def load_images(ppt_data, image_mode, indices=None):
+    """Fetches and prepares slide images and returns {slide index: image bytes} for a worker, or None (see prefetches_images)."""
+    if not prefetches_images(ppt_data, image_mode, indices):
+        return None
+    return ppt_utils.fetch_slide_images(ppt_data.slides, indices=indices)
+
+async def aload_images(ppt_data, image_mode, indices=None):
+    """load_images() for coroutines: the fetches run on the event loop (see ppt_utils.afetch_slide_images)."""
+    if not prefetches_images(ppt_data, image_mode, indices):
+        return None
+    return await ppt_utils.afetch_slide_images(ppt_data.slides, indices=indices)
+
+class _Worker:
+    """One render process. Each is its own single-process pool, so a stuck render can be killed alone."""
+
+    def __init__(self):
+        # Spawned workers start clean: no threads, locks or sockets inherited from the server
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.warm = self.pool.submit(_warm_worker)
+
+    def kill(self):
+        # ProcessPoolExecutor has no public way to stop a busy worker
+        for process in list(getattr(self.pool, "_processes", {}).values()):
+            process.terminate()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class RenderExecutor:
+    """
+    Runs create_ppt in a warm pool of worker processes so rendering does not hold the server's GIL.
+    - Images are fetched and prepared in this process (network I/O, shared cache) and sent to the worker as bytes;
+      a large deck's worker fetches its own, a chunk at a time.
+    - Renders wait in one FIFO queue for an idle worker. The `timeout` starts once a worker takes the deck;
+      a render that exceeds it raises RenderTimeout, and only its worker is killed and replaced.
+    - If a worker crashes, it is replaced and that deck is rendered inline instead.
+    - arender() is the same for the async server: it never blocks the event loop.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT_SECONDS, mode=RENDER_MODE):
+        self.workers = workers
+        self.timeout = timeout
+        self.mode = mode
+        self._all = set()           # live workers, idle or busy
+        self._idle = []
+        self._waiters = deque()     # concurrent Futures of renders waiting for a worker, oldest first
+        self._lock = threading.Lock()
+
+    def start(self, wait=True):
+        """Starts the missing workers and builds the skeleton in each, so the first render is not a cold start."""
+        if self.mode != "process":
+            return
+        with self._lock:
+            new = [_Worker() for _ in range(self.workers - len(self._all))]
+            self._all.update(new)
+            workers = list(self._all)
+        for worker in new:
+            # Takes renders once warm, so no render's timeout covers the warm-up
+            worker.warm.add_done_callback(lambda _, worker=worker: self._checkin(worker))
+        if wait:
+            for worker in workers:
+                worker.warm.result()
+
+    # --- Worker Checkout ---
+    # Threads and coroutines wait in the same queue: each gets a concurrent Future that resolves to a worker.
+
+    def _checkout(self):
+        self.start(wait=False)
+        waiter = Future()
+        with self._lock:
+            if self._idle and not self._waiters:
+                waiter.set_running_or_notify_cancel()
+                waiter.set_result(self._idle.pop())
+            else:
+                self._waiters.append(waiter)
+        return waiter
+
+    async def _acheckout(self):
+        waiter = self._checkout()
+        try:
+            return await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            if not waiter.cancel():
+                # Already handed a worker; give it back
+                waiter.add_done_callback(lambda handed: self._checkin(handed.result()))
+            raise
+
+    def _checkin(self, worker):
+        with self._lock:
+            if worker not in self._all:
+                # Replaced or shut down
+                return
+            waiter = None
+            while self._waiters and waiter is None:
+                candidate = self._waiters.popleft()
+                if candidate.set_running_or_notify_cancel():
+                    waiter = candidate
+            if waiter is None:
+                self._idle.append(worker)
+                return
+        # Outside the lock: a done callback may check the worker back in
+        waiter.set_result(worker)
+
+    def _submit(self, worker, args):
+        """Starts a render on a checked-out worker; the worker is released when the render ends, however it ends."""
+        future = worker.pool.submit(_render_worker, *args)
+        future.add_done_callback(lambda done: self._release(worker, done))
+        return future
+
+    def _release(self, worker, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace(worker)
+        else:
+            self._checkin(worker)
+
+    def _replace(self, worker):
+        """Kills `worker` (unless it was already replaced) and starts warming a new one."""
+        with self._lock:
+            if worker not in self._all:
+                return
+            self._all.discard(worker)
+            if worker in self._idle:
+                self._idle.remove(worker)
+        worker.kill()
+        self.start(wait=False)
+
+    # --- Rendering ---
+
+    def render(self, ppt_data, image_mode=None, path=None, base=None, changed=None):
+        """
+        Renders a deck and returns its bytes, or writes it to `path` and returns the path.
+        With `base` (the previous version's path or bytes), only the `changed` slide indices are re-rendered.
+        `ppt_data` is a deck.Deck (or its JSON form); workers receive it pickled.
+        """
+        ppt_data = as_deck(ppt_data)
+        images = load_images(ppt_data, image_mode, None if base is None else set(changed))
+        args = (ppt_data, image_mode, images, path, base, changed)
+        if self.mode != "process":
+            return _render_worker(*args)
+
+        queued = time.perf_counter()
+        worker = self._checkout().result()
+        start = self._started(queued)
+        try:
+            result = self._submit(worker, args).result(timeout=self.timeout)
+        except FutureTimeout:
+            self._timed_out(worker)
+        except BrokenProcessPool:
+            self._crashed(worker)
+            return _render_worker(*args)
+
+        metrics.RENDER_SECONDS.observe(time.perf_counter() - start, phase="pool")
+        return result
+
+    async def arender(self, ppt_data, image_mode=None, path=None, base=None, changed=None):
+        """
+        render() for coroutines. Images are fetched on the event loop; the render itself runs in a worker
+        process (a worker thread in inline mode) and the loop only awaits it.
+        """
+        ppt_data = as_deck(ppt_data)
+        images = await aload_images(ppt_data, image_mode, None if base is None else set(changed))
+        args = (ppt_data, image_mode, images, path, base, changed)
+        if self.mode != "process":
+            return await asyncio.to_thread(_render_worker, *args)
+
+        queued = time.perf_counter()
+        worker = await self._acheckout()
+        start = self._started(queued)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(self._submit(worker, args)), self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(worker)
+        except BrokenProcessPool:
+            self._crashed(worker)
+            return await asyncio.to_thread(_render_worker, *args)
+
+        metrics.RENDER_SECONDS.observe(time.perf_counter() - start, phase="pool")
+        return result
+
+    def _started(self, queued):
+        start = time.perf_counter()
+        metrics.RENDER_SECONDS.observe(start - queued, phase="queue")
+        return start
+
+    def _timed_out(self, worker):
+        log(f"Render exceeded {self.timeout}s, replacing its render worker")
+        metrics.RENDER_POOL_FAILURES.inc(reason="timeout")
+        self._replace(worker)
+        raise RenderTimeout(f"Rendering took longer than {self.timeout} seconds")
+
+    def _crashed(self, worker):
+        log("Render worker crashed, replacing it and rendering inline")
+        metrics.RENDER_POOL_FAILURES.inc(reason="crash")
+        self._replace(worker)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._all, self._idle = self._all, set(), []
+        for worker in workers:
+            worker.pool.shutdown(wait=True)
@@ -0,0 +1,129 @@
+import json
+import agent_graph
+import structured_output
+from deck import Deck, Slide, as_deck, as_slide
+from agent_graph import GRAPH_CALLBACKS
+from metrics import log
+
+class DeckNotFound(Exception):
+    """Raised for a deck id with no finished checkpoint."""
+
+def deck_config(deck_id):
+    """Graph config for runs of the checkpointed deck graph; the deck id is the thread id."""
+    return {"configurable": {"thread_id": deck_id}, "callbacks": GRAPH_CALLBACKS}
+
+def load_deck(deck_id):
+    """The latest checkpointed state of a finished deck. Raises DeckNotFound."""
+    values = agent_graph.get_deck_graph().get_state(deck_config(deck_id)).values
+    if not values.get("final_output"):
+        raise DeckNotFound(f"Unknown deck: {deck_id}")
+    if not isinstance(values["final_output"], Deck):
+        # Checkpointed before the deck model, when the output was a JSON string and slides were dicts
+        values = {**values, "final_output": as_deck(json.loads(values["final_output"])),
+                  "slides": [as_slide(slide) for slide in values["slides"]]}
+    return values
+
+def valid_slide(index, slide):
+    """A hand-edited slide as a deck.Slide. Raises ValueError, listing the problems, if it does not match the schema."""
+    data, errors = structured_output.validate(structured_output.Slide,
+                                              slide.to_dict() if isinstance(slide, Slide) else slide)
+    if errors:
+        raise ValueError(f"Slide {index} is invalid:\n{errors}")
+    return as_slide(data)
+
+def rendered_state(history, deck_id, filename):
+    """
+    The deck's state when `filename` was recorded as its file: the oldest checkpoint in `history` (newest first)
+    with that deck_file. Later ones can hold an edit run that has not rendered its own file yet. Raises DeckNotFound.
+    """
+    values = None
+    for snapshot in history:
+        if snapshot.values.get("deck_file") == filename:
+            values = snapshot.values
+    if values is None:
+        raise DeckNotFound(f"Deck {deck_id} has no checkpoint for {filename}")
+    return values
+
+def copy_deck(source_id, filename, deck_id):
+    """
+    Copies the checkpoint of deck `source_id`, as it was when `filename` was rendered, to `deck_id`.
+    Requests served the same file (deck cache hits, shared runs) each edit their own copy. Raises DeckNotFound.
+    """
+    graph = agent_graph.get_deck_graph()
+    values = rendered_state(graph.get_state_history(deck_config(source_id)), source_id, filename)
+    graph.update_state(deck_config(deck_id), values, as_node="aggregator")
+
+def remember_file(deck_id, filename):
+    """Records the filename of the deck's latest rendering in its checkpoint."""
+    agent_graph.get_deck_graph().update_state(deck_config(deck_id), {"deck_file": filename}, as_node="aggregator")
+
+def revise_deck(deck_id, rewrite=(), replace=None, append=()):
+    """
+    Changes some slides of a checkpointed deck and reruns the graph for those slides only.
+    - rewrite: [{"index", "instructions"?}] slides to regenerate with the writer (optionally guided)
+    - replace: {index: slide} slides edited by hand (deck.Slide or its JSON form); they only go back to the LLM if they overflow.
+      They must match structured_output.Slide, and are checked before the deck is touched
+    - append: [{"heading", "instructions"?}] new slides written and added at the end
+    The writer and refiner only see these slides; every other slide is carried over unchanged.
+    Returns (previous state, new deck.Deck, indices of the slides that changed).
+    Raises DeckNotFound, or ValueError for an index outside the deck or an invalid slide.
+    """
+    replace = {index: valid_slide(index, slide) for index, slide in (replace or {}).items()}
+    state = load_deck(deck_id)
+    slides = list(state['slides'])
+    outline = list(state['outline'])
+    count = len(slides)
+
+    for index in list(replace) + [item['index'] for item in rewrite]:
+        if not 0 <= index < count:
+            raise ValueError(f"Slide index {index} is outside the deck (0-{count - 1})")
+
+    for index, slide in replace.items():
+        slides[index] = slide
+    targets = [{
+        "index": item['index'],
+        "heading": slides[item['index']].heading or outline[item['index']],
+        "instructions": item.get('instructions', ''),
+        "current": slides[item['index']]
+    } for item in rewrite]
+    for offset, item in enumerate(append):
+        outline.append(item['heading'])
+        targets.append({"index": count + offset, "heading": item['heading'],
+                        "instructions": item.get('instructions', ''), "current": None})
+
+    previous = state['final_output']
+    scope = sorted(set(replace) | {target['index'] for target in targets})
+    if not scope:
+        return state, previous, []
+
+    from langgraph.types import Overwrite
+
+    log(f"--- [Revise] Deck {deck_id}: slides {[i + 1 for i in scope]} ---")
+    result = agent_graph.get_deck_graph().invoke({
+        "slides": slides,
+        "outline": outline,
+        "scope": scope,
+        "revisions": targets,
+        "retry_count": 0,
+        # Drafts from earlier runs of this deck must not be collected again
+        "slide_drafts": Overwrite([]),
+        # Counts this run's model requests only
+        "llm_calls": Overwrite(0)
+    }, config=deck_config(deck_id))
+
+    ppt_data = result['final_output']
+    changed = [i for i, slide in enumerate(ppt_data.slides)
+               if i >= len(previous.slides) or slide != previous.slides[i]]
+    return state, ppt_data, changed
+
+async def aremember_file(deck_id, filename):
+    """remember_file() through the async deck graph."""
+    graph = await agent_graph.get_async_deck_graph()
+    await graph.aupdate_state(deck_config(deck_id), {"deck_file": filename}, as_node="aggregator")
+
+async def acopy_deck(source_id, filename, deck_id):
+    """copy_deck() through the async deck graph."""
+    graph = await agent_graph.get_async_deck_graph()
+    history = [snapshot async for snapshot in graph.aget_state_history(deck_config(source_id))]
+    values = rendered_state(history, source_id, filename)
+    await graph.aupdate_state(deck_config(deck_id), values, as_node="aggregator")
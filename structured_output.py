@@ -0,0 +1,57 @@
+import json
+from functools import lru_cache
+from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from deck import MAX_BULLET_LEVEL
+
+# --- Reply Schemas ---
+# What the planner, writers and refiner must return. They are sent to the model as its response schema
+# (JSON mode) and every reply is validated against them before it reaches the graph state.
+
+class ContentItem(BaseModel):
+    text: str = Field(min_length=1, description="One concise bullet point")
+    level: int = Field(default=0, ge=0, le=MAX_BULLET_LEVEL, description="0 for a main point, 1 for a sub-point")
+
+class Slide(BaseModel):
+    heading: str = Field(min_length=1, description="The slide title, exactly as given in the outline")
+    content: List[ContentItem] = Field(min_length=1, description="At most 5 bullet points")
+    image_search_query: Optional[str] = Field(default=None, description="2-4 words to find a relevant image")
+
+class Outline(BaseModel):
+    title: str = Field(min_length=1, description="Main presentation title")
+    outline: List[str] = Field(min_length=1, description="One title per slide, in order")
+
+class Section(BaseModel):
+    title: str = Field(min_length=1, description="Section title")
+    num_slides: int = Field(ge=1, description="Slides in this section")
+
+class SectionPlan(BaseModel):
+    title: str = Field(min_length=1, description="Main presentation title")
+    sections: List[Section] = Field(min_length=1, description="The sections, in order")
+
+class SectionOutline(BaseModel):
+    outline: List[str] = Field(min_length=1, description="One title per slide of the section, in order")
+
+@lru_cache(maxsize=None)
+def response_schema(model, many=False):
+    """JSON schema of a reply: one `model` object, or a list of them with `many`."""
+    return TypeAdapter(List[model] if many else model).json_schema()
+
+def parse(text):
+    """Parses a JSON-mode reply, which is bare JSON. Returns None if it is not."""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+def validate(model, data):
+    """
+    Validates one element of a reply.
+    Returns (plain dict, None) if it is valid, else (None, a readable list of the errors).
+    """
+    try:
+        return model.model_validate(data).model_dump(exclude_none=True), None
+    except ValidationError as e:
+        return None, "\n".join(
+            f"- {'.'.join(str(part) for part in error['loc']) or '(root)'}: {error['msg']}" for error in e.errors()
+        )